@@ -1,107 +1,356 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Blueprint, Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context, g
+from werkzeug.utils import secure_filename
+import functools
+import io
 import os
 import yaml
-from openai import OpenAI
-from llama_cpp import Llama
 import json
 import logging
-from logging.handlers import RotatingFileHandler
-from collections import deque
 import threading
 import shutil
+import time
+import hashlib
+import atexit
+import uuid
+from utils.extraction_cache import ExtractionCache
+from utils.extractors import get_file_extractor, get_segment_iterator
+from utils.segments import fan_out, recording
+from utils.retrieval import IndexCache, estimate_tokens
+from utils.corpus_index import CorpusIndex
+from utils.llm_backends import SYSTEM_PROMPT, context_window, create_backend
+from utils.answer_cache import AnswerCache
+from utils.ingestion import IngestionPipeline
+from utils.work_queue import BoundedWorkQueue, QueueFullError
+from utils.session_store import create_session_store, is_valid_session_id, new_session_id
+from utils.history import HistoryManager
+from utils.prompt_builder import PromptBuilder, PromptTooLongError
+from utils.upload_store import UploadIntegrityError, UploadNotFoundError, UploadOffsetError, UploadStore
+from utils.log_buffer import LogBuffer, MemoryHandler
+from utils.log_pipeline import request_id_var, start_logging
+from utils.metrics import MetricsRegistry, TOKEN_BUCKETS
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create a deque to store recent logs (last 1000 messages)
-log_buffer = deque(maxlen=1000)
-
-# Custom handler to store logs in memory
-class MemoryHandler(logging.Handler):
-    def __init__(self):
-        super().__init__()
-        self.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-
-    def emit(self, record):
-        log_buffer.append(self.format(record))
-
-# Create logs directory if it doesn't exist
-os.makedirs('logs', exist_ok=True)
-
-# Add file handler
-file_handler = RotatingFileHandler(
-    'logs/app.log',
-    maxBytes=10240,
-    backupCount=10,
-    mode='a',
-    encoding='utf-8'
-)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.INFO)
-logger.addHandler(file_handler)
-
-# Add memory handler
-memory_handler = MemoryHandler()
-memory_handler.setLevel(logging.INFO)
-logger.addHandler(memory_handler)
-
 # Load configuration
 try:
     with open('config.yaml', 'r') as f:
         config = yaml.safe_load(f)
-    logger.info("Configuration loaded successfully")
 except Exception as e:
     logger.error(f"Error loading configuration: {str(e)}")
     raise
 
-# Initialize Flask app
-app = Flask(__name__)
-logger.info("Flask app initialized")
+# Recent log lines for the web UI, numbered so viewers only fetch new ones
+log_buffer = LogBuffer(maxlen=1000)
+memory_handler = MemoryHandler(log_buffer)
+memory_handler.setLevel(logging.INFO)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=config['llm']['openai']['api_key'])
-logger.info("OpenAI client initialized")
+# Log records are written to logs/app.log, stderr and the buffer on a
+# background thread, so request threads never wait on file I/O
+log_listener = start_logging(config.get('logging') or {}, extra_handlers=[memory_handler])
+atexit.register(log_listener.stop)
+logger.info("Configuration loaded successfully")
 
-# Initialize Llama if configured
-llama_model = None
-if config['llm']['backend'] == 'llama':
-    try:
-        llama_model = Llama(
-            model_path=config['llm']['llama']['model_path'],
-            n_ctx=config['llm']['llama']['context_size'],
-            n_gpu_layers=0 if config['llm']['llama']['device'] == 'cpu' else -1
-        )
-        logger.info(f"Llama model initialized with device: {config['llm']['llama']['device']}")
-    except Exception as e:
-        logger.error(f"Error initializing Llama model: {str(e)}")
-        raise
+# Routes and request hooks; create_app() registers them on a Flask app
+routes = Blueprint('routes', __name__)
+
+# The configured LLM backend is only imported and constructed on first use,
+# or in the background by the warm-up that create_app() starts
+try:
+    llm_backend = create_backend(config['llm'], lazy=True)
+    logger.info(f"LLM backend configured: {llm_backend.name}")
+except Exception as e:
+    logger.error(f"Error initializing LLM backend: {str(e)}")
+    raise
+
+# Bound how many questions reach the backend at once and how many may wait
+queue_config = config['llm'].get('queue', {})
+backend_config = config['llm'].get(llm_backend.name) or {}
+llm_queue = BoundedWorkQueue(
+    llm_backend.name,
+    max_concurrency=backend_config.get('max_concurrency', llm_backend.default_concurrency),
+    max_queue_depth=queue_config.get('max_queue_depth', 16),
+    timeout=queue_config.get('timeout', 30)
+)
+
+# Per-stage timings and counters, exposed at /metrics in the Prometheus text format
+metrics = MetricsRegistry(prefix='fileqa_')
+request_seconds = metrics.histogram(
+    'http_request_duration_seconds', "Time until the response is returned (headers, for streams)",
+    ('method', 'route', 'status')
+)
+stage_seconds = metrics.histogram(
+    'ask_stage_duration_seconds',
+    "Time spent in each stage of answering a question: ingestion_wait, context, prompt, queue_wait, generate",
+    ('stage',)
+)
+ingest_seconds = metrics.histogram(
+    'ingest_stage_duration_seconds', "Time to extract and index an uploaded file, by file type",
+    ('stage', 'file_type')
+)
+ttft_seconds = metrics.histogram(
+    'time_to_first_token_seconds', "Time from the start of a streamed answer to its first token", ('backend',)
+)
+prompt_tokens = metrics.histogram(
+    'prompt_tokens', "Prompt size of questions sent to the backend", ('backend',), buckets=TOKEN_BUCKETS
+)
+completion_tokens = metrics.histogram(
+    'completion_tokens', "Answer size of questions answered by the backend", ('backend',), buckets=TOKEN_BUCKETS
+)
+answer_cache_lookups = metrics.counter(
+    'answer_cache_lookups_total', "Answer cache lookups by result (hit or miss)", ('result',)
+)
+prompt_truncations = metrics.counter(
+    'prompt_truncations_total', "Documents shortened to fit the prompt, by strategy", ('strategy',)
+)
+metrics.gauge('queue_active', "Questions currently running on the backend", lambda: llm_queue.stats()['active'])
+metrics.gauge('queue_depth', "Questions waiting for the backend", lambda: llm_queue.stats()['queue_depth'])
+metrics.gauge('queue_rejected', "Questions rejected with 503 since start", lambda: llm_queue.stats()['rejected'])
 
 # Ensure data directory exists
 os.makedirs('data', exist_ok=True)
 logger.info("Data directory created/verified")
 
-# Add session management
-session_data = {
-    'conversation_history': [],
-    'current_file': None
-}
+# Cache extracted text so follow-up questions do not re-parse the document
+extraction_cache_config = config.get('cache', {}).get('extraction', {})
+extraction_cache = ExtractionCache(
+    os.path.join('data', '.cache', 'extract'),
+    max_entries=extraction_cache_config.get('max_entries', 32),
+    max_chars=extraction_cache_config.get('max_chars', 50_000_000)
+)
+
+# Answers to questions already asked about the same document and conversation
+answer_cache_config = config.get('cache', {}).get('answers', {})
+answer_cache = AnswerCache(
+    max_entries=answer_cache_config.get('max_entries', 256),
+    ttl=answer_cache_config.get('ttl', 3600),
+    near_duplicate=answer_cache_config.get('near_duplicate', False),
+    similarity_threshold=answer_cache_config.get('similarity_threshold', 0.85)
+)
+
+# Retrieval puts only the passages relevant to a question into the prompt
+retrieval_config = config.get('retrieval', {})
+index_cache = IndexCache(
+    max_entries=extraction_cache_config.get('max_entries', 32),
+    chunk_size=retrieval_config.get('chunk_size', 200),
+    overlap=retrieval_config.get('chunk_overlap', 40)
+)
+
+# Persistent full-text index over every uploaded file, for questions about the whole corpus
+corpus_config = retrieval_config.get('corpus', {})
+corpus_index = CorpusIndex(
+    os.path.join('data', '.cache', 'corpus.sqlite3'),
+    chunk_size=retrieval_config.get('chunk_size', 200),
+    overlap=retrieval_config.get('chunk_overlap', 40)
+) if corpus_config.get('enabled', True) else None
+
+# Optional dense retrieval for corpus questions, alone or fused with the keyword results
+vector_config = retrieval_config.get('vector', {})
+vector_index = None
+if vector_config.get('enabled', False):
+    # Imported here so numpy is not loaded unless dense retrieval is on
+    from utils.vector_index import VectorIndex, create_embedder, fuse_rankings
+    vector_index = VectorIndex(
+        os.path.join('data', '.cache', 'vectors'),
+        create_embedder(vector_config, config['llm']),
+        dtype=vector_config.get('dtype', 'float16'),
+        chunk_size=retrieval_config.get('chunk_size', 200),
+        overlap=retrieval_config.get('chunk_overlap', 40)
+    )
+corpus_indexes = [index for index in (corpus_index, vector_index) if index is not None]
+
+# Uploads are streamed to disk in chunks and stored once per distinct content
+# under data/.blobs/; session directories hold hard links to the blobs
+upload_config = config.get('uploads', {})
+upload_store = UploadStore(
+    os.path.join('data', '.uploads'),
+    os.path.join('data', '.blobs'),
+    ttl=upload_config.get('ttl', 86400)
+)
+
+# Per-session state, keyed by a session cookie. Each session uploads into its
+# own data/<session_id>/ directory and keeps its own history and current file
+SESSION_COOKIE = 'session_id'
+session_config = config.get('session', {})
+
+def session_dir(session_id):
+    return os.path.join('data', session_id)
+
+def document_name(file_path):
+    """Name of an uploaded file in the shared corpus indexes: '<session_id>/<file name>'."""
+    return os.path.relpath(file_path, 'data').replace(os.sep, '/')
+
+def remove_session_files(session_id):
+    """Delete a session's uploads along with their cache, index and job entries."""
+    directory = session_dir(session_id)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            extraction_cache.forget(os.path.join(directory, name))
+        shutil.rmtree(directory)
+    for index in corpus_indexes:
+        for name in index.document_names(prefix=f"{session_id}/"):
+            index.remove_document(name)
+    ingestion.clear(path_prefix=directory + os.sep)
+    remove_unused_content()
+
+def remove_unused_content():
+    """Delete stored uploads no session file refers to any more, and their cached text."""
+    for digest in upload_store.collect_garbage():
+        extraction_cache.remove_content(digest)
 
-@app.route('/')
+def collect_garbage_periodically(interval):
+    """Run remove_unused_content() every interval seconds on a daemon thread.
+
+    Catches blobs a replaced file left behind when its digest was not known,
+    and expires abandoned uploads.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                remove_unused_content()
+            except Exception as e:
+                logger.error(f"Error removing unused uploads: {str(e)}")
+
+    thread = threading.Thread(target=run, name='upload-gc', daemon=True)
+    thread.start()
+    return thread
+
+session_store = create_session_store(session_config, on_evict=remove_session_files)
+
+# Prompts are fitted into the model's context window, counted with the
+# backend's tokenizer: the answer, question, history and document each get
+# a fixed share, and documents over theirs are cut or summarized
+prompt_config = config.get('prompt', {})
+history_config = config.get('history', {})
+
+def summarize_section(prompt, max_tokens):
+    with llm_queue.slot():
+        return llm_backend.complete(prompt, max_tokens=max_tokens)
+
+prompt_builder = PromptBuilder(
+    lambda text: llm_backend.count_tokens(text),
+    context_window(config['llm']),
+    completion_tokens=prompt_config.get('completion_tokens', 512),
+    question_tokens=prompt_config.get('question_tokens', 256),
+    history_tokens=history_config.get('budget_tokens', 1000),
+    # The OpenAI backends send SYSTEM_PROMPT as a message of its own
+    system_prompt=SYSTEM_PROMPT if llm_backend.name == 'openai' else None,
+    strategy=prompt_config.get('truncation', 'head'),
+    summarize_fn=summarize_section,
+    section_tokens=prompt_config.get('section_tokens', 1000),
+    max_sections=prompt_config.get('max_sections', 32),
+    cache_entries=prompt_config.get('token_cache_entries', 4096)
+)
+
+# Prompts carry the newest turns verbatim within the history budget; older
+# turns are folded into a rolling summary in the background
+def summarize_history(prompt):
+    with llm_queue.slot():
+        return llm_backend.complete(prompt, max_tokens=prompt_builder.history_tokens // 2)
+
+history_manager = HistoryManager(
+    prompt_builder.count_tokens,
+    budget_tokens=prompt_builder.history_tokens,
+    max_recent_turns=history_config.get('max_recent_turns', 6),
+    summarize_fn=summarize_history if history_config.get('summarize', True) else None
+)
+
+@routes.before_app_request
+def start_request():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+    g.request_id_token = request_id_var.set(g.request_id)
+
+@routes.after_app_request
+def log_request(response):
+    duration_ms = (time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    # The route pattern, not the path, so /jobs/<id> is one series
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_seconds.observe(duration_ms / 1000, method=request.method, route=route, status=response.status_code)
+    logger.info(
+        f"{request.method} {request.path} {response.status_code} in {duration_ms:.1f} ms",
+        extra={'method': request.method, 'path': request.path, 'status': response.status_code,
+               'duration_ms': round(duration_ms, 1)}
+    )
+    return response
+
+@routes.teardown_app_request
+def end_request(exc):
+    # Request threads are reused under a WSGI server, so the ID must not leak into the next request
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        request_id_var.reset(token)
+
+@routes.before_app_request
+def load_session_id():
+    session_id = request.cookies.get(SESSION_COOKIE)
+    g.new_session = not is_valid_session_id(session_id)
+    g.session_id = new_session_id() if g.new_session else session_id
+
+@routes.after_app_request
+def set_session_cookie(response):
+    if g.get('new_session'):
+        response.set_cookie(SESSION_COOKIE, g.session_id, max_age=session_config.get('ttl', 86400),
+                            httponly=True, samesite='Lax')
+    return response
+
+@routes.route('/')
 def index():
     logger.info("Home page accessed")
     return render_template('index.html')
 
-@app.route('/logs')
+# An idle log stream sends a comment this often, so closed tabs are noticed,
+# and ends after LOG_STREAM_MAX_SECONDS; EventSource reconnects and resumes
+LOG_STREAM_HEARTBEAT = 15
+LOG_STREAM_MAX_SECONDS = 300
+
+def read_log_filters(args, last_event_id=None):
+    """Return (since, min_level) from ?since=<seq>&level=<name>, or raise ValueError.
+
+    A reconnecting EventSource sends the last sequence number it received as
+    Last-Event-ID, which takes precedence over ?since.
+    """
+    since = int(last_event_id or args.get('since', 0))
+    level = args.get('level', 'NOTSET').upper()
+    min_level = logging.getLevelName(level)
+    if not isinstance(min_level, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return since, min_level
+
+@routes.route('/logs')
 def get_logs():
-    """Endpoint to fetch recent logs"""
-    return jsonify({'logs': list(log_buffer)})
+    """Log lines newer than ?since=<seq>, optionally only those at or above ?level="""
+    try:
+        since, min_level = read_log_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    entries, last_seq = log_buffer.since(since, min_level)
+    return jsonify({'logs': entries, 'last_seq': last_seq})
+
+@routes.route('/logs/stream')
+def stream_logs():
+    """Push new log lines as Server-Sent Events, resuming after Last-Event-ID"""
+    try:
+        since, min_level = read_log_filters(request.args, request.headers.get('Last-Event-ID'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def events():
+        seq = since
+        deadline = time.monotonic() + LOG_STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            if not log_buffer.wait(seq, timeout=LOG_STREAM_HEARTBEAT):
+                yield ": keep-alive\n\n"
+                continue
+            entries, seq = log_buffer.since(seq, min_level)
+            for entry in entries:
+                yield format_sse(entry, event_id=entry['seq'])
 
-@app.route('/upload', methods=['POST'])
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@routes.route('/upload', methods=['POST'])
 def upload_file():
     logger.info("File upload request received")
     if 'file' not in request.files:
@@ -113,120 +362,590 @@ def upload_file():
         logger.warning("No file selected")
         return jsonify({'error': 'No selected file'}), 400
     
-    if file:
-        try:
-            file_path = os.path.join('data', file.filename)
-            file.save(file_path)
-            logger.info(f"File saved successfully: {file.filename}")
-            return jsonify({'message': 'File uploaded successfully'}), 200
-        except Exception as e:
-            logger.error(f"Error saving file: {str(e)}")
-            return jsonify({'error': 'Error saving file'}), 500
+    file_name = secure_filename(file.filename)
+    if not file_name:
+        logger.warning(f"Invalid file name: {file.filename}")
+        return jsonify({'error': 'Invalid file name'}), 400
+
+    try:
+        file_path, digest, duplicate = upload_store.save(g.session_id, file_name, file.stream,
+                                                         session_dir(g.session_id))
+        logger.info(f"File saved successfully: {file_name}")
+    except Exception as e:
+        logger.error(f"Error saving file: {str(e)}")
+        return jsonify({'error': 'Error saving file'}), 500
+    return jsonify(dict(place_upload(file_path, digest, duplicate), message='File uploaded successfully')), 200
+
+def place_upload(file_path, digest, duplicate):
+    """Start ingesting a file that was just linked into a session directory."""
+    # The file may have replaced one whose content nothing else refers to; only
+    # that blob is checked, the full scan runs on session removal and periodically
+    previous = extraction_cache.forget(file_path)
+    if previous and previous != digest and upload_store.release(previous):
+        extraction_cache.remove_content(previous)
+    # The hash is known from the upload, so the file is not read again to compute it
+    extraction_cache.record_digest(file_path, digest)
+    # Extract and index in the background so the first question is a cache lookup.
+    # Content that was uploaded before reuses its extracted text and index entries
+    job = ingestion.submit(os.path.basename(file_path), file_path)
+    return {'job_id': job.id, 'sha256': digest, 'duplicate': duplicate}
+
+@routes.route('/uploads', methods=['POST'])
+def start_upload():
+    """Start a chunked upload of {"file_name": ..., "size": ...}; returns its upload_id"""
+    data = request.get_json(silent=True) or {}
+    file_name = secure_filename(data.get('file_name') or '')
+    if not file_name:
+        return jsonify({'error': 'Invalid file name'}), 400
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or size < 0):
+        return jsonify({'error': 'Invalid size'}), 400
+    status = upload_store.init(g.session_id, file_name, size)
+    logger.info(f"Chunked upload {status['upload_id']} started for {file_name}")
+    return jsonify(dict(status, chunk_size=upload_config.get('chunk_size', 8 * 1024 * 1024))), 201
+
+@routes.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Offset at which an interrupted upload resumes"""
+    try:
+        return jsonify(upload_store.status(upload_id, g.session_id))
+    except UploadNotFoundError:
+        return jsonify({'error': 'Upload not found'}), 404
+
+@routes.route('/uploads/<upload_id>', methods=['PUT'])
+def append_upload(upload_id):
+    """Append the raw request body at ?offset=<bytes already sent>"""
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'offset is required'}), 400
+    try:
+        return jsonify(upload_store.append(upload_id, g.session_id, offset, request.stream))
+    except UploadNotFoundError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadOffsetError as e:
+        return jsonify({'error': str(e), 'offset': e.expected}), 409
+    except UploadIntegrityError as e:
+        return jsonify({'error': str(e)}), 422
+
+@routes.route('/uploads/<upload_id>/commit', methods=['POST'])
+def commit_upload(upload_id):
+    """Finish a chunked upload, optionally checking {"sha256": ...}, and start ingesting it"""
+    data = request.get_json(silent=True) or {}
+    try:
+        file_path, digest, duplicate = upload_store.commit(upload_id, g.session_id, session_dir(g.session_id),
+                                                           sha256=data.get('sha256'))
+    except UploadNotFoundError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadIntegrityError as e:
+        return jsonify({'error': str(e)}), 422
+    logger.info(f"File saved successfully: {os.path.basename(file_path)}")
+    return jsonify(dict(place_upload(file_path, digest, duplicate), message='File uploaded successfully')), 200
+
+@routes.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """Discard an unfinished upload"""
+    try:
+        upload_store.abort(upload_id, g.session_id)
+    except UploadNotFoundError:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'message': 'Upload discarded'})
 
-@app.route('/files', methods=['GET'])
+@routes.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and progress of an ingestion job"""
+    job = ingestion.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@routes.route('/files', methods=['GET'])
 def list_files():
     logger.info("File list request received")
     try:
-        files = os.listdir('data')
+        files = list_data_files(g.session_id)
         logger.info(f"Found {len(files)} files")
         return jsonify({'files': files})
     except Exception as e:
         logger.error(f"Error listing files: {str(e)}")
         return jsonify({'error': 'Error listing files'}), 500
 
-def get_file_extractor(file_path):
-    """Get the appropriate extractor based on file extension."""
-    file_ext = os.path.splitext(file_path)[1].lower()
-    if file_ext == '.txt':
-        from utils.extract_txt import extract_text
-    elif file_ext == '.pdf':
-        from utils.extract_pdf import extract_text
-    elif file_ext == '.docx':
-        from utils.extract_docx import extract_text
-    elif file_ext == '.xlsx':
-        from utils.extract_excel import extract_text
+def list_data_files(session_id):
+    """List the files a session has uploaded."""
+    directory = session_dir(session_id)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name for name in os.listdir(directory)
+        if not name.startswith('.') and os.path.isfile(os.path.join(directory, name))
+    )
+
+@routes.route('/session', methods=['GET'])
+def get_session():
+    """The caller's session ID, files and conversation length"""
+    state = session_store.get(g.session_id)
+    return jsonify({
+        'session_id': g.session_id,
+        'files': list_data_files(g.session_id),
+        'current_file': state['current_file'],
+        'turns': len(state['conversation_history']),
+        'summary': state['summary']
+    })
+
+def context_budget():
+    """Tokens of document context per prompt: the retrieval budget, within the prompt's document share."""
+    return min(retrieval_config.get('context_budget_tokens', 1500), prompt_builder.document_tokens)
+
+def get_document_context(file_path, question):
+    """Return the part of a document to put in the prompt for a question, and how to shorten it.
+
+    Documents that fit in the retrieval token budget are used whole; larger
+    ones are reduced to their best BM25 passages. The strategy is None for
+    a whole document, which the prompt builder shortens with the configured
+    strategy if it does not fit (with retrieval disabled, or more tokens
+    than estimated), and 'head' for passages, of which the last are dropped.
+    """
+    extract_text = get_file_extractor(file_path)
+    content = extraction_cache.get_text(file_path, extract_text)
+    budget = context_budget()
+    if not retrieval_config.get('enabled', True) or estimate_tokens(content) <= budget:
+        return content, None
+
+    index = index_cache.get_index(extraction_cache.key_for(file_path, extract_text), content)
+    context = index.build_context(question, retrieval_config.get('top_k', 5), budget)
+    logger.info(f"Retrieved {estimate_tokens(context)} of {estimate_tokens(content)} estimated tokens for prompt")
+    return context, 'head'
+
+def get_corpus_context(question, session_id):
+    """Return the best passages across a session's files for a question, with their sources.
+
+    Each passage is numbered and labelled with its file and location so the
+    answer can cite it.
+    """
+    top_k = corpus_config.get('top_k', 8)
+    prefix = f"{session_id}/"
+    passages = corpus_index.search(question, top_k, prefix=prefix) if corpus_index is not None else []
+    if vector_index is not None:
+        dense = vector_index.search(question, top_k, prefix=prefix)
+        passages = fuse_rankings([passages, dense], top_k) if vector_config.get('hybrid', True) else dense
+    budget = context_budget()
+    parts, sources, used = [], [], 0
+    for passage in passages:
+        file_name = passage['file'][len(prefix):]
+        label = f"{file_name}, {passage['source']}" if passage['source'] else file_name
+        part = f"[{len(parts) + 1}] {label}\n{passage['text']}"
+        if parts and used + estimate_tokens(part) > budget:
+            break
+        parts.append(part)
+        used += estimate_tokens(part)
+        sources.append({'id': len(parts), 'file': file_name, 'source': passage['source'],
+                        'score': passage['score']})
+    logger.info(f"Retrieved {len(parts)} passages from {len({s['file'] for s in sources})} files for corpus question")
+    return "\n\n".join(parts), sources
+
+def ingest_file(job):
+    """Extract and index an uploaded file; runs on an ingestion worker."""
+    extract_text = get_file_extractor(job.file_path)
+    file_type = os.path.splitext(job.file_path)[1].lstrip('.').lower()
+    job.set_stage('extracting')
+    content_key = extraction_cache.key_for(job.file_path, extract_text)
+    name = document_name(job.file_path)
+    stale = [index for index in corpus_indexes if not index.has_document(name, content_key)]
+    # A file with the same content as one already indexed (a duplicate upload) copies its entries
+    stale = [index for index in stale if not index.copy_document(name, content_key)]
+    if stale:
+        # One pass over the file feeds the cached text and every corpus index as it is extracted,
+        # so only the joined text, which the cache and the BM25 index need, is held whole
+        text = io.StringIO()
+        segments = recording(get_segment_iterator(job.file_path)(job.file_path, progress=job.report_progress), text)
+        with ingest_seconds.time(stage='extract_index', file_type=file_type):
+            fan_out(segments, [functools.partial(index.add_document, name, content_key) for index in stale])
+        content = extraction_cache.put(job.file_path, extract_text, text.getvalue())
     else:
-        raise ValueError(f"Unsupported file type: {file_ext}")
-    return extract_text
+        with ingest_seconds.time(stage='extract', file_type=file_type):
+            content = extraction_cache.get_text(job.file_path, extract_text, progress=job.report_progress)
+    if retrieval_config.get('enabled', True):
+        job.set_stage('indexing')
+        with ingest_seconds.time(stage='bm25_index', file_type=file_type):
+            index_cache.get_index(extraction_cache.key_for(job.file_path, extract_text), content)
+
+# Uploads are ingested on a worker pool instead of inside the first /ask
+ingestion_config = config.get('ingestion', {})
+ingestion = IngestionPipeline(ingest_file, max_workers=ingestion_config.get('workers', 2))
+
+def sync_data():
+    """Bring data/ and the corpus indexes in line after a restart.
+
+    Session directories idle for longer than the session TTL are removed,
+    files added while the server was down are indexed and entries of files
+    that are gone are dropped. Unchanged files keep their entries, so a
+    restart does not re-index them.
+    """
+    expired_before = time.time() - session_config.get('ttl', 86400)
+    files = []
+    for session_id in os.listdir('data'):
+        if not is_valid_session_id(session_id) or not os.path.isdir(session_dir(session_id)):
+            continue
+        if os.path.getmtime(session_dir(session_id)) < expired_before:
+            remove_session_files(session_id)
+            continue
+        files.extend(os.path.join(session_dir(session_id), name) for name in list_data_files(session_id))
+    names = {document_name(file_path) for file_path in files}
+    for index in corpus_indexes:
+        for name in set(index.document_names()) - names:
+            index.remove_document(name)
+    for file_path in files:
+        try:
+            content_key = extraction_cache.key_for(file_path, get_file_extractor(file_path))
+        except ValueError:
+            continue
+        if not all(index.has_document(document_name(file_path), content_key) for index in corpus_indexes):
+            ingestion.submit(os.path.basename(file_path), file_path)
+    remove_unused_content()
 
-@app.route('/clear_session', methods=['POST'])
+@routes.route('/clear_session', methods=['POST'])
 def clear_session():
-    """Clear the current session data"""
-    global session_data
-    session_data = {
-        'conversation_history': [],
-        'current_file': None
-    }
-    # Clear the data directory
+    """Clear the caller's history and uploaded files; other sessions are untouched"""
     try:
-        shutil.rmtree('data')
-        os.makedirs('data')
+        session_store.delete(g.session_id)
+        remove_session_files(g.session_id)
         logger.info("Session cleared successfully")
         return jsonify({'message': 'Session cleared successfully'})
     except Exception as e:
         logger.error(f"Error clearing session: {str(e)}")
         return jsonify({'error': 'Error clearing session'}), 500
 
-@app.route('/ask', methods=['POST'])
-def ask_question():
-    logger.info("Question request received")
-    data = request.json
+INVALID_BODY_ERROR = {'error': 'Request body must be a JSON object'}
+
+def invalid_body_response():
+    """400 for an /ask body that is missing, not JSON or not a JSON object; a client error, not a 500."""
+    logger.warning("Question body is not a JSON object")
+    return jsonify(INVALID_BODY_ERROR), 400
+
+def prepare_question(data, session_id):
+    """Validate an /ask payload and build the prompt for it.
+
+    Returns (prepared, None) on success, where prepared holds the question,
+    current_file, prompt, the backend cache_key and the answer's max_tokens;
+    otherwise (None, (error payload, status code)). The prompt is fitted
+    into the model's context window by prompt_builder; a question too long
+    for its share is a 400. With mode 'corpus' the context is drawn
+    from every file of the session and prepared['sources'] lists the cited
+    passages. Shared by the Flask routes and the async routes in asgi.py.
+    """
+    if not isinstance(data, dict):
+        logger.warning("Question body is not a JSON object")
+        return None, (INVALID_BODY_ERROR, 400)
     question = data.get('question')
     if not question:
         logger.warning("No question provided")
-        return jsonify({'error': 'No question provided'}), 400
+        return None, ({'error': 'No question provided'}, 400)
+
+    files = list_data_files(session_id)
+    if not files:
+        logger.warning("No files available for question answering")
+        return None, ({'error': 'No files available'}, 400)
+
+    # Use the current file if it is still there, otherwise get the first file
+    state = session_store.get(session_id)
+    current_file = state['current_file']
+    if current_file not in files:
+        current_file = files[0]
+    file_path = os.path.join(session_dir(session_id), current_file)
+
+    mode = data.get('mode') or corpus_config.get('default_mode', 'file')
+    if mode not in ('file', 'corpus'):
+        return None, ({'error': f'Unknown mode: {mode}'}, 400)
+    if mode == 'corpus' and not corpus_indexes:
+        return None, ({'error': 'Corpus search is disabled'}, 400)
 
+    sources = None
     try:
-        files = os.listdir('data')
-        if not files:
-            logger.warning("No files available for question answering")
-            return jsonify({'error': 'No files available'}), 400
-
-        # Use the current file if available, otherwise get the first file
-        current_file = session_data['current_file'] or files[0]
-        file_path = os.path.join('data', current_file)
-        logger.info(f"Processing question for file: {current_file}")
-        
-        try:
-            extract_text = get_file_extractor(file_path)
-            content = extract_text(file_path)
-            logger.info(f"Content extracted from {current_file}")
-        except Exception as e:
-            logger.error(f"Error extracting content from {current_file}: {str(e)}")
-            return jsonify({'error': f'Error processing file: {str(e)}'}), 500
-
-        # Add conversation history to the context
-        conversation_context = "\n".join([f"Q: {q}\nA: {a}" for q, a in session_data['conversation_history']])
-        full_context = f"{conversation_context}\n\nCurrent Context: {content}"
-
-        if config['llm']['backend'] == 'openai':
-            logger.info("Using OpenAI for question answering")
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": f"Previous conversation:\n{conversation_context}\n\nQuestion: {question}\nContext: {content}"}
-                ]
-            )
-            answer = response.choices[0].message.content
+        if mode == 'corpus':
+            logger.info(f"Processing question across {len(files)} files")
+            with stage_seconds.time(stage='ingestion_wait'):
+                for name in files:
+                    ingestion.wait_for_file(os.path.join(session_dir(session_id), name),
+                                            timeout=ingestion_config.get('wait_timeout', 120))
+            with stage_seconds.time(stage='context'):
+                content, sources = get_corpus_context(question, session_id)
+            # Passages come best first, so the last ones are dropped if they do not fit
+            strategy = 'head'
+            content_key = 'corpus-' + hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
         else:
-            logger.info("Using Llama for question answering")
-            prompt = f"Previous conversation:\n{conversation_context}\n\nQuestion: {question}\nContext: {content}"
-            response = llama_model(prompt, max_tokens=100)
-            answer = response['choices'][0]['text']
+            logger.info(f"Processing question for file: {current_file}")
+            # Reuse the upload's extraction and index once its ingestion job is done
+            with stage_seconds.time(stage='ingestion_wait'):
+                ingestion.wait_for_file(file_path, timeout=ingestion_config.get('wait_timeout', 120))
+            with stage_seconds.time(stage='context'):
+                content, strategy = get_document_context(file_path, question)
+            content_key = extraction_cache.key_for(file_path, get_file_extractor(file_path))
+            logger.info(f"Content extracted from {current_file}")
+    except Exception as e:
+        logger.error(f"Error extracting content from {current_file}: {str(e)}")
+        return None, ({'error': f'Error processing file: {str(e)}'}, 500)
+
+    # Only the newest turns that fit the history budget go in verbatim
+    summary = state['summary']
+    with stage_seconds.time(stage='prompt'):
+        _, history = history_manager.select(state['conversation_history'], summary)
+        try:
+            prompt, prompt_stats = prompt_builder.build(content, history, question, summary, strategy=strategy)
+        except PromptTooLongError as e:
+            logger.warning(f"Prompt does not fit the context window: {str(e)}")
+            return None, ({'error': str(e)}, 400)
+        prompt_stats.update(history_turns=len(history), summarized=summary is not None)
+        if prompt_stats['truncation']:
+            prompt_truncations.inc(strategy=prompt_stats['truncation'])
+    logger.info(f"Prompt has {prompt_stats['tokens']} tokens with {len(history)} recent turns"
+                f"{' and a summary' if summary else ''}")
+    prepared = {
+        'session_id': session_id,
+        'question': question,
+        'current_file': current_file,
+        'prompt': prompt,
+        'prompt_stats': prompt_stats,
+        'max_tokens': prompt_stats['max_tokens'],
+        # Model state is reused per document and conversation
+        'cache_key': f"{session_id}:{content_key}",
+        'answer_scope': AnswerCache.scope(content_key, llm_backend.name, llm_backend.model_name, history, summary),
+        'cached_answer': None,
+        'sources': sources
+    }
+    if answer_cache_config.get('enabled', True):
+        prepared['cached_answer'] = answer_cache.get(prepared['answer_scope'], question)
+        answer_cache_lookups.inc(result='miss' if prepared['cached_answer'] is None else 'hit')
+    return prepared, None
+
+def record_answer(prepared, answer, cached=False):
+    """Add a finished turn to the conversation history and the answer cache."""
+    session_id = prepared['session_id']
+    session_store.record_turn(session_id, prepared['question'], answer.strip(), prepared['current_file'])
+    # Turns that no longer fit the history budget are summarized off the request path
+    if history_manager.summarize_fn is not None:
+        state = session_store.get(session_id)
+        history_manager.schedule_summary(
+            session_id, state['conversation_history'], state['summary'],
+            lambda summary, covered: session_store.apply_summary(session_id, summary, covered)
+        )
+    if cached:
+        return
+    prompt_tokens.observe(prepared['prompt_stats']['tokens'], backend=llm_backend.name)
+    completion_tokens.observe(llm_backend.count_tokens(answer), backend=llm_backend.name)
+    if answer_cache_config.get('enabled', True):
+        answer_cache.put(prepared['answer_scope'], prepared['question'], answer)
+
+def answer_payload(prepared, answer, cached, timings=None, **extra):
+    """Body of an /ask response, or of the done event of /ask/stream."""
+    payload = {'answer': answer, 'cached': cached}
+    payload.update(extra)
+    if not cached:
+        payload['prompt'] = prepared['prompt_stats']
+    if prepared['sources'] is not None:
+        payload['sources'] = prepared['sources']
+    if timings:
+        payload['timings'] = timings
+    return payload
+
+BUSY_ERROR = {'error': 'Server is busy, please retry shortly'}
+BUSY_HEADERS = {'Retry-After': '1'}
+
+def busy_response():
+    """503 returned when the backend queue cannot take another question."""
+    return jsonify(BUSY_ERROR), 503, BUSY_HEADERS
+
+def format_sse(data, event=None, event_id=None):
+    """Encode one Server-Sent Events message."""
+    message = f"id: {event_id}\n" if event_id is not None else ""
+    message += f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def cached_answer_stream(prepared):
+    """Send a cached answer in the same event format as a streamed one."""
+    return Response(cached_answer_events(prepared), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+def cached_answer_events(prepared):
+    answer = prepared['cached_answer']
+    record_answer(prepared, answer, cached=True)
+    logger.info("Question answered from answer cache")
+    done = answer_payload(prepared, answer, cached=True, ttft_ms=0.0, total_ms=0.0)
+    return format_sse({'token': answer}) + format_sse(done, event='done')
+
+@routes.route('/ask', methods=['POST'])
+def ask_question():
+    logger.info("Question request received")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return invalid_body_response()
+    try:
+        prepared, error = prepare_question(data, g.session_id)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        if prepared['cached_answer'] is not None:
+            record_answer(prepared, prepared['cached_answer'], cached=True)
+            logger.info("Question answered from answer cache")
+            return jsonify(answer_payload(prepared, prepared['cached_answer'], cached=True))
+
+        timings = {}
+        with llm_queue.slot() as waited:
+            stage_seconds.observe(waited, stage='queue_wait')
+            logger.info(f"Using {llm_backend.name} for question answering")
+            with stage_seconds.time(stage='generate'):
+                answer = llm_backend.complete(prepared['prompt'], cache_key=prepared['cache_key'], timings=timings,
+                                              max_tokens=prepared['max_tokens'])
 
         # Update conversation history
-        session_data['conversation_history'].append((question, answer))
-        session_data['current_file'] = current_file
+        record_answer(prepared, answer)
 
         logger.info("Question answered successfully")
-        return jsonify({'answer': answer})
+        return jsonify(answer_payload(prepared, answer, cached=False, timings=timings))
+    except QueueFullError:
+        return busy_response()
+    except Exception as e:
+        logger.error(f"Error processing question: {str(e)}")
+        return jsonify({'error': 'Error processing question'}), 500
+
+@routes.route('/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """Answer a question, sending tokens as Server-Sent Events as they arrive"""
+    logger.info("Streaming question request received")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return invalid_body_response()
+    try:
+        prepared, error = prepare_question(data, g.session_id)
+        if error:
+            return jsonify(error[0]), error[1]
+        if prepared['cached_answer'] is not None:
+            return cached_answer_stream(prepared)
+        # Take the backend slot before responding so a full queue is still a plain 503
+        stage_seconds.observe(llm_queue.acquire(), stage='queue_wait')
+    except QueueFullError:
+        return busy_response()
     except Exception as e:
         logger.error(f"Error processing question: {str(e)}")
         return jsonify({'error': 'Error processing question'}), 500
 
+    slot_released = threading.Event()
+
+    def release_slot():
+        if not slot_released.is_set():
+            slot_released.set()
+            llm_queue.release()
+
+    def events():
+        started = time.perf_counter()
+        first_token_at = None
+        parts = []
+        timings = {}
+        logger.info(f"Streaming from {llm_backend.name} for question answering")
+        try:
+            for token in llm_backend.stream(prepared['prompt'], cache_key=prepared['cache_key'], timings=timings,
+                                            max_tokens=prepared['max_tokens']):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    ttft_seconds.observe(first_token_at - started, backend=llm_backend.name)
+                    logger.info(f"Time to first token: {(first_token_at - started) * 1000:.1f} ms")
+                parts.append(token)
+                yield format_sse({'token': token})
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield format_sse({'error': 'Error processing question'}, event='error')
+            return
+        finally:
+            # Free the backend as soon as generation ends, even if the client went away
+            release_slot()
+            stage_seconds.observe(time.perf_counter() - started, stage='generate')
+
+        answer = "".join(parts)
+        record_answer(prepared, answer)
+        total_ms = (time.perf_counter() - started) * 1000
+        ttft_ms = (first_token_at - started) * 1000 if first_token_at else total_ms
+        logger.info(f"Question answered successfully (streamed in {total_ms:.1f} ms)")
+        done = answer_payload(prepared, answer, cached=False, timings=timings,
+                              ttft_ms=round(ttft_ms, 1), total_ms=round(total_ms, 1))
+        yield format_sse(done, event='done')
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Covers responses that are closed before the generator ever runs
+    response.call_on_close(release_slot)
+    return response
+
+@routes.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process serves requests, whether or not the backend is loaded yet"""
+    return jsonify({'status': 'ok'})
+
+@routes.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once the LLM backend is loaded and warmed up, 503 while it loads or after it failed"""
+    status = llm_backend.status()
+    return jsonify(status), 200 if status['state'] == 'ready' else 503
+
+@routes.route('/queue', methods=['GET'])
+def queue_stats():
+    """Current depth, concurrency and wait times of the LLM request queue, plus backend throughput"""
+    stats = llm_queue.stats()
+    stats['backend_stats'] = llm_backend.stats()
+    return jsonify(stats)
+
+@routes.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage latencies, token counts and cache and queue counters in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@routes.route('/cache', methods=['GET'])
+def cache_stats():
+    """Hit and miss counters of the answer cache"""
+    return jsonify({'answers': answer_cache.stats()})
+
+# What stays at import time: the configuration, the log listener and the
+# stores, indexes and queues the routes share. asgi.py and the tests use them
+# before any app is built, and modules log from the moment they are imported,
+# so the listener has to be running first. None of it touches the network or
+# a model; the indexes and the session store only create their SQLite files
+# and schema if missing, which takes milliseconds. Scanning data/, the upload
+# garbage collection and loading the backend wait for start_up().
+def start_up(warm_up=None):
+    """Index files added while the server was down, start the periodic upload
+    garbage collection (uploads.gc_interval) and start loading the backend.
+
+    warm_up defaults to llm.warm_up in config.yaml (true). Without it the
+    backend is loaded by the first question.
+    """
+    sync_data()
+    gc_interval = upload_config.get('gc_interval', 3600)
+    if gc_interval:
+        collect_garbage_periodically(gc_interval)
+    if warm_up is None:
+        warm_up = config['llm'].get('warm_up', True)
+    if warm_up:
+        llm_backend.start_warm_up()
+
+
+def create_app(start=True, warm_up=None):
+    """Build the Flask app and, with start, run start_up(warm_up).
+
+    The app is not built on import, so importing this module neither scans
+    data/ nor loads the backend. python app.py builds it here; asgi.py
+    builds it with start=False and runs start_up() in its lifespan.
+    """
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(routes)
+    if start:
+        start_up(warm_up)
+    logger.info("Flask app initialized")
+    return flask_app
+
 if __name__ == '__main__':
     logger.info("Starting Flask application")
+    app = create_app()
     app.run(
         host=config['flask']['host'],
         port=config['flask']['port'],
@@ -0,0 +1,298 @@
+"""Async entry point for serving many concurrent questions.
+
+/ask and /ask/stream are served by coroutines: with the OpenAI backend a
+question waiting on the network holds no thread, requests share one pooled
+HTTP client, and a question is cancelled when its client disconnects.
+/logs/stream is a coroutine too, so open log tabs do not hold the threads
+the WSGI mount has for requests. Every other route is the Flask app from
+app.py, mounted as WSGI.
+
+Run with: uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import functools
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as flask_app
+from utils.async_backends import LazyAsyncBackend, create_async_backend
+from utils.log_pipeline import request_id_var
+from utils.session_store import is_valid_session_id, new_session_id
+from utils.work_queue import AsyncBoundedWorkQueue, QueueFullError
+
+logger = flask_app.logger
+config = flask_app.config
+
+# The OpenAI client and its connection pool are built on first use or by the
+# warm-up the lifespan starts, not on import
+async_backend = create_async_backend(config['llm'], flask_app.llm_backend, lazy=True)
+
+# Waiting coroutines are cheap, so the OpenAI backend may run many more
+# questions at once than the thread-bound Flask server
+queue_config = config['llm'].get('queue', {})
+async_config = (config['llm'].get('openai') or {}).get('async') or {}
+async_queue = AsyncBoundedWorkQueue(
+    async_backend.name,
+    max_concurrency=async_config.get('max_concurrency', 64) if async_backend.name == 'openai'
+    else flask_app.llm_queue.max_concurrency,
+    max_queue_depth=queue_config.get('max_queue_depth', 16),
+    timeout=queue_config.get('timeout', 30)
+)
+flask_app.metrics.gauge('async_queue_active', "Questions currently running on the backend (async routes)",
+                        lambda: async_queue.stats()['active'])
+flask_app.metrics.gauge('async_queue_depth', "Questions waiting for the backend (async routes)",
+                        lambda: async_queue.stats()['queue_depth'])
+
+
+def logged(handler):
+    """Give an async route a request ID and log its status and duration, like app.log_request."""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        try:
+            response = await handler(request)
+            duration_ms = (time.perf_counter() - started) * 1000
+            response.headers['X-Request-ID'] = request_id
+            flask_app.request_seconds.observe(duration_ms / 1000, method=request.method, route=request.url.path,
+                                              status=response.status_code)
+            logger.info(
+                f"{request.method} {request.url.path} {response.status_code} in {duration_ms:.1f} ms",
+                extra={'method': request.method, 'path': request.url.path, 'status': response.status_code,
+                       'duration_ms': round(duration_ms, 1)}
+            )
+            return response
+        finally:
+            request_id_var.reset(token)
+    return wrapper
+
+
+class ClientDisconnected(Exception):
+    """The client went away before its answer was ready."""
+
+
+def get_session_id(request):
+    """Return (session_id, is_new) from the session cookie, like app.load_session_id."""
+    session_id = request.cookies.get(flask_app.SESSION_COOKIE)
+    if is_valid_session_id(session_id):
+        return session_id, False
+    return new_session_id(), True
+
+
+def with_session_cookie(response, session_id, is_new):
+    if is_new:
+        response.set_cookie(flask_app.SESSION_COOKIE, session_id,
+                            max_age=flask_app.session_config.get('ttl', 86400), httponly=True, samesite='lax')
+    return response
+
+
+def busy_response():
+    return JSONResponse(flask_app.BUSY_ERROR, status_code=503, headers=flask_app.BUSY_HEADERS)
+
+
+async def read_question(request):
+    """Parse the body and build the prompt off the event loop (it reads files and indexes)."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    session_id, is_new = get_session_id(request)
+    prepared, error = await run_in_threadpool(flask_app.prepare_question, data, session_id)
+    return session_id, is_new, prepared, error
+
+
+async def run_until_disconnect(request, coro):
+    """Await coro, cancelling it and raising ClientDisconnected if the client goes away first."""
+    task = asyncio.ensure_future(coro)
+
+    async def wait_for_disconnect():
+        while (await request.receive())['type'] != 'http.disconnect':
+            pass
+
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        raise ClientDisconnected()
+    return task.result()
+
+
+@logged
+async def ask_question(request):
+    logger.info("Question request received (async)")
+    session_id, is_new, prepared, error = await read_question(request)
+    if error:
+        return with_session_cookie(JSONResponse(error[0], status_code=error[1]), session_id, is_new)
+
+    if prepared['cached_answer'] is not None:
+        await run_in_threadpool(flask_app.record_answer, prepared, prepared['cached_answer'], True)
+        logger.info("Question answered from answer cache")
+        payload = flask_app.answer_payload(prepared, prepared['cached_answer'], cached=True)
+        return with_session_cookie(JSONResponse(payload), session_id, is_new)
+
+    timings = {}
+    try:
+        async with async_queue.slot() as waited:
+            flask_app.stage_seconds.observe(waited, stage='queue_wait')
+            with flask_app.stage_seconds.time(stage='generate'):
+                answer = await run_until_disconnect(
+                    request,
+                    async_backend.complete(prepared['prompt'], cache_key=prepared['cache_key'], timings=timings,
+                                           max_tokens=prepared['max_tokens'])
+                )
+    except QueueFullError:
+        return busy_response()
+    except ClientDisconnected:
+        logger.info("Client disconnected, question cancelled")
+        return Response(status_code=499)
+    except Exception as e:
+        logger.error(f"Error processing question: {str(e)}")
+        return JSONResponse({'error': 'Error processing question'}, status_code=500)
+
+    await run_in_threadpool(flask_app.record_answer, prepared, answer)
+    logger.info("Question answered successfully (async)")
+    payload = flask_app.answer_payload(prepared, answer, cached=False, timings=timings)
+    return with_session_cookie(JSONResponse(payload), session_id, is_new)
+
+
+class SlotStreamingResponse(StreamingResponse):
+    """StreamingResponse that gives back its queue slot however the response ends."""
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+@logged
+async def ask_question_stream(request):
+    """Answer a question, sending tokens as Server-Sent Events as they arrive"""
+    logger.info("Streaming question request received (async)")
+    session_id, is_new, prepared, error = await read_question(request)
+    if error:
+        return with_session_cookie(JSONResponse(error[0], status_code=error[1]), session_id, is_new)
+    if prepared['cached_answer'] is not None:
+        body = await run_in_threadpool(flask_app.cached_answer_events, prepared)
+        response = Response(body, media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+        return with_session_cookie(response, session_id, is_new)
+
+    # Take the backend slot before responding so a full queue is still a plain 503
+    try:
+        flask_app.stage_seconds.observe(await async_queue.acquire(), stage='queue_wait')
+    except QueueFullError:
+        return busy_response()
+
+    released = False
+
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            async_queue.release()
+
+    async def events():
+        started = time.perf_counter()
+        first_token_at = None
+        parts = []
+        timings = {}
+        try:
+            # Starlette cancels this generator when the client disconnects,
+            # which closes the upstream request as well
+            async for token in async_backend.stream(prepared['prompt'], cache_key=prepared['cache_key'],
+                                                    timings=timings, max_tokens=prepared['max_tokens']):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    flask_app.ttft_seconds.observe(first_token_at - started, backend=async_backend.name)
+                    logger.info(f"Time to first token: {(first_token_at - started) * 1000:.1f} ms")
+                parts.append(token)
+                yield flask_app.format_sse({'token': token})
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield flask_app.format_sse({'error': 'Error processing question'}, event='error')
+            return
+        finally:
+            release_slot()
+            flask_app.stage_seconds.observe(time.perf_counter() - started, stage='generate')
+
+        answer = "".join(parts)
+        await run_in_threadpool(flask_app.record_answer, prepared, answer)
+        total_ms = (time.perf_counter() - started) * 1000
+        ttft_ms = (first_token_at - started) * 1000 if first_token_at else total_ms
+        logger.info(f"Question answered successfully (streamed in {total_ms:.1f} ms)")
+        done = flask_app.answer_payload(prepared, answer, cached=False, timings=timings,
+                                        ttft_ms=round(ttft_ms, 1), total_ms=round(total_ms, 1))
+        yield flask_app.format_sse(done, event='done')
+
+    response = SlotStreamingResponse(
+        events(), release_slot, media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    return with_session_cookie(response, session_id, is_new)
+
+
+@logged
+async def stream_logs(request):
+    """Push new log lines as Server-Sent Events, like app.stream_logs but without holding a thread"""
+    try:
+        since, min_level = flask_app.read_log_filters(request.query_params, request.headers.get('Last-Event-ID'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    async def events():
+        seq = since
+        deadline = time.monotonic() + flask_app.LOG_STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            if not await flask_app.log_buffer.wait_async(seq, timeout=flask_app.LOG_STREAM_HEARTBEAT):
+                yield ": keep-alive\n\n"
+                continue
+            entries, seq = flask_app.log_buffer.since(seq, min_level)
+            for entry in entries:
+                yield flask_app.format_sse(entry, event_id=entry['seq'])
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@logged
+async def queue_stats(request):
+    """Queue and backend statistics of the async question routes"""
+    stats = async_queue.stats()
+    stats['backend_stats'] = async_backend.stats()
+    return JSONResponse(stats)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(flask_app.start_up)
+    if isinstance(async_backend, LazyAsyncBackend) and config['llm'].get('warm_up', True):
+        async_backend.start_warm_up()
+    yield
+    await async_backend.aclose()
+
+
+application = Starlette(
+    routes=[
+        Route('/ask', ask_question, methods=['POST']),
+        Route('/ask/stream', ask_question_stream, methods=['POST']),
+        Route('/queue', queue_stats, methods=['GET']),
+        Route('/logs/stream', stream_logs, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app.create_app(start=False))),
+    ],
+    lifespan=lifespan
+)
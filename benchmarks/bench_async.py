@@ -0,0 +1,108 @@
+"""Compare concurrent /ask throughput of the sync Flask server and the async server.
+
+Both servers use the OpenAI backend pointed at the local mock server in
+benchmarks.mock_openai, which answers after --latency seconds, so the
+numbers show how many slow upstream calls each server keeps in flight.
+
+Usage: python -m benchmarks.bench_async [--concurrency 8 32 128] [--requests 256] [--latency 0.5] [--json out.json]
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.report import percentiles, write_report
+from benchmarks.servers import REPO_ROOT, free_port, start_server, stop_server, wait_for_port, write_config
+
+
+def bench_config(app_port, mock_port, max_queue_depth):
+    return {
+        'llm': {
+            'backend': 'openai',
+            'queue': {'max_queue_depth': max_queue_depth, 'timeout': 120},
+            'openai': {
+                'api_key': 'sk-bench',
+                'base_url': f'http://127.0.0.1:{mock_port}/v1',
+                'async': {'max_concurrency': 256, 'max_connections': 256}
+            }
+        },
+        # Every request is a fresh upstream call
+        'cache': {'answers': {'enabled': False}},
+        'history': {'summarize': False, 'max_recent_turns': 0},
+        'flask': {'host': '127.0.0.1', 'port': app_port, 'debug': False}
+    }
+
+
+async def run_load(port, concurrency, requests):
+    """Send requests questions from concurrency clients; return throughput and latency percentiles."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=300) as client:
+        await client.post('/upload', files={'file': ('bench.txt', b'A short document for the load test.')})
+        session_cookie = client.cookies.get('session_id')
+        await asyncio.sleep(0.5)  # let the ingestion job finish
+        latencies, failures = [], 0
+        remaining = iter(range(requests))
+
+        async def worker():
+            nonlocal failures
+            for i in remaining:
+                started = time.perf_counter()
+                response = await client.post('/ask', json={'question': f'Question {i}?'},
+                                             cookies={'session_id': session_cookie})
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return dict(percentiles(latencies, (0.50, 0.95)), requests_per_s=round(len(latencies) / elapsed, 2),
+                failures=failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--requests', type=int, default=256)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds the mock OpenAI server takes per answer")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.mock_openai', '--port', str(mock_port), '--latency', str(args.latency)],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    results = []
+    try:
+        wait_for_port(mock_port)
+        for kind in ('sync', 'async'):
+            with tempfile.TemporaryDirectory() as workdir:
+                port = free_port()
+                write_config(workdir, bench_config(port, mock_port, max_queue_depth=max(args.concurrency)))
+                server = start_server(kind, workdir, port)
+                try:
+                    for concurrency in args.concurrency:
+                        result = dict(asyncio.run(run_load(port, concurrency, args.requests)),
+                                      server=kind, concurrency=concurrency)
+                        results.append(result)
+                        print(f"{kind:5s}  concurrency {concurrency:4d}  {result['requests_per_s']:8.2f} req/s  "
+                              f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  failures {result['failures']}")
+                finally:
+                    stop_server(server)
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if args.json:
+        write_report(args.json, 'async_serving', results, latency_s=args.latency, requests=args.requests)
+
+
+if __name__ == '__main__':
+    main()
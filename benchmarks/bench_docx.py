@@ -0,0 +1,118 @@
+"""Compare the streaming DOCX extractor with the former python-docx one on table-heavy files.
+
+'python-docx' is the previous utils/extract_docx: doc.paragraphs, then
+row.cells of every table row, which rebuilds the cell grid on each access
+and repeats merged cells. 'streaming' is the current extractor, an
+iterparse over word/document.xml. Every run is a fresh interpreter, so
+peak RSS is per run.
+
+Usage: python -m benchmarks.bench_docx [--rows 1000 10000 50000] [--tables 5] [--columns 8] [--repeat 3]
+       [--json out.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import write_docx
+from benchmarks.report import write_report
+
+VARIANTS = ['python-docx', 'streaming']
+
+
+def extract_python_docx(file_path):
+    """The extractor as it was: paragraphs first, then one line per non-empty cell of every row."""
+    from docx import Document
+
+    doc = Document(file_path)
+    parts = [paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()]
+    for table in doc.tables:
+        for row in table.rows:
+            cells = [cell.text for cell in row.cells if cell.text.strip()]
+            if cells:
+                parts.append("\n".join(cells))
+    return "\n".join(parts) + "\n"
+
+
+def peak_rss_mb():
+    """Peak RSS of this process. VmHWM starts over at exec, unlike ru_maxrss, which keeps the
+    peak of the forked benchmark process that wrote the fixture."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
+
+
+def run_variant(variant, path):
+    """Extract path with one variant and print time, peak RSS and output size as JSON."""
+    import logging
+
+    from utils.extract_docx import extract_text
+
+    logging.disable(logging.INFO)
+    extract = extract_python_docx if variant == 'python-docx' else extract_text
+    started = time.perf_counter()
+    text = extract(path)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        'seconds': round(elapsed, 4),
+        'peak_rss_mb': peak_rss_mb(),
+        'chars': len(text)
+    }))
+
+
+def measure(variant, path):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_docx', '--run', variant, path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000], help="rows per table")
+    parser.add_argument('--tables', type=int, default=5)
+    parser.add_argument('--columns', type=int, default=8)
+    parser.add_argument('--paragraphs', type=int, default=500)
+    parser.add_argument('--variants', nargs='+', default=VARIANTS, choices=VARIANTS)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per file; the fastest is reported")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--run', nargs=2, metavar=('VARIANT', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_variant(*args.run)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = write_docx(os.path.join(tmp, f"tables-{rows}.docx"), args.paragraphs, tables=args.tables,
+                              rows=rows, columns=args.columns)
+            for variant in args.variants:
+                runs = [measure(variant, path) for _ in range(args.repeat)]
+                best = min(runs, key=lambda run: run['seconds'])
+                result = dict(best, variant=variant, rows=rows, tables=args.tables, columns=args.columns,
+                              file_mb=round(os.path.getsize(path) / 2 ** 20, 2),
+                              peak_rss_mb=max(run['peak_rss_mb'] for run in runs))
+                results.append(result)
+                print(f"{args.tables} tables x {rows:6d} rows  {variant:11s}  {result['seconds']:8.3f} s  "
+                      f"peak RSS {result['peak_rss_mb']:7.1f} MB  {result['chars']:10d} chars")
+
+    if args.json:
+        write_report(args.json, 'docx', results, paragraphs=args.paragraphs, repeat=args.repeat)
+
+
+if __name__ == '__main__':
+    main()
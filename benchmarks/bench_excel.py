@@ -0,0 +1,89 @@
+"""Compare the streaming Excel extractor with the original full-load implementation.
+
+Each measurement runs in a fresh interpreter so peak RSS is not shared.
+
+Usage: python -m benchmarks.bench_excel [--rows 10000 100000] [--json out.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import write_xlsx
+
+
+def legacy_extract_text(file_path):
+    """The extractor as it was before streaming: full load, per-cell string concatenation."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_path)
+    text = ""
+    for sheet in wb.sheetnames:
+        ws = wb[sheet]
+        for row in ws.iter_rows():
+            for cell in row:
+                if cell.value:
+                    text += str(cell.value) + " "
+            text += "\n"
+    return text
+
+
+def run_variant(variant, path):
+    """Extract path with one implementation and print time, peak RSS and output size as JSON."""
+    if variant == 'legacy':
+        extract = legacy_extract_text
+    else:
+        from utils.extract_excel import extract_text as extract
+    started = time.perf_counter()
+    text = extract(path)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    print(json.dumps({
+        'seconds': round(elapsed, 4),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1),
+        'chars': len(text)
+    }))
+
+
+def measure(variant, path):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_excel', '--run', variant, path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--columns', type=int, default=8)
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--run', nargs=2, metavar=('VARIANT', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_variant(*args.run)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = write_xlsx(os.path.join(tmp, f"bench_{rows}.xlsx"), rows, args.columns)
+            for variant in ('legacy', 'streaming'):
+                result = dict(measure(variant, path), rows=rows, variant=variant)
+                results.append(result)
+                print(f"{rows:8d} rows  {variant:9s}  {result['seconds']:8.3f} s  "
+                      f"peak RSS {result['peak_rss_mb']:7.1f} MB  {result['chars']:10d} chars")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'excel_extraction', 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Time and peak memory of every extractor in utils/ on synthetic files.
+
+Generates a large PDF, a DOCX with big tables, a many-row XLSX and a
+multi-megabyte TXT file, then extracts each with its extract_text in a
+fresh interpreter so peak RSS is not shared between runs.
+
+Usage: python -m benchmarks.bench_extractors [--types pdf docx xlsx txt] [--repeat 3] [--json out.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import write_docx, write_pdf, write_txt, write_xlsx
+from benchmarks.report import write_report
+
+
+def make_fixture(file_type, directory, args):
+    """Write the fixture for one file type; return (path, description)."""
+    path = os.path.join(directory, f"bench.{file_type}")
+    if file_type == 'pdf':
+        return write_pdf(path, args.pdf_pages), f"{args.pdf_pages} pages"
+    if file_type == 'docx':
+        write_docx(path, args.docx_paragraphs, tables=args.docx_tables, rows=args.docx_rows)
+        return path, f"{args.docx_paragraphs} paragraphs, {args.docx_tables} tables x {args.docx_rows} rows"
+    if file_type == 'xlsx':
+        return write_xlsx(path, args.xlsx_rows), f"{args.xlsx_rows} rows"
+    return write_txt(path, args.txt_mb), f"{args.txt_mb} MB"
+
+
+def run_extractor(path):
+    """Extract path with the registered extractor and print time, peak RSS and output size as JSON."""
+    import logging
+
+    from utils.extractors import get_file_extractor
+
+    logging.disable(logging.INFO)
+    extract_text = get_file_extractor(path)
+    started = time.perf_counter()
+    text = extract_text(path)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    print(json.dumps({
+        'seconds': round(elapsed, 4),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1),
+        'chars': len(text)
+    }))
+
+
+def measure(path):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_extractors', '--run', path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--types', nargs='+', default=['pdf', 'docx', 'xlsx', 'txt'],
+                        choices=['pdf', 'docx', 'xlsx', 'txt'])
+    parser.add_argument('--repeat', type=int, default=3, help="runs per file; the fastest is reported")
+    parser.add_argument('--pdf-pages', type=int, default=100)
+    parser.add_argument('--docx-paragraphs', type=int, default=2000)
+    parser.add_argument('--docx-tables', type=int, default=5)
+    parser.add_argument('--docx-rows', type=int, default=2000)
+    parser.add_argument('--xlsx-rows', type=int, default=100000)
+    parser.add_argument('--txt-mb', type=float, default=20)
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--run', metavar='PATH', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_extractor(args.run)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_type in args.types:
+            path, description = make_fixture(file_type, tmp, args)
+            runs = [measure(path) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run['seconds'])
+            result = dict(best, file_type=file_type, fixture=description,
+                          file_mb=round(os.path.getsize(path) / 2 ** 20, 2),
+                          peak_rss_mb=max(run['peak_rss_mb'] for run in runs))
+            results.append(result)
+            print(f"{file_type:5s}  {description:45s}  {result['file_mb']:7.2f} MB  {result['seconds']:8.3f} s  "
+                  f"peak RSS {result['peak_rss_mb']:7.1f} MB  {result['chars']:10d} chars")
+
+    if args.json:
+        write_report(args.json, 'extractors', results, repeat=args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Measure the logging cost per request before and after moving logging onto a queue.
+
+'legacy' is the old setup: a RotatingFileHandler with maxBytes=10240 and a
+formatting memory handler, both called on the request thread. 'queued' is
+utils.log_pipeline.start_logging with JSON file records. Concurrent threads
+each log the lines of a typical question request; the time spent inside
+logging calls is reported per request. Each variant runs in a fresh
+interpreter.
+
+Usage: python -m benchmarks.bench_logging [--threads 8] [--requests 2000] [--json out.json]
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# The INFO lines a question request logs, roughly
+REQUEST_LINES = [
+    "Question request received",
+    "Processing question for file: {name}",
+    "Content extracted from {name}",
+    "Retrieved 812 of 5120 estimated tokens for prompt",
+    "Prompt has 1024 tokens with 3 recent turns",
+    "Using openai for question answering",
+    "Question answered successfully",
+    "POST /ask 200 in {ms:.1f} ms",
+]
+
+
+def setup_legacy(workdir):
+    from logging.handlers import RotatingFileHandler
+
+    from utils.log_buffer import LogBuffer, MemoryHandler
+
+    logger = logging.getLogger('bench')
+    logger.setLevel(logging.INFO)
+    file_handler = RotatingFileHandler(os.path.join(workdir, 'app.log'), maxBytes=10240, backupCount=10,
+                                       encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+    ))
+    logger.addHandler(file_handler)
+    logger.addHandler(MemoryHandler(LogBuffer(maxlen=1000)))
+    return logger, None
+
+
+def setup_queued(workdir):
+    from utils.log_buffer import LogBuffer, MemoryHandler
+    from utils.log_pipeline import start_logging
+
+    listener = start_logging({'file': os.path.join(workdir, 'app.log')},
+                             extra_handlers=[MemoryHandler(LogBuffer(maxlen=1000))])
+    # Keep the benchmark's own output off stderr
+    listener.handlers = tuple(h for h in listener.handlers if type(h) is not logging.StreamHandler)
+    return logging.getLogger('bench'), listener
+
+
+def run_variant(variant, threads, requests):
+    """Log threads x requests requests with one setup and print timings as JSON."""
+    with tempfile.TemporaryDirectory() as workdir:
+        logger, listener = (setup_legacy if variant == 'legacy' else setup_queued)(workdir)
+        per_request = []
+        lock = threading.Lock()
+
+        def client(index):
+            timings = []
+            for i in range(requests):
+                started = time.perf_counter()
+                for line in REQUEST_LINES:
+                    logger.info(line.format(name=f"file{index}.pdf", ms=i * 0.1))
+                timings.append(time.perf_counter() - started)
+            with lock:
+                per_request.extend(timings)
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        logged = time.perf_counter() - started
+        if listener is not None:
+            listener.stop()
+        drained = time.perf_counter() - started
+
+    per_request.sort()
+
+    def percentile(p):
+        return round(per_request[min(len(per_request) - 1, int(len(per_request) * p))] * 1e6, 1)
+
+    print(json.dumps({
+        'variant': variant,
+        'requests': len(per_request),
+        'p50_us': percentile(0.50),
+        'p95_us': percentile(0.95),
+        'p99_us': percentile(0.99),
+        'caller_seconds': round(logged, 3),
+        'written_seconds': round(drained, 3)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000, help="requests per thread")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--variant', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.threads, args.requests)
+        return
+
+    results = []
+    for variant in ('legacy', 'queued'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_logging', '--variant', variant,
+             '--threads', str(args.threads), '--requests', str(args.requests)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output)
+        results.append(result)
+        print(f"{variant:7s}  per request p50 {result['p50_us']:8.1f} us  p95 {result['p95_us']:8.1f} us  "
+              f"p99 {result['p99_us']:8.1f} us  caller {result['caller_seconds']:.2f} s  "
+              f"written {result['written_seconds']:.2f} s")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'logging', 'threads': args.threads, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
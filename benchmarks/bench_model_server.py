@@ -0,0 +1,153 @@
+"""Memory and throughput of the Llama backend in one process, per worker, and behind a model server.
+
+Three deployments of the same GGUF model are started in turn:
+
+- single:       one uvicorn worker that loads the model itself
+- per-worker:   --workers N, every worker loads its own copy of the model
+- model-server: --workers N with llm.backend 'model_server', plus one
+                model_server.py process that owns the model
+
+Each is driven by benchmarks.load_test's virtual users (upload, then
+questions). Peak total RSS and PSS of all server processes are sampled
+during the run; PSS splits shared pages (the memory-mapped weights)
+between the processes that map them, so it is the fairer total.
+
+Usage: python -m benchmarks.bench_model_server --model-path model.gguf [--workers 4] [--concurrency 8]
+       [--requests 100] [--max-tokens 32] [--json out.json]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+
+from benchmarks.load_test import make_document, run_level
+from benchmarks.report import write_report
+from benchmarks.servers import free_port, start_model_server, start_server, stop_server, write_config
+
+DEPLOYMENTS = ['single', 'per-worker', 'model-server']
+
+
+def process_tree(pid):
+    """pid and all of its descendants (Linux /proc)."""
+    pids = [pid]
+    for tid in os.listdir(f'/proc/{pid}/task'):
+        try:
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                for child in f.read().split():
+                    pids.extend(process_tree(int(child)))
+        except OSError:
+            pass
+    return pids
+
+
+def memory_mb(pids):
+    """Total (RSS, PSS) of pids in MB, from /proc/<pid>/smaps_rollup."""
+    totals = {'Rss:': 0, 'Pss:': 0}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    fields = line.split()
+                    if fields[0] in totals:
+                        totals[fields[0]] += int(fields[1])
+        except OSError:
+            pass  # Exited between listing and reading
+    return round(totals['Rss:'] / 1024, 1), round(totals['Pss:'] / 1024, 1)
+
+
+class MemorySampler(threading.Thread):
+    """Records the peak memory of some process trees until stopped."""
+
+    def __init__(self, processes, interval=0.2):
+        super().__init__(daemon=True)
+        self.processes = processes
+        self.interval = interval
+        self.peak_rss_mb = self.peak_pss_mb = 0
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        pids = [pid for process in self.processes for pid in process_tree(process.pid)]
+        rss, pss = memory_mb(pids)
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        self.peak_pss_mb = max(self.peak_pss_mb, pss)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+
+def deployment_config(deployment, port, model_server_port, args):
+    llama = {'model_path': os.path.abspath(args.model_path), 'context_size': args.context_size, 'device': 'cpu',
+             'pool_size': args.pool_size}
+    llm = {'backend': 'model_server' if deployment == 'model-server' else 'llama', 'llama': llama,
+           'model_server': {'url': f'http://127.0.0.1:{model_server_port}', 'max_concurrency': args.concurrency},
+           'queue': {'max_queue_depth': args.concurrency * 4, 'timeout': 600}}
+    return {
+        'llm': llm,
+        'prompt': {'completion_tokens': args.max_tokens},
+        'cache': {'answers': {'enabled': False}},
+        # Worker processes share sessions through SQLite
+        'session': {'backend': 'sqlite'},
+        'flask': {'host': '127.0.0.1', 'port': port, 'debug': False}
+    }
+
+
+def run_deployment(deployment, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        port, model_server_port = free_port(), free_port()
+        write_config(workdir, deployment_config(deployment, port, model_server_port, args))
+        document = make_document(args.file_type, workdir)
+        processes = []
+        try:
+            if deployment == 'model-server':
+                processes.append(start_model_server(workdir, model_server_port))
+            workers = 1 if deployment == 'single' else args.workers
+            processes.append(start_server('async', workdir, port, workers=workers))
+            sampler = MemorySampler(processes)
+            sampler.start()
+            result = asyncio.run(run_level(f'http://127.0.0.1:{port}', document, args.concurrency, args.requests))
+            sampler.stop()
+        finally:
+            for process in reversed(processes):
+                stop_server(process)
+    return dict(result, deployment=deployment, workers=workers, peak_rss_mb=sampler.peak_rss_mb,
+                peak_pss_mb=sampler.peak_pss_mb)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model-path', required=True, help="GGUF model to serve")
+    parser.add_argument('--deployments', nargs='+', default=DEPLOYMENTS, choices=DEPLOYMENTS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--pool-size', type=int, default=1, help="llm.llama.pool_size of each model owner")
+    parser.add_argument('--context-size', type=int, default=2048)
+    parser.add_argument('--max-tokens', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--file-type', choices=['txt', 'pdf', 'docx', 'xlsx'], default='txt')
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for deployment in args.deployments:
+        result = run_deployment(deployment, args)
+        results.append(result)
+        print(f"{deployment:12s}  {result['workers']:2d} worker(s)  {result['asks_per_s']:8.2f} asks/s  "
+              f"p50 {result['ask']['p50_ms']} ms  p95 {result['ask']['p95_ms']} ms  "
+              f"peak RSS {result['peak_rss_mb']:8.1f} MB  PSS {result['peak_pss_mb']:8.1f} MB  "
+              f"errors {result['errors']}")
+
+    if args.json:
+        write_report(args.json, 'model_server', results, model=os.path.basename(args.model_path),
+                     concurrency=args.concurrency, requests=args.requests, max_tokens=args.max_tokens,
+                     pool_size=args.pool_size, file_type=args.file_type)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Compare serial and process-parallel PDF extraction across page counts.
+
+Usage: python -m benchmarks.bench_pdf [--pages 16 64 256] [--workers N] [--json out.json]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fixtures import write_pdf
+from utils.extract_pdf import extract_pages
+
+
+def time_call(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            path = write_pdf(os.path.join(tmp, f"bench_{pages}.pdf"), pages)
+            serial = time_call(lambda: extract_pages(path, max_workers=1), args.repeat)
+            parallel = time_call(lambda: extract_pages(path, max_workers=args.workers), args.repeat)
+            results.append({
+                'pages': pages,
+                'workers': args.workers,
+                'serial_s': round(serial, 4),
+                'parallel_s': round(parallel, 4),
+                'speedup': round(serial / parallel, 2)
+            })
+            print(f"{pages:6d} pages  serial {serial:8.3f} s  "
+                  f"parallel({args.workers}) {parallel:8.3f} s  speedup {serial / parallel:5.2f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'pdf_extraction', 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Import time and cold-start time of the application per LLM backend.
+
+For each backend, 'import app' is timed in a fresh interpreter in a
+scratch directory with warm-up off, and the heavy optional modules it
+pulled in are listed.
+Then the server is started and polled: the time until /health answers is
+how long the process takes to serve requests, the time until /ready
+answers 200 includes constructing and warming up the backend.
+
+The llama backend needs a GGUF model (--model-path). openai only
+constructs a client, so any API key works.
+
+Usage: python -m benchmarks.bench_startup [--backends fake openai llama] [--model-path model.gguf]
+       [--repeat 5] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.report import write_report
+from benchmarks.servers import REPO_ROOT, free_port, server_env, stop_server, write_config
+
+# Optional modules whose import dominates startup when loaded eagerly
+HEAVY_MODULES = ['openai', 'tiktoken', 'llama_cpp', 'numpy', 'pdfplumber', 'docx', 'openpyxl']
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed,
+                  'modules': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def startup_config(backend, port, args, warm_up):
+    llm = {'backend': backend, 'warm_up': warm_up}
+    if backend == 'openai':
+        llm['openai'] = {'api_key': 'sk-bench'}
+    elif backend == 'llama':
+        llm['llama'] = {'model_path': os.path.abspath(args.model_path), 'context_size': args.context_size,
+                        'device': 'cpu', 'use_mmap': not args.no_mmap}
+    return {'llm': llm, 'flask': {'host': '127.0.0.1', 'port': port, 'debug': False}}
+
+
+def measure_import(workdir):
+    output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], cwd=workdir, env=server_env(),
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def poll(url, until, started, timeout):
+    """Seconds from started until GET url returns a status accepted by until, or None on timeout."""
+    while time.perf_counter() - started < timeout:
+        try:
+            if until(httpx.get(url, timeout=1).status_code):
+                return round(time.perf_counter() - started, 3)
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def measure_cold_start(workdir, port, timeout):
+    """(seconds until /health answers, seconds until /ready is 200) from process start."""
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, 'app.py')], cwd=workdir, env=server_env(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        health = poll(f'http://127.0.0.1:{port}/health', lambda status: status == 200, started, timeout)
+        ready = poll(f'http://127.0.0.1:{port}/ready', lambda status: status == 200, started, timeout)
+        return health, ready
+    finally:
+        stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=['fake', 'openai'], choices=['fake', 'openai', 'llama'])
+    parser.add_argument('--model-path', help="GGUF model for the llama backend")
+    parser.add_argument('--context-size', type=int, default=2048)
+    parser.add_argument('--no-mmap', action='store_true', help="load the llama weights with use_mmap: false")
+    parser.add_argument('--no-warm-up', action='store_true', help="set llm.warm_up: false")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per backend; medians are reported")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+    if 'llama' in args.backends and not args.model_path:
+        parser.error("--model-path is required for the llama backend")
+
+    results = []
+    for backend in args.backends:
+        imports, health, ready = [], [], []
+        with tempfile.TemporaryDirectory() as workdir:
+            port = free_port()
+            for _ in range(args.repeat):
+                # Without warm-up, so no loading thread runs during the import
+                write_config(workdir, startup_config(backend, port, args, warm_up=False))
+                imports.append(measure_import(workdir))
+                write_config(workdir, startup_config(backend, port, args, warm_up=not args.no_warm_up))
+                to_health, to_ready = measure_cold_start(workdir, port, args.timeout)
+                health.append(to_health)
+                ready.append(to_ready)
+        result = {
+            'backend': backend,
+            'import_ms': round(statistics.median(run['seconds'] for run in imports) * 1000, 1),
+            'imported_modules': imports[-1]['modules'],
+            'health_s': statistics.median(health) if None not in health else None,
+            'ready_s': statistics.median(ready) if None not in ready else None
+        }
+        results.append(result)
+        print(f"{backend:7s}  import {result['import_ms']:8.1f} ms  /health after {result['health_s']} s  "
+              f"/ready after {result['ready_s']} s  heavy modules at import: "
+              f"{', '.join(result['imported_modules']) or 'none'}")
+
+    if args.json:
+        write_report(args.json, 'startup', results, repeat=args.repeat, warm_up=not args.no_warm_up,
+                     use_mmap=not args.no_mmap)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Measure vector index build time, peak RSS and query latency across index sizes.
+
+Vectors are random unit vectors, so the numbers cover storage and search
+only; embedding throughput of the hashing embedder is reported separately.
+Each size runs in a fresh interpreter so peak RSS is not shared. The
+chunks are spread over --documents documents (shards), so the cost a
+query pays per document shows up next to the cost per chunk.
+
+Usage: python -m benchmarks.bench_vector [--chunks 10000 100000 1000000] [--documents 1 1000]
+       [--dtype float16 int8] [--json out.json]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import sentence
+from utils.vector_index import HashingEmbedder, VectorIndex, normalize
+
+BATCH_ROWS = 8192
+
+
+class RandomEmbedder:
+    """Embeds every text as a random unit vector."""
+
+    def __init__(self, dim, seed=0):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+
+    def embed(self, texts):
+        return normalize(self.rng.standard_normal((len(texts), self.dim), dtype=np.float32))
+
+
+def random_batches(chunks, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    for start in range(0, chunks, BATCH_ROWS):
+        rows = min(BATCH_ROWS, chunks - start)
+        vectors = normalize(rng.standard_normal((rows, dim), dtype=np.float32))
+        yield vectors, [(f"chunk {start + i}", f"text of chunk {start + i}") for i in range(rows)]
+
+
+def run_size(chunks, documents, dim, dtype, queries, index_dir):
+    """Build and query one index and print time, latency and peak RSS as JSON."""
+    index = VectorIndex(index_dir, RandomEmbedder(dim, seed=1), dtype=dtype)
+    started = time.perf_counter()
+    for document in range(documents):
+        rows = chunks // documents + (1 if document < chunks % documents else 0)
+        index.add_vectors(f'bench-{document}', 'bench', random_batches(rows, dim, seed=document))
+    build_s = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(queries):
+        started = time.perf_counter()
+        index.search("query", top_k=8)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    print(json.dumps({
+        'build_s': round(build_s, 3),
+        'query_ms_p50': round(latencies[len(latencies) // 2], 2),
+        'query_ms_p95': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1),
+        'index_mb': round(sum(os.path.getsize(os.path.join(index_dir, n)) for n in os.listdir(index_dir)) / 2 ** 20, 1)
+    }))
+
+
+def measure(chunks, documents, dim, dtype, queries, index_dir):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_vector', '--run',
+         str(chunks), str(documents), str(dim), dtype, str(queries), index_dir],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def embedding_rate(dim, texts=2000):
+    rng = random.Random(0)
+    # About 200 words per text, the default chunk size
+    samples = [" ".join(sentence(rng, words=20) for _ in range(10)) for _ in range(texts)]
+    started = time.perf_counter()
+    HashingEmbedder(dim).embed(samples)
+    return texts / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--documents', type=int, nargs='+', default=[1, 1000],
+                        help="documents the chunks are spread over")
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--dtype', nargs='+', default=['float16', 'int8'], choices=['float16', 'int8'])
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--run', nargs=6, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        chunks, documents, dim, dtype, queries, index_dir = args.run
+        run_size(int(chunks), int(documents), int(dim), dtype, int(queries), index_dir)
+        return
+
+    rate = embedding_rate(args.dim)
+    print(f"hashing embedder: {rate:,.0f} chunks/s")
+    results = []
+    for chunks in args.chunks:
+        for documents in args.documents:
+            for dtype in args.dtype:
+                with tempfile.TemporaryDirectory() as tmp:
+                    result = dict(measure(chunks, min(documents, chunks), args.dim, dtype, args.queries, tmp),
+                                  chunks=chunks, documents=min(documents, chunks), dtype=dtype)
+                results.append(result)
+                print(f"{chunks:9d} chunks  {result['documents']:6d} docs  {dtype:7s}  "
+                      f"build {result['build_s']:8.3f} s  "
+                      f"query p50 {result['query_ms_p50']:8.2f} ms  p95 {result['query_ms_p95']:8.2f} ms  "
+                      f"peak RSS {result['peak_rss_mb']:7.1f} MB  index {result['index_mb']:7.1f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'vector_index', 'dim': args.dim,
+                       'embedding_chunks_per_s': round(rate, 1), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Synthetic input files for benchmarks and extractor tests."""
+import random
+
+WORDS = (
+    "revenue quarter budget forecast contract invoice supplier customer region "
+    "analysis summary total growth margin report policy schedule project risk "
+    "delivery payment account balance review approval department meeting"
+).split()
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def write_pdf(path, pages, lines_per_page=40, seed=0):
+    """Write a text-only PDF with the given number of pages.
+
+    Uses no PDF library: one Helvetica content stream per page, plus the
+    catalog, page tree, font and cross-reference table.
+    """
+    rng = random.Random(seed)
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    page_ids = []
+    for number in range(pages):
+        page_id, content_id = 4 + 2 * number, 5 + 2 * number
+        lines = [f"Page {number + 1}"] + [sentence(rng) for _ in range(lines_per_page - 1)]
+        stream = "BT /F1 9 Tf 12 TL 40 800 Td " + " ".join(
+            f"({line}) Tj T*" for line in lines
+        ) + " ET"
+        stream = stream.encode('latin-1')
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(page_id)
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+    xref_at = len(out)
+    count = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % count
+    for object_id in range(1, count):
+        out += b"%010d 00000 n \n" % offsets[object_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref_at)
+    with open(path, 'wb') as f:
+        f.write(out)
+    return path
+
+
+def write_xlsx(path, rows, columns=8, sheets=1, seed=0):
+    """Write a workbook of numeric and text cells with openpyxl's streaming writer."""
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    for number in range(sheets):
+        ws = wb.create_sheet(f"Sheet{number + 1}")
+        ws.append([f"Column {column + 1}" for column in range(columns)])
+        for row in range(rows):
+            ws.append([
+                rng.choice(WORDS) if column % 3 == 0 else round(rng.uniform(0, 10000), 2)
+                for column in range(columns)
+            ])
+    wb.save(path)
+    return path
+
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+def write_docx(path, paragraphs, tables=0, rows=100, columns=6, seed=0):
+    """Write a Word document with paragraphs followed by tables of rows x columns cells.
+
+    Writes the WordprocessingML parts directly, which is far faster than
+    python-docx for documents with large tables.
+    """
+    import zipfile
+    from xml.sax.saxutils import escape
+
+    rng = random.Random(seed)
+
+    def paragraph(text):
+        return f'<w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+
+    body = [paragraph(f"Section {number + 1}. {sentence(rng, words=30)}") for number in range(paragraphs)]
+    for _ in range(tables):
+        body.append('<w:tbl><w:tblPr><w:tblW w:w="0" w:type="auto"/></w:tblPr><w:tblGrid>'
+                    + '<w:gridCol w:w="1500"/>' * columns + '</w:tblGrid>')
+        for row in range(rows):
+            cells = [
+                rng.choice(WORDS) if column % 3 == 0 else f"{rng.uniform(0, 10000):.2f}"
+                for column in range(columns)
+            ] if row else [f"Column {column + 1}" for column in range(columns)]
+            body.append('<w:tr>' + ''.join(f'<w:tc>{paragraph(cell)}</w:tc>' for cell in cells) + '</w:tr>')
+        body.append('</w:tbl>')
+    document = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:document xmlns:w="{W_NAMESPACE}">'
+        f'<w:body>{"".join(body)}<w:sectPr/></w:body></w:document>'
+    )
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', DOCX_CONTENT_TYPES)
+        package.writestr('_rels/.rels', DOCX_RELS)
+        package.writestr('word/document.xml', document)
+    return path
+
+
+def write_txt(path, megabytes, seed=0):
+    """Write a plain text file of about the given size, one sentence per line."""
+    rng = random.Random(seed)
+    target = int(megabytes * 2 ** 20)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < target:
+            lines = "\n".join(sentence(rng) for _ in range(1000)) + "\n"
+            f.write(lines)
+            written += len(lines)
+    return path
@@ -0,0 +1,136 @@
+"""Load generator: drive /upload and /ask against the app with the deterministic fake backend.
+
+Starts the server in a scratch directory with llm.backend 'fake', so
+results do not depend on a model or the network. Every virtual user has
+its own session: it uploads a generated file, waits for its ingestion
+job, then asks questions back to back. Latency percentiles and throughput
+are reported per concurrency level.
+
+Usage: python -m benchmarks.load_test [--server sync] [--concurrency 1 4 16] [--requests 200]
+       [--file-type txt] [--token-delay 0.0] [--json out.json]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fixtures import write_docx, write_pdf, write_txt, write_xlsx
+from benchmarks.report import percentiles, write_report
+from benchmarks.servers import free_port, start_server, stop_server, write_config
+
+
+def make_document(file_type, directory):
+    """A mid-sized document of the given type, large enough that questions go through retrieval."""
+    path = os.path.join(directory, f"document.{file_type}")
+    if file_type == 'pdf':
+        write_pdf(path, pages=20)
+    elif file_type == 'docx':
+        write_docx(path, paragraphs=200, tables=2, rows=100)
+    elif file_type == 'xlsx':
+        write_xlsx(path, rows=2000)
+    else:
+        write_txt(path, megabytes=0.25)
+    return path
+
+
+def load_config(port, args):
+    return {
+        'llm': {
+            'backend': 'fake',
+            'fake': {'token_delay': args.token_delay, 'max_concurrency': args.backend_concurrency},
+            'queue': {'max_queue_depth': max(args.concurrency), 'timeout': 120}
+        },
+        'cache': {'answers': {'enabled': args.answer_cache}},
+        'flask': {'host': '127.0.0.1', 'port': port, 'debug': False}
+    }
+
+
+async def virtual_user(base_url, document, counter, stats):
+    """Upload the document in a fresh session, then ask questions until counter runs out."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        started = time.perf_counter()
+        with open(document, 'rb') as f:
+            response = await client.post('/upload', files={'file': (os.path.basename(document), f)})
+        stats['upload'].append(time.perf_counter() - started)
+        if response.status_code != 200:
+            stats['errors'] += 1
+            return
+        job_id = response.json()['job_id']
+        while (await client.get(f'/jobs/{job_id}')).json()['status'] not in ('done', 'failed'):
+            await asyncio.sleep(0.05)
+        stats['ingest'].append(time.perf_counter() - started)
+
+        for i in counter:
+            started = time.perf_counter()
+            response = await client.post('/ask', json={'question': f"What does the document say about item {i}?"})
+            if response.status_code == 200:
+                stats['ask'].append(time.perf_counter() - started)
+            elif response.status_code == 503:
+                stats['rejected'] += 1
+            else:
+                stats['errors'] += 1
+
+
+async def run_level(base_url, document, concurrency, requests):
+    stats = {'upload': [], 'ingest': [], 'ask': [], 'rejected': 0, 'errors': 0}
+    counter = iter(range(requests))
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(base_url, document, counter, stats) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ask_seconds = sum(stats['ask'])
+    return {
+        'concurrency': concurrency,
+        'asks': len(stats['ask']),
+        'asks_per_s': round(len(stats['ask']) / elapsed, 2),
+        'ask': percentiles(stats['ask']),
+        'ask_mean_ms': round(ask_seconds / len(stats['ask']) * 1000, 1) if stats['ask'] else None,
+        'upload': percentiles(stats['upload']),
+        'ingest': percentiles(stats['ingest']),
+        'rejected': stats['rejected'],
+        'errors': stats['errors'],
+        'seconds': round(elapsed, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=['sync', 'async'], default='sync',
+                        help="python app.py or uvicorn asgi:application")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help="questions per concurrency level")
+    parser.add_argument('--file-type', choices=['txt', 'pdf', 'docx', 'xlsx'], default='txt')
+    parser.add_argument('--token-delay', type=float, default=0.0, help="seconds the fake backend takes per word")
+    parser.add_argument('--backend-concurrency', type=int, default=4)
+    parser.add_argument('--answer-cache', action='store_true', help="keep the answer cache enabled")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        write_config(workdir, load_config(port, args))
+        document = make_document(args.file_type, workdir)
+        server = start_server(args.server, workdir, port)
+        try:
+            for concurrency in args.concurrency:
+                result = asyncio.run(run_level(f'http://127.0.0.1:{port}', document, concurrency, args.requests))
+                results.append(result)
+                ask = result['ask']
+                print(f"concurrency {concurrency:4d}  {result['asks_per_s']:8.2f} asks/s  "
+                      f"p50 {ask['p50_ms']} ms  p95 {ask['p95_ms']} ms  p99 {ask['p99_ms']} ms  "
+                      f"upload p50 {result['upload']['p50_ms']} ms  rejected {result['rejected']}  "
+                      f"errors {result['errors']}")
+        finally:
+            stop_server(server)
+
+    if args.json:
+        write_report(args.json, 'load_test', results, server=args.server, requests=args.requests,
+                     file_type=args.file_type, token_delay=args.token_delay,
+                     backend_concurrency=args.backend_concurrency, answer_cache=args.answer_cache)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""A local OpenAI-compatible chat completions server for tests and load tests.
+
+Answers every request after a fixed latency, optionally streaming tokens
+with a delay between them, and can answer the first requests with 429 to
+exercise client retries. Nothing is sent to OpenAI.
+
+Usage: python -m benchmarks.mock_openai [--port 8100] [--latency 0.5] [--token-delay 0.0]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+def create_app(latency=0.0, token_delay=0.0, tokens=20, rate_limit_first=0):
+    """Build the mock server; the first rate_limit_first requests get a 429."""
+    counter = itertools.count(1)
+    state = {'requests': 0, 'rate_limited': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    async def chat_completions(request):
+        body = await request.json()
+        number = next(counter)
+        state['requests'] += 1
+        if number <= rate_limit_first:
+            state['rate_limited'] += 1
+            return JSONResponse(
+                {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                status_code=429, headers={'retry-after': '0'}
+            )
+        state['in_flight'] += 1
+        state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            state['in_flight'] -= 1
+        words = [f"word{i}" for i in range(tokens)]
+        created = int(time.time())
+        if not body.get('stream'):
+            return JSONResponse({
+                'id': f'chatcmpl-{number}', 'object': 'chat.completion', 'created': created, 'model': body['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': " ".join(words)}}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': tokens, 'total_tokens': tokens}
+            })
+
+        async def events():
+            for i, word in enumerate(words):
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+                chunk = {'id': f'chatcmpl-{number}', 'object': 'chat.completion.chunk', 'created': created,
+                         'model': body['model'],
+                         'choices': [{'index': 0, 'delta': {'content': word if i == 0 else f" {word}"},
+                                      'finish_reason': None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type='text/event-stream')
+
+    async def stats(request):
+        return JSONResponse(state)
+
+    app = Starlette(routes=[
+        Route('/v1/chat/completions', chat_completions, methods=['POST']),
+        Route('/stats', stats)
+    ])
+    app.state.mock = state
+    return app
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds before each answer")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument('--tokens', type=int, default=20)
+    parser.add_argument('--rate-limit-first', type=int, default=0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.token_delay, args.tokens, args.rate_limit_first),
+                host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""JSON result files that can be compared across commits."""
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.servers import REPO_ROOT
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentiles(values, points=(0.50, 0.95, 0.99)):
+    """Nearest-rank percentiles of values in milliseconds, keyed p50_ms, p95_ms, ..."""
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{round(p * 100)}_ms": None for p in points}
+    return {
+        f"p{round(p * 100)}_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 1)
+        for p in points
+    }
+
+
+def write_report(path, benchmark, results, **settings):
+    """Write results with the commit, interpreter and settings they were measured with."""
+    report = {
+        'benchmark': benchmark,
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'settings': settings,
+        'results': results
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,74 @@
+"""Start the application as a subprocess in a scratch directory for load tests."""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def write_config(workdir, config):
+    with open(os.path.join(workdir, 'config.yaml'), 'w') as f:
+        yaml.safe_dump(config, f)
+
+
+def server_env():
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+
+
+def start_server(kind, workdir, port, workers=1):
+    """Run 'sync' (python app.py, port from config.yaml) or 'async' (uvicorn asgi:application) in workdir.
+
+    workers > 1 runs that many uvicorn worker processes ('async' only).
+    """
+    if kind == 'sync':
+        command = [sys.executable, os.path.join(REPO_ROOT, 'app.py')]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--app-dir', REPO_ROOT,
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning', '--workers', str(workers)]
+    return start_process(command, workdir, port)
+
+
+def start_model_server(workdir, port):
+    """Run model_server.py in workdir; llm.model_server.url in its config.yaml must use port."""
+    return start_process([sys.executable, os.path.join(REPO_ROOT, 'model_server.py')], workdir, port)
+
+
+def start_process(command, workdir, port):
+    process = subprocess.Popen(command, cwd=workdir, env=server_env(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
@@ -0,0 +1,180 @@
+"""Local model server: one process owns the Llama model for every app worker.
+
+Run app.py (or asgi.py) in as many worker processes as there are cores
+with llm.backend 'model_server'; they forward generation to this process,
+which loads the GGUF model from the llm.llama section of config.yaml once
+and schedules every worker's requests over its pool of contexts. The API
+is the OpenAI one (/v1/completions, /v1/chat/completions, /v1/models),
+plus /tokenize, /stats, /health and /ready.
+
+Run with: python model_server.py   (listens on llm.model_server.url)
+     or:  uvicorn model_server:application --uds /tmp/fileqa-model.sock
+"""
+import json
+import logging
+import time
+import uuid
+from contextlib import aclosing, asynccontextmanager
+from logging.handlers import QueueHandler
+from urllib.parse import urlparse
+
+import yaml
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from utils.async_backends import iterate_in_thread
+from utils.llm_backends import create_backend
+from utils.log_pipeline import start_logging
+
+logger = logging.getLogger('model_server')
+
+with open('config.yaml', 'r') as f:
+    config = yaml.safe_load(f)
+
+# Always the in-process Llama backend, whatever the app workers are configured with
+llama_config = dict(config['llm'], backend='llama')
+llm_backend = create_backend(llama_config, lazy=True)
+# Requests without max_tokens may fill the rest of the context
+default_max_tokens = llama_config['llama'].get('max_tokens')
+
+
+def chat_prompt(messages):
+    """The prompt text of a chat request: the message contents, in order."""
+    return "\n\n".join(message.get('content') or '' for message in messages)
+
+
+def completion_chunk(completion_id, chat, text, finish_reason=None):
+    if chat:
+        return {'id': completion_id, 'object': 'chat.completion.chunk', 'model': llm_backend.model_name,
+                'choices': [{'index': 0, 'delta': {'content': text} if text else {},
+                             'finish_reason': finish_reason}]}
+    return {'id': completion_id, 'object': 'text_completion', 'model': llm_backend.model_name,
+            'choices': [{'index': 0, 'text': text, 'finish_reason': finish_reason}]}
+
+
+async def generate(request, chat):
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({'error': {'message': 'Invalid JSON body'}}, status_code=400)
+    prompt = chat_prompt(body.get('messages') or []) if chat else body.get('prompt')
+    if not isinstance(prompt, str):
+        return JSONResponse({'error': {'message': 'prompt must be a string'}}, status_code=400)
+    max_tokens = body.get('max_tokens') or default_max_tokens
+    # cache_key is an extension: requests with the same key reuse the saved context state
+    cache_key = body.get('cache_key')
+    try:
+        backend = await run_in_threadpool(llm_backend.get)
+    except Exception as e:
+        return JSONResponse({'error': {'message': f"Model not loaded: {str(e)}"}}, status_code=503)
+
+    completion_id = f"cmpl-{uuid.uuid4().hex}"
+    timings = {}
+    tokens = backend.scheduler.generate(prompt, max_tokens, cache_key=cache_key, timings=timings)
+
+    if body.get('stream'):
+        async def events():
+            # Closing the scheduler's generator frees the context when the client goes away mid-answer
+            async with aclosing(iterate_in_thread(tokens)) as texts:
+                async for text in texts:
+                    yield f"data: {json.dumps(completion_chunk(completion_id, chat, text))}\n\n"
+            final = completion_chunk(completion_id, chat, '', finish_reason='stop')
+            final['timings'] = timings
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type='text/event-stream')
+
+    parts = [text async for text in iterate_in_thread(tokens)]
+    text = "".join(parts)
+    choice = {'index': 0, 'finish_reason': 'stop'}
+    if chat:
+        choice['message'] = {'role': 'assistant', 'content': text}
+    else:
+        choice['text'] = text
+    prompt_tokens = timings.get('prompt_tokens', 0)
+    return JSONResponse({
+        'id': completion_id,
+        'object': 'chat.completion' if chat else 'text_completion',
+        'created': int(time.time()),
+        'model': llm_backend.model_name,
+        'choices': [choice],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(parts),
+                  'total_tokens': prompt_tokens + len(parts)},
+        'timings': timings
+    })
+
+
+async def completions(request):
+    return await generate(request, chat=False)
+
+
+async def chat_completions(request):
+    return await generate(request, chat=True)
+
+
+async def models(request):
+    return JSONResponse({'object': 'list', 'data': [{'id': llm_backend.model_name, 'object': 'model',
+                                                      'owned_by': 'local'}]})
+
+
+async def tokenize(request):
+    """Number of tokens of {"content": ...} with the model's vocabulary"""
+    body = await request.json()
+    try:
+        count = await run_in_threadpool(llm_backend.count_tokens, body.get('content') or '')
+    except Exception as e:
+        return JSONResponse({'error': {'message': f"Model not loaded: {str(e)}"}}, status_code=503)
+    return JSONResponse({'count': count})
+
+
+async def stats(request):
+    return JSONResponse(llm_backend.stats())
+
+
+async def health(request):
+    return JSONResponse({'status': 'ok'})
+
+
+async def ready(request):
+    status = llm_backend.status()
+    return JSONResponse(status, status_code=200 if status['state'] == 'ready' else 503)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Unless the process has set up logging already, e.g. the test suite importing app.py
+    log_listener = None
+    if not any(isinstance(handler, QueueHandler) for handler in logging.getLogger().handlers):
+        log_listener = start_logging(dict(config.get('logging') or {}, file='logs/model_server.log'))
+    logger.info(f"Model server starting, loading {llm_backend.model_name}")
+    llm_backend.start_warm_up()
+    yield
+    if log_listener is not None:
+        log_listener.stop()
+
+
+application = Starlette(
+    routes=[
+        Route('/v1/completions', completions, methods=['POST']),
+        Route('/v1/chat/completions', chat_completions, methods=['POST']),
+        Route('/v1/models', models, methods=['GET']),
+        Route('/tokenize', tokenize, methods=['POST']),
+        Route('/stats', stats, methods=['GET']),
+        Route('/health', health, methods=['GET']),
+        Route('/ready', ready, methods=['GET']),
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    url = (config['llm'].get('model_server') or {}).get('url', 'http://127.0.0.1:8001')
+    if url.startswith('unix:'):
+        uvicorn.run(application, uds=url[len('unix:'):], log_level='warning')
+    else:
+        address = urlparse(url)
+        uvicorn.run(application, host=address.hostname, port=address.port or 80, log_level='warning')
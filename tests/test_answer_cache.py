@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+from utils.answer_cache import AnswerCache, normalize_question
+
+class TestAnswerCache(unittest.TestCase):
+    def setUp(self):
+        self.scope = AnswerCache.scope('abc123-txt-v1', 'fake', 'fake', [])
+
+    def test_normalized_question_hits(self):
+        """Test that case, punctuation and spacing do not defeat the cache"""
+        cache = AnswerCache()
+        cache.put(self.scope, 'Summarize this document.', 'A summary.')
+        self.assertEqual(cache.get(self.scope, '  summarize THIS document?'), 'A summary.')
+        self.assertEqual(normalize_question('What is  the total?'), 'what is the total')
+        self.assertEqual(cache.stats()['hits'], 1)
+        print("Normalized question test passed!")
+
+    def test_scope_separates_documents_and_history(self):
+        """Test that a different document or history is a miss"""
+        cache = AnswerCache()
+        cache.put(self.scope, 'Summarize this document.', 'A summary.')
+        other_doc = AnswerCache.scope('def456-txt-v1', 'fake', 'fake', [])
+        with_history = AnswerCache.scope('abc123-txt-v1', 'fake', 'fake', [('Hi?', 'Hello.')])
+        self.assertIsNone(cache.get(other_doc, 'Summarize this document.'))
+        self.assertIsNone(cache.get(with_history, 'Summarize this document.'))
+        self.assertEqual(cache.stats()['misses'], 2)
+        print("Cache scope test passed!")
+
+    def test_ttl_and_lru_eviction(self):
+        """Test that entries expire after the TTL and the cache stays bounded"""
+        cache = AnswerCache(max_entries=2, ttl=10)
+        with mock.patch('utils.answer_cache.time.monotonic', return_value=100.0):
+            for question in ('one', 'two', 'three'):
+                cache.put(self.scope, question, question.upper())
+            self.assertIsNone(cache.get(self.scope, 'one'))
+            self.assertEqual(cache.get(self.scope, 'three'), 'THREE')
+        with mock.patch('utils.answer_cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get(self.scope, 'three'))
+        print("TTL and LRU test passed!")
+
+    def test_near_duplicate_mode(self):
+        """Test that near-duplicate questions hit only when enabled"""
+        exact = AnswerCache()
+        near = AnswerCache(near_duplicate=True, similarity_threshold=0.7)
+        for cache in (exact, near):
+            cache.put(self.scope, 'what is the total in sheet revenue', '42')
+        self.assertIsNone(exact.get(self.scope, 'what is the total in the sheet revenue'))
+        self.assertEqual(near.get(self.scope, 'what is the total in the sheet revenue'), '42')
+        self.assertEqual(near.stats()['near_duplicate_hits'], 1)
+        print("Near-duplicate test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+from unittest import mock
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+import httpx
+from starlette.requests import Request
+from starlette.testclient import TestClient
+import asgi
+from benchmarks.mock_openai import create_app
+from utils.async_backends import AsyncOpenAIBackend, LazyAsyncBackend, ThreadedAsyncBackend
+from utils.llm_backends import FakeBackend
+
+def mock_openai_backend(**options):
+    """AsyncOpenAIBackend talking to the in-process mock server instead of the network."""
+    mock_app = create_app(**options)
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_app))
+    backend = AsyncOpenAIBackend('sk-test', base_url='http://mock/v1', http_client=http_client,
+                                 backoff_base=0.01, backoff_max=0.05)
+    return backend, mock_app.state.mock
+
+class TestAsyncServer(unittest.TestCase):
+    def setUp(self):
+        os.makedirs('data', exist_ok=True)
+        # The lifespan would warm up the configured backend; the tests bring their own
+        patcher = mock.patch.object(asgi.flask_app, 'start_up')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree('data', ignore_errors=True)
+
+    def test_ask_routes(self):
+        """Test that the async routes answer and share the session with the mounted Flask routes"""
+        backend = ThreadedAsyncBackend(FakeBackend(answer='An async answer.'))
+        with mock.patch.object(asgi, 'async_backend', backend), TestClient(asgi.application) as client:
+            session_id = client.get('/session').json()['session_id']
+            os.makedirs(os.path.join('data', session_id), exist_ok=True)
+            with open(os.path.join('data', session_id, 'async.txt'), 'w') as f:
+                f.write('A document for the async server.')
+
+            response = client.post('/ask', json={'question': 'What is this?'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['answer'], 'An async answer.')
+
+            response = client.post('/ask/stream', json={'question': 'And now?'})
+            events = [e for e in response.text.split('\n\n') if e]
+            self.assertTrue(events[-1].startswith('event: done'))
+            self.assertEqual(json.loads(events[-1].split('data: ', 1)[1])['answer'], 'An async answer.')
+            self.assertEqual(client.get('/session').json()['turns'], 2)
+            self.assertEqual(client.get('/queue').json()['active'], 0)
+        print("Async routes test passed!")
+
+    def test_logs_stream_is_served_async(self):
+        """Test that /logs/stream is a native async route that pushes new lines"""
+        route = next(r for r in asgi.application.routes if getattr(r, 'path', None) == '/logs/stream')
+        self.assertIs(route.endpoint, asgi.stream_logs)
+        last_seq = asgi.flask_app.log_buffer.last_seq
+        asgi.flask_app.logger.error("async streamed line")
+        asgi.flask_app.log_listener.flush()
+
+        def request(query, headers=()):
+            return Request({'type': 'http', 'method': 'GET', 'path': '/logs/stream', 'query_string': query,
+                            'headers': [(k.lower().encode(), v.encode()) for k, v in headers]})
+
+        async def first_message():
+            response = await asgi.stream_logs(request(b'level=ERROR', [('Last-Event-ID', str(last_seq))]))
+            self.assertEqual(response.media_type, 'text/event-stream')
+            try:
+                return await anext(response.body_iterator)
+            finally:
+                await response.body_iterator.aclose()
+
+        message = asyncio.run(first_message())
+        self.assertGreater(int(message.split('\n')[0][len('id: '):]), last_seq)
+        self.assertIn("async streamed line", message)
+        response = asyncio.run(asgi.stream_logs(request(b'level=LOUD')))
+        self.assertEqual(response.status_code, 400)
+        print("Async logs stream test passed!")
+
+    def test_stream_closes_backend_generator_on_disconnect(self):
+        """Test that a stream cancelled mid-token still closes the backend generator"""
+        closed = threading.Event()
+
+        class SlowBackend(FakeBackend):
+            def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+                try:
+                    for i in range(100):
+                        time.sleep(0.05)
+                        yield f"t{i}"
+                finally:
+                    closed.set()
+
+        backend = ThreadedAsyncBackend(SlowBackend())
+
+        async def run():
+            async def consume():
+                async for _ in backend.stream('Hello?'):
+                    pass
+
+            task = asyncio.create_task(consume())
+            # Cancel while a worker thread is inside next()
+            await asyncio.sleep(0.12)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        self.assertTrue(closed.wait(timeout=2))
+        print("Stream disconnect test passed!")
+
+    def test_openai_backend_retries_rate_limits(self):
+        """Test that rate-limited requests are retried with backoff and streams complete"""
+        backend, state = mock_openai_backend(tokens=5, rate_limit_first=2)
+
+        async def run():
+            answer = await backend.complete('Hello?')
+            tokens = [token async for token in backend.stream('Hello again?')]
+            await backend.aclose()
+            return answer, tokens
+
+        answer, tokens = asyncio.run(run())
+        self.assertEqual(answer, 'word0 word1 word2 word3 word4')
+        self.assertEqual(''.join(tokens), answer)
+        self.assertEqual(backend.stats(), {'rate_limited': 2, 'retries': 2})
+        self.assertEqual(state['requests'], 4)
+        print("Async OpenAI retry test passed!")
+
+    def test_openai_requests_run_concurrently(self):
+        """Test that concurrent questions overlap instead of running one at a time"""
+        backend, state = mock_openai_backend(latency=0.2, tokens=3)
+
+        async def run():
+            answers = await asyncio.gather(*(backend.complete(f'Question {i}') for i in range(10)))
+            await backend.aclose()
+            return answers
+
+        answers = asyncio.run(run())
+        self.assertEqual(len(answers), 10)
+        self.assertEqual(state['max_in_flight'], 10)
+        print("Async concurrency test passed!")
+
+    def test_lazy_openai_backend_is_built_on_first_use(self):
+        """Test that the lazy OpenAI backend constructs its client only when first used"""
+        factory = mock.Mock(side_effect=lambda: mock_openai_backend(tokens=2)[0])
+        backend = LazyAsyncBackend(factory, 'openai', model_name='gpt-test')
+        self.assertEqual((backend.name, backend.model_name, backend.stats()), ('openai', 'gpt-test', {}))
+        factory.assert_not_called()
+
+        async def run():
+            answer = await backend.complete('Hello?')
+            tokens = [token async for token in backend.stream('Hello again?')]
+            await backend.aclose()
+            return answer, tokens
+
+        answer, tokens = asyncio.run(run())
+        self.assertEqual(answer, 'word0 word1')
+        self.assertEqual(''.join(tokens), answer)
+        factory.assert_called_once()
+        print("Lazy async backend test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
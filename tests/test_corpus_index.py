@@ -0,0 +1,115 @@
+import unittest
+from unittest import mock
+import os
+import shutil
+import sqlite3
+import tempfile
+from utils.corpus_index import CorpusIndex, build_match_query
+from utils.segments import make_segments
+
+class TestCorpusIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'corpus.sqlite3')
+        self.index = CorpusIndex(self.db_path, chunk_size=20, overlap=5)
+        filler = " ".join(f"filler{i}" for i in range(60))
+        self.index.add_document('report.pdf', 'key-report', make_segments([
+            ('page', filler, 'page 1'),
+            ('page', 'The quarterly revenue was 42 million dollars.', 'page 2'),
+        ]))
+        self.index.add_document('notes.txt', 'key-notes', make_segments([
+            ('lines', f'The office cat is named Biscuit. {filler}', 'lines 1-3'),
+        ]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_search_across_files_with_sources(self):
+        """Test that passages are ranked across files and cite their source"""
+        results = self.index.search("What was the quarterly revenue?", top_k=3)
+        self.assertEqual((results[0]['file'], results[0]['source']), ('report.pdf', 'page 2'))
+        self.assertIn('42 million', results[0]['text'])
+        results = self.index.search("What is the cat named?", top_k=3)
+        self.assertEqual(results[0]['file'], 'notes.txt')
+        self.assertEqual(self.index.search("what is the"), [])
+        print("Corpus search test passed!")
+
+    def test_index_persists_and_updates(self):
+        """Test that the index survives a restart and replaces changed documents"""
+        reopened = CorpusIndex(self.db_path, chunk_size=20, overlap=5)
+        self.assertTrue(reopened.has_document('report.pdf', 'key-report'))
+        self.assertFalse(reopened.has_document('report.pdf', 'key-changed'))
+
+        reopened.add_document('report.pdf', 'key-changed', make_segments([('page', 'Costs fell sharply.', 'page 1')]))
+        self.assertEqual(reopened.search("quarterly revenue"), [])
+        self.assertEqual(reopened.search("costs")[0]['file'], 'report.pdf')
+
+        reopened.remove_document('notes.txt')
+        self.assertEqual(reopened.document_names(), ['report.pdf'])
+        reopened.clear()
+        self.assertEqual(reopened.document_names(), [])
+        print("Corpus persistence test passed!")
+
+    def test_copy_document_with_same_content(self):
+        """Test that a file with already indexed content copies its chunks"""
+        self.assertFalse(self.index.copy_document('other.txt', 'key-unknown'))
+        self.assertTrue(self.index.copy_document('copy.pdf', 'key-report'))
+        self.assertTrue(self.index.has_document('copy.pdf', 'key-report'))
+        files = {result['file'] for result in self.index.search("quarterly revenue", top_k=5)}
+        self.assertEqual(files, {'report.pdf', 'copy.pdf'})
+        print("Corpus copy test passed!")
+
+    def test_documents_are_removed_by_rowid_range(self):
+        """Test that removing or replacing a document deletes exactly its chunks, and names list by prefix"""
+        self.index.copy_document('s1/copy.pdf', 'key-report')
+        self.index.add_document('s1/other.txt', 'key-other', make_segments([('lines', 'Harbour fees rose.', 'l 1')]))
+        self.index.add_document('s10/far.txt', 'key-far', make_segments([('lines', 'Harbour tolls.', 'l 1')]))
+        self.assertEqual(self.index.document_names('s1/'), ['s1/copy.pdf', 's1/other.txt'])
+
+        self.index.remove_document('report.pdf')
+        self.assertEqual({r['file'] for r in self.index.search("quarterly revenue")}, {'s1/copy.pdf'})
+        self.index.add_document('s1/other.txt', 'key-other2', make_segments([('lines', 'Harbour closed.', 'l 1')]))
+        self.assertEqual(sorted(r['text'] for r in self.index.search("harbour")), ['Harbour closed.', 'Harbour tolls.'])
+        chunks = self.index._connection().execute("SELECT count(*) FROM chunks").fetchone()[0]
+        counts = self.index._connection().execute("SELECT sum(chunk_count) FROM documents").fetchone()[0]
+        self.assertEqual(chunks, counts)
+        print("Corpus rowid range test passed!")
+
+    def test_connection_is_reused(self):
+        """Test that queries reuse the thread's connection and reopen it when the file is replaced"""
+        self.index.search("revenue")
+        with mock.patch('utils.corpus_index.sqlite3.connect', wraps=sqlite3.connect) as connect:
+            for _ in range(3):
+                self.index.search("revenue")
+                self.index.has_document('report.pdf', 'key-report')
+            self.assertEqual(connect.call_count, 0)
+            shutil.rmtree(self.tmp_dir)
+            self.assertEqual(self.index.document_names(), [])
+        self.index.add_document('new.txt', 'key-new', make_segments([('lines', 'Fresh content.', 'lines 1')]))
+        self.assertEqual(self.index.search("fresh")[0]['file'], 'new.txt')
+        print("Corpus connection test passed!")
+
+    def test_search_is_limited_to_a_scope(self):
+        """Test that a directory prefix only matches that directory's chunks, and old indexes are rebuilt"""
+        for session in ('alice', 'bob'):
+            self.index.add_document(f'{session}/plan.txt', f'key-{session}',
+                                    make_segments([('lines', f'The budget of {session} is tight.', 'lines 1')]))
+        self.assertEqual([r['file'] for r in self.index.search("budget", prefix='alice/')], ['alice/plan.txt'])
+        self.assertEqual(self.index.search("quarterly revenue", prefix='alice/'), [])
+        self.assertEqual(len(self.index.search("budget")), 2)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.close()
+        reopened = CorpusIndex(self.db_path)
+        self.assertEqual(reopened.document_names(), [])
+        print("Corpus scope test passed!")
+
+    def test_match_query_quotes_terms(self):
+        """Test that question punctuation cannot break the FTS5 query syntax"""
+        self.assertEqual(build_match_query('Revenue "AND" (costs)?'), '"revenue" OR "costs"')
+        print("Match query test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+import shutil
+from utils.extraction_cache import ExtractionCache
+from utils.extract_txt import extract_text as extract_txt
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = 'test_cache_data'
+        self.cache_dir = os.path.join(self.test_dir, '.cache')
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.file_path = os.path.join(self.test_dir, 'doc.txt')
+        with open(self.file_path, 'w', encoding='utf-8') as f:
+            f.write('First version of the document.')
+
+        self.calls = 0
+        def counting_extractor(file_path):
+            self.calls += 1
+            return extract_txt(file_path)
+        counting_extractor.__module__ = extract_txt.__module__
+        self.extractor = counting_extractor
+
+    def test_repeated_lookups_extract_once(self):
+        """Test that a cached file is only parsed once"""
+        cache = ExtractionCache(self.cache_dir)
+        first = cache.get_text(self.file_path, self.extractor)
+        second = cache.get_text(self.file_path, self.extractor)
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+        print("Repeated lookup test passed!")
+
+    def test_disk_store_survives_restart(self):
+        """Test that a fresh cache instance reads entries back from disk"""
+        ExtractionCache(self.cache_dir).get_text(self.file_path, self.extractor)
+        content = ExtractionCache(self.cache_dir).get_text(self.file_path, self.extractor)
+        self.assertIn('First version', content)
+        self.assertEqual(self.calls, 1)
+        print("Disk store test passed!")
+
+    def test_overwrite_invalidates(self):
+        """Test that overwriting a file returns the new content"""
+        cache = ExtractionCache(self.cache_dir)
+        cache.get_text(self.file_path, self.extractor)
+        cache.invalidate(self.file_path)
+        with open(self.file_path, 'w', encoding='utf-8') as f:
+            f.write('Second version of the document.')
+        content = cache.get_text(self.file_path, self.extractor)
+        self.assertIn('Second version', content)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        print("Invalidation test passed!")
+
+    def test_lru_is_bounded(self):
+        """Test that the in-memory cache evicts least recently used entries"""
+        cache = ExtractionCache(self.cache_dir, max_entries=2)
+        for i in range(4):
+            path = os.path.join(self.test_dir, f'doc{i}.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f'Document number {i}')
+            cache.get_text(path, self.extractor)
+        self.assertEqual(len(cache._entries), 2)
+        print("LRU bound test passed!")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+if __name__ == '__main__':
+    unittest.main()
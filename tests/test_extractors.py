@@ -1,11 +1,19 @@
 import unittest
 import os
 import sys
+import io
 import traceback
+import zipfile
 from utils.extract_txt import extract_text as extract_txt
 from utils.extract_pdf import extract_text as extract_pdf
 from utils.extract_docx import extract_text as extract_docx
 from utils.extract_excel import extract_text as extract_excel
+from utils import extract_pdf as pdf_module
+from utils.extract_pdf import extract_pages, extract_text_with_offsets
+from benchmarks.fixtures import DOCX_CONTENT_TYPES, DOCX_RELS, W_NAMESPACE, write_docx, write_pdf
+from openpyxl import Workbook
+from utils.extractors import get_file_extractor, get_segment_iterator
+from utils.segments import SegmentStreamError, fan_out, join_segments, make_segments, recording
 
 class TestFileExtractors(unittest.TestCase):
     def setUp(self):
@@ -46,36 +54,188 @@ class TestFileExtractors(unittest.TestCase):
     def test_pdf_extractor(self):
         """Test the PDF file extractor"""
         try:
-            # This is a placeholder - you'll need to add a test PDF file
-            print("PDF extractor test skipped - no test file available")
+            file_path = write_pdf(os.path.join(self.test_dir, 'test.pdf'), pages=3, lines_per_page=5)
+            print(f"Testing PDF extractor with file: {file_path}")
+
+            content = extract_pdf(file_path)
+            self.assertIsInstance(content, str)
+            self.assertIn('Page 1', content)
+            self.assertIn('Page 3', content)
+
+            text, offsets = extract_text_with_offsets(file_path)
+            self.assertEqual(text, content)
+            self.assertEqual(len(offsets), 3)
+            self.assertTrue(text[offsets[1]:].startswith('Page 2'))
+            print("PDF extractor test passed!")
         except Exception as e:
             print(f"Error in test_pdf_extractor: {str(e)}")
             print("Traceback:")
             traceback.print_exc()
             raise
 
+    def test_pdf_parallel_extraction(self):
+        """Test that process-parallel PDF extraction keeps page order"""
+        try:
+            file_path = write_pdf(os.path.join(self.test_dir, 'large.pdf'), pages=20, lines_per_page=3)
+            serial = extract_pages(file_path, max_workers=1)
+            parallel = extract_pages(file_path, max_workers=3)
+            self.assertEqual(len(parallel), 20)
+            self.assertEqual(parallel, serial)
+            self.assertTrue(parallel[19].startswith('Page 20'))
+
+            # The pool is started once, without forking this threaded process, and reused
+            pool = pdf_module._pools[3]
+            self.assertIn(pool._mp_context.get_start_method(), ('forkserver', 'spawn'))
+            self.assertEqual(extract_pages(file_path, max_workers=3), serial)
+            self.assertIs(pdf_module._pools[3], pool)
+            print("PDF parallel extraction test passed!")
+        except Exception as e:
+            print(f"Error in test_pdf_parallel_extraction: {str(e)}")
+            print("Traceback:")
+            traceback.print_exc()
+            raise
+
     def test_docx_extractor(self):
         """Test the DOCX file extractor"""
         try:
-            # This is a placeholder - you'll need to add a test DOCX file
-            print("DOCX extractor test skipped - no test file available")
+            file_path = write_docx(os.path.join(self.test_dir, 'test.docx'), paragraphs=3, tables=1, rows=4,
+                                   columns=3)
+            text = extract_docx(file_path)
+            self.assertTrue(text.startswith("Section 1. "))
+            self.assertIn("Section 3. ", text)
+            self.assertIn("Column 1\tColumn 2\tColumn 3", text)
+            segments = list(get_segment_iterator(file_path)(file_path))
+            self.assertEqual([s.kind for s in segments].count('table_row'), 4)
+            print("DOCX extractor test passed!")
         except Exception as e:
             print(f"Error in test_docx_extractor: {str(e)}")
             print("Traceback:")
             traceback.print_exc()
             raise
 
+    def test_docx_order_and_merged_cells(self):
+        """Test that DOCX blocks keep document order and merged cells are not repeated"""
+        def cell(text, properties=''):
+            return f'<w:tc><w:tcPr>{properties}</w:tcPr><w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:tc>'
+        body = (
+            '<w:p><w:r><w:t>Before the table.</w:t></w:r></w:p>'
+            '<w:tbl><w:tr>' + cell('Region', '<w:vMerge w:val="restart"/>')
+            + cell('Q1 and Q2', '<w:gridSpan w:val="2"/>') + cell('Total') + '</w:tr>'
+            '<w:tr>' + cell('', '<w:vMerge/>') + cell('10') + cell('20') + cell('30') + '</w:tr></w:tbl>'
+            '<w:p><w:r><w:t>After</w:t><w:tab/><w:t>the table.</w:t></w:r></w:p>'
+            '<w:p><mc:AlternateContent xmlns:mc="urn:mc"><mc:Choice/><mc:Fallback><w:r><w:t>Duplicate</w:t></w:r>'
+            '</mc:Fallback></mc:AlternateContent></w:p>'
+        )
+        file_path = os.path.join(self.test_dir, 'merged.docx')
+        with zipfile.ZipFile(file_path, 'w') as package:
+            package.writestr('[Content_Types].xml', DOCX_CONTENT_TYPES)
+            package.writestr('_rels/.rels', DOCX_RELS)
+            package.writestr('word/document.xml', f'<w:document xmlns:w="{W_NAMESPACE}"><w:body>{body}</w:body></w:document>')
+
+        segments = list(get_segment_iterator(file_path)(file_path))
+        self.assertEqual([(s.kind, s.text, s.source) for s in segments], [
+            ('paragraph', 'Before the table.', 'paragraph 1'),
+            ('table_row', 'Region\tQ1 and Q2\t\tTotal', 'table 1 row 1'),
+            ('table_row', '\t10\t20\t30', 'table 1 row 2'),
+            ('paragraph', 'After\tthe table.', 'paragraph 2'),
+        ])
+        print("DOCX order and merged cells test passed!")
+
     def test_excel_extractor(self):
         """Test the Excel file extractor"""
         try:
-            # This is a placeholder - you'll need to add a test Excel file
-            print("Excel extractor test skipped - no test file available")
+            file_path = os.path.join(self.test_dir, 'test.xlsx')
+            wb = Workbook()
+            ws = wb.active
+            ws.title = 'Totals'
+            ws.append(['Item', 'Amount'])
+            ws.append(['Rent', 1200.0])
+            ws.append([None, None])
+            ws.append(['Power', 85.5, None])
+            for i in range(10):
+                ws.append([f'Extra {i}', i])
+            wb.save(file_path)
+            print(f"Testing Excel extractor with file: {file_path}")
+
+            content = extract_excel(file_path)
+            lines = content.splitlines()
+            self.assertEqual(lines[0], '## Sheet: Totals')
+            self.assertEqual(lines[1:4], ['Item\tAmount', 'Rent\t1200', 'Power\t85.5'])
+
+            limited = extract_excel(file_path, max_rows=3)
+            self.assertNotIn('Extra 0', limited)
+            self.assertIn('truncated after 3 rows', limited)
+            print("Excel extractor test passed!")
         except Exception as e:
             print(f"Error in test_excel_extractor: {str(e)}")
             print("Traceback:")
             traceback.print_exc()
             raise
 
+    def test_segment_streams(self):
+        """Test that every extractor streams segments whose offsets match the joined text"""
+        try:
+            txt_path = os.path.join(self.test_dir, 'test.txt')
+            pdf_path = write_pdf(os.path.join(self.test_dir, 'segments.pdf'), pages=2, lines_per_page=3)
+            xlsx_path = os.path.join(self.test_dir, 'segments.xlsx')
+            wb = Workbook()
+            wb.active.append(['a', 1])
+            wb.save(xlsx_path)
+
+            for file_path, kinds in ((txt_path, {'text'}), (pdf_path, {'page'}), (xlsx_path, {'sheet', 'sheet_row'})):
+                segments = list(get_segment_iterator(file_path)(file_path))
+                text = get_file_extractor(file_path)(file_path)
+                self.assertEqual({segment.kind for segment in segments}, kinds)
+                for segment in segments:
+                    self.assertEqual(text[segment.offset:segment.offset + len(segment.text)], segment.text)
+            self.assertEqual(segments[1].source, 'Sheet!1')
+
+            with self.assertRaises(ValueError):
+                get_file_extractor('notes.zip')
+            print("Segment stream test passed!")
+        except Exception as e:
+            print(f"Error in test_segment_streams: {str(e)}")
+            print("Traceback:")
+            traceback.print_exc()
+            raise
+
+    def test_fan_out_reads_the_stream_once(self):
+        """Test that fan_out feeds every consumer the whole stream in one pass and passes failures on"""
+        reads = []
+
+        def stream(count, fail=False):
+            for i in range(count):
+                reads.append(i)
+                yield ('lines', f"line {i}", f"lines {i}")
+            if fail:
+                raise OSError("truncated file")
+
+        def texts(segments):
+            return [segment.text for segment in segments]
+
+        text = io.StringIO()
+        segments = recording(make_segments(stream(200)), text)
+        first, second, third = fan_out(segments, [texts, texts, lambda segments: next(segments).text],
+                                       max_buffered=4)
+        self.assertEqual(len(reads), 200)
+        self.assertEqual(first, second)
+        self.assertEqual(third, "line 0")
+        self.assertEqual(text.getvalue(), join_segments(make_segments(stream(200))))
+
+        failures = []
+
+        def consume(segments):
+            try:
+                return texts(segments)
+            except SegmentStreamError as e:
+                failures.append(e)
+                raise
+
+        with self.assertRaises(OSError):
+            fan_out(make_segments(stream(10, fail=True)), [consume, consume])
+        self.assertEqual(len(failures), 1)  # the thread's consumer; the last one sees the OSError itself
+        print("Segment fan-out test passed!")
+
     def tearDown(self):
         try:
             # Clean up test files
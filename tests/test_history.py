@@ -0,0 +1,51 @@
+import unittest
+from utils.history import HistoryManager, build_summary_prompt
+from utils.session_store import MemorySessionStore
+
+def count_words(text):
+    return len(text.split())
+
+class TestHistoryManager(unittest.TestCase):
+    def setUp(self):
+        self.history = [(f"question {i}", f"answer number {i}") for i in range(10)]
+
+    def test_recent_turns_fit_budget(self):
+        """Test that only the newest turns that fit the token budget are kept verbatim"""
+        manager = HistoryManager(count_words, budget_tokens=21, max_recent_turns=6)
+        older, recent = manager.select(self.history)
+        self.assertEqual(recent, self.history[-3:])  # 7 words per turn
+        self.assertEqual(older + recent, self.history)
+
+        older, recent = manager.select(self.history, summary="one two three four five six seven eight")
+        self.assertEqual(recent, self.history[-1:])
+
+        manager = HistoryManager(count_words, budget_tokens=1000, max_recent_turns=2)
+        self.assertEqual(manager.select(self.history)[1], self.history[-2:])
+        print("History budget test passed!")
+
+    def test_older_turns_are_summarized_in_background(self):
+        """Test that turns beyond the budget are folded into the session summary"""
+        prompts = []
+
+        def summarize(prompt):
+            prompts.append(prompt)
+            return " They talked about questions 0 to 7. "
+
+        store = MemorySessionStore()
+        for q, a in self.history:
+            store.record_turn('s', q, a, 'file.txt')
+        manager = HistoryManager(count_words, budget_tokens=21, max_recent_turns=6, summarize_fn=summarize)
+        state = store.get('s')
+        future = manager.schedule_summary('s', state['conversation_history'], state['summary'],
+                                          lambda summary, covered: store.apply_summary('s', summary, covered))
+        store.record_turn('s', 'question 10', 'answer number 10', 'file.txt')
+        future.result(timeout=5)
+
+        state = store.get('s')
+        self.assertEqual(state['summary'], 'They talked about questions 0 to 7.')
+        self.assertEqual(state['conversation_history'], self.history[-3:] + [('question 10', 'answer number 10')])
+        self.assertEqual(prompts, [build_summary_prompt(None, self.history[:7])])
+        print("History summary test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import threading
+from utils.ingestion import IngestionPipeline
+
+class TestIngestionPipeline(unittest.TestCase):
+    def test_jobs_report_progress_and_status(self):
+        """Test that jobs run in the background and record progress"""
+        def ingest(job):
+            job.set_stage('extracting')
+            for page in range(1, 4):
+                job.report_progress(page, 3, 'page')
+
+        pipeline = IngestionPipeline(ingest, max_workers=2)
+        job = pipeline.submit('doc.pdf', 'data/doc.pdf')
+        self.assertTrue(job.wait(timeout=5))
+        status = pipeline.get(job.id).to_dict()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['progress'], {'done': 3, 'total': 3, 'unit': 'page'})
+        print("Ingestion progress test passed!")
+
+    def test_failed_job_records_error(self):
+        """Test that an ingestion error marks the job failed"""
+        def ingest(job):
+            raise ValueError('Unsupported file type: .zip')
+
+        pipeline = IngestionPipeline(ingest)
+        job = pipeline.submit('archive.zip', 'data/archive.zip')
+        job.wait(timeout=5)
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Unsupported', job.error)
+        print("Failed job test passed!")
+
+    def test_wait_for_file_blocks_until_done(self):
+        """Test that waiting on a file returns once its latest job finishes"""
+        release = threading.Event()
+        pipeline = IngestionPipeline(lambda job: release.wait(5))
+        pipeline.submit('big.pdf', 'data/big.pdf')
+        self.assertIsNone(pipeline.wait_for_file('data/other.pdf', timeout=0.1))
+        threading.Timer(0.05, release.set).start()
+        job = pipeline.wait_for_file('data/big.pdf', timeout=5)
+        self.assertEqual(job.status, 'done')
+        print("Wait for file test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import threading
+from utils.llm_backends import FakeBackend, LazyBackend, create_backend
+
+class TestLazyBackend(unittest.TestCase):
+    def test_constructed_on_first_use(self):
+        """Test that the backend is only built when a question needs it"""
+        built = []
+        def factory():
+            built.append(1)
+            return FakeBackend(answer='Lazy answer.')
+        backend = LazyBackend(factory, 'fake', model_name='fake', default_concurrency=4)
+        self.assertEqual(backend.status()['state'], 'cold')
+        self.assertEqual(backend.stats(), {})
+        self.assertEqual(built, [])
+
+        self.assertEqual(backend.complete('prompt'), 'Lazy answer.')
+        self.assertEqual(''.join(backend.stream('prompt')), 'Lazy answer.')
+        self.assertEqual(built, [1])
+        self.assertTrue(backend.ready)
+        self.assertEqual(backend.status()['state'], 'ready')
+        print("Lazy construction test passed!")
+
+    def test_warm_up_in_background(self):
+        """Test that warm-up loads the backend on a thread while status reports loading"""
+        release = threading.Event()
+        def factory():
+            release.wait(timeout=10)
+            return FakeBackend()
+        backend = LazyBackend(factory, 'fake')
+        thread = backend.start_warm_up()
+        self.assertFalse(backend.ready)
+        release.set()
+        thread.join(timeout=10)
+        self.assertEqual(backend.status()['state'], 'ready')
+        self.assertIn('load_seconds', backend.status())
+        print("Warm-up test passed!")
+
+    def test_failure_is_reported_and_retried(self):
+        """Test that a failed load is reported and tried again on the next call"""
+        attempts = []
+        def factory():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise FileNotFoundError('model.gguf')
+            return FakeBackend(answer='Loaded.')
+        backend = LazyBackend(factory, 'fake')
+        backend.start_warm_up().join(timeout=10)
+        self.assertEqual(backend.status()['state'], 'failed')
+        self.assertIn('model.gguf', backend.status()['error'])
+        self.assertEqual(backend.complete('prompt'), 'Loaded.')
+        self.assertNotIn('error', backend.status())
+        print("Load failure test passed!")
+
+    def test_described_from_config(self):
+        """Test that a lazy backend knows its name, model and concurrency without loading"""
+        backend = create_backend({'backend': 'llama', 'llama': {'model_path': '/models/tiny.gguf', 'pool_size': 2}},
+                                 lazy=True)
+        self.assertEqual((backend.name, backend.model_name, backend.default_concurrency), ('llama', 'tiny.gguf', 2))
+        self.assertFalse(backend.ready)
+        with self.assertRaises(ValueError):
+            create_backend({'backend': 'unknown'}, lazy=True)
+        print("Lazy config test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
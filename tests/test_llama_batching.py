@@ -0,0 +1,92 @@
+import unittest
+import threading
+import time
+from utils.llama_batching import LlamaBatchScheduler, PrefixStateCache
+
+class FakeContext:
+    """Stand-in for a llama_cpp.Llama context that generates slowly, one word per token"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.input_ids = []
+        self.n_tokens = 0
+
+    def tokenize(self, text):
+        return text.decode('utf-8').split()
+
+    def n_ctx(self):
+        return 8
+
+    def save_state(self):
+        return list(self.input_ids[:self.n_tokens])
+
+    def load_state(self, state):
+        self.input_ids = list(state)
+        self.n_tokens = len(state)
+
+    def __call__(self, prompt, max_tokens=100, stream=False):
+        # A real context is not thread-safe; fail loudly if two threads share one
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError('context used concurrently')
+        try:
+            self.input_ids = self.tokenize(prompt.encode('utf-8'))
+            for i in range(max_tokens):
+                time.sleep(0.01)
+                self.input_ids.append(f'{prompt[:2]}{i}')
+                self.n_tokens = len(self.input_ids)
+                yield {'choices': [{'text': f' {prompt[:2]}{i}'}]}
+        finally:
+            self.lock.release()
+
+class TestLlamaBatchScheduler(unittest.TestCase):
+    def test_requests_run_across_context_pool(self):
+        """Test that concurrent requests are decoded side by side on separate contexts"""
+        scheduler = LlamaBatchScheduler(FakeContext, pool_size=4)
+        results = {}
+
+        def ask(name):
+            results[name] = ''.join(scheduler.generate(name, max_tokens=5))
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=ask, args=(f'q{i}',)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(results['q2'], ' q20 q21 q22 q23 q24')
+        # Four requests of five 10 ms tokens finish in about one request's time
+        self.assertLess(elapsed, 0.15)
+        stats = scheduler.stats()
+        self.assertEqual(stats['tokens_total'], 20)
+        self.assertEqual(stats['requests_total'], 4)
+        self.assertGreater(stats['tokens_per_second'], 0)
+        print("Context pool test passed!")
+
+    def test_prefix_state_is_reused_across_turns(self):
+        """Test that a follow-up turn only evaluates the tokens after the shared prefix"""
+        scheduler = LlamaBatchScheduler(FakeContext, pool_size=2, state_cache=PrefixStateCache())
+        first_turn = 'doc doc doc doc Q: one A:'
+        answer = ''.join(scheduler.generate(first_turn, max_tokens=2, cache_key='session:file'))
+
+        timings = {}
+        second_turn = f'{first_turn}{answer} Q: two A:'
+        list(scheduler.generate(second_turn, max_tokens=2, cache_key='session:file', timings=timings))
+        self.assertEqual(timings['prompt_tokens'], len(second_turn.split()))
+        self.assertEqual(timings['reused_tokens'], len((first_turn + answer).split()))
+        self.assertIn('prompt_eval_ms', timings)
+        print("Prefix state reuse test passed!")
+
+    def test_errors_reach_the_caller(self):
+        """Test that a failing generation raises in the requesting thread"""
+        class BrokenContext(FakeContext):
+            def __call__(self, prompt, max_tokens=100, stream=False):
+                raise ValueError('model exploded')
+
+        scheduler = LlamaBatchScheduler(BrokenContext, pool_size=1)
+        with self.assertRaises(ValueError):
+            list(scheduler.generate('q', max_tokens=3))
+        print("Error propagation test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import asyncio
+import logging
+import threading
+from utils.log_buffer import LogBuffer, MemoryHandler
+
+class TestLogBuffer(unittest.TestCase):
+    def test_since_returns_only_new_entries(self):
+        """Test that readers only get the lines added after their sequence number"""
+        buffer = LogBuffer(maxlen=10)
+        for i in range(3):
+            buffer.append('INFO', f"line {i}")
+        entries, last_seq = buffer.since(0)
+        self.assertEqual([e['seq'] for e in entries], [1, 2, 3])
+        self.assertEqual(last_seq, 3)
+
+        buffer.append('INFO', "line 3")
+        entries, last_seq = buffer.since(last_seq)
+        self.assertEqual([e['message'] for e in entries], ["line 3"])
+        self.assertEqual(buffer.since(last_seq), ([], 4))
+        print("Log buffer since test passed!")
+
+    def test_sequence_survives_rotation(self):
+        """Test that sequence numbers keep increasing once old lines are dropped"""
+        buffer = LogBuffer(maxlen=3)
+        for i in range(5):
+            buffer.append('INFO', f"line {i}")
+        entries, last_seq = buffer.since(0)
+        self.assertEqual([e['seq'] for e in entries], [3, 4, 5])
+        self.assertEqual([e['seq'] for e in buffer.since(4)[0]], [5])
+        print("Log buffer rotation test passed!")
+
+    def test_level_filter(self):
+        """Test that entries below the minimum level are left out"""
+        buffer = LogBuffer()
+        buffer.append('INFO', "info")
+        buffer.append('WARNING', "warning")
+        buffer.append('ERROR', "error")
+        entries, last_seq = buffer.since(0, logging.WARNING)
+        self.assertEqual([e['message'] for e in entries], ["warning", "error"])
+        self.assertEqual(last_seq, 3)
+        print("Log buffer level filter test passed!")
+
+    def test_wait_wakes_on_new_line(self):
+        """Test that wait returns as soon as a line is added, and times out otherwise"""
+        buffer = LogBuffer()
+        self.assertFalse(buffer.wait(0, timeout=0.01))
+        timer = threading.Timer(0.05, buffer.append, ('INFO', "late line"))
+        timer.start()
+        self.assertTrue(buffer.wait(0, timeout=5))
+        timer.join()
+        print("Log buffer wait test passed!")
+
+    def test_wait_async_wakes_on_new_line(self):
+        """Test that wait_async is woken by a line added from another thread, and times out otherwise"""
+        buffer = LogBuffer()
+
+        async def wait():
+            self.assertFalse(await buffer.wait_async(0, timeout=0.01))
+            timer = threading.Timer(0.05, buffer.append, ('INFO', "late line"))
+            timer.start()
+            self.assertTrue(await buffer.wait_async(0, timeout=5))
+            timer.join()
+            self.assertTrue(await buffer.wait_async(0, timeout=0))
+            self.assertEqual(buffer._async_waiters, set())
+
+        asyncio.run(wait())
+        print("Log buffer async wait test passed!")
+
+    def test_memory_handler(self):
+        """Test that the handler stores formatted records with their level"""
+        buffer = LogBuffer()
+        logger = logging.getLogger('test_log_buffer')
+        logger.addHandler(MemoryHandler(buffer))
+        logger.warning("disk almost full")
+        entries, _ = buffer.since(0)
+        self.assertEqual(entries[0]['level'], 'WARNING')
+        self.assertIn("disk almost full", entries[0]['message'])
+        print("Memory handler test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from utils.metrics import MetricsRegistry
+
+class TestMetrics(unittest.TestCase):
+    def test_counter(self):
+        """Test that counters add up per label combination and render with _total names"""
+        registry = MetricsRegistry(prefix='test_')
+        lookups = registry.counter('lookups_total', "Lookups", ('result',))
+        lookups.inc(result='hit')
+        lookups.inc(2, result='miss')
+        lookups.inc(result='hit')
+        self.assertEqual(lookups.value(result='hit'), 2)
+        text = registry.render()
+        self.assertIn('# TYPE test_lookups_total counter', text)
+        self.assertIn('test_lookups_total{result="hit"} 2', text)
+        self.assertIn('test_lookups_total{result="miss"} 2', text)
+        with self.assertRaises(ValueError):
+            lookups.inc(outcome='hit')
+        print("Counter test passed!")
+
+    def test_histogram(self):
+        """Test that histograms render cumulative buckets, sum and count"""
+        registry = MetricsRegistry()
+        latency = registry.histogram('latency_seconds', "Latency", ('stage',), buckets=(0.1, 1.0))
+        latency.observe(0.05, stage='context')
+        latency.observe(0.5, stage='context')
+        latency.observe(5, stage='context')
+        with latency.time(stage='prompt'):
+            pass
+        text = registry.render()
+        self.assertIn('latency_seconds_bucket{stage="context",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{stage="context",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{stage="context",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_sum{stage="context"} 5.55', text)
+        self.assertIn('latency_seconds_count{stage="context"} 3', text)
+        self.assertEqual(latency.count(stage='prompt'), 1)
+        print("Histogram test passed!")
+
+    def test_gauge_and_escaping(self):
+        """Test that gauges are read at render time and label values are escaped"""
+        registry = MetricsRegistry()
+        depth = [3]
+        registry.gauge('queue_depth', "Depth", lambda: depth[0])
+        registry.gauge('files', "Files", lambda: [({'name': 'a "b"\n'}, 1)])
+        depth[0] = 7
+        text = registry.render()
+        self.assertIn('queue_depth 7', text)
+        self.assertIn('files{name="a \\"b\\"\\n"} 1', text)
+        print("Gauge test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
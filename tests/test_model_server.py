@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+import types
+from starlette.testclient import TestClient
+import model_server
+from tests.test_llama_batching import FakeContext
+from utils.llama_batching import LlamaBatchScheduler
+from utils.llm_backends import LazyBackend, ModelServerBackend
+
+def fake_llama_backend():
+    """LazyBackend around a scheduler of fake contexts, in place of the server's Llama backend"""
+    llama = types.SimpleNamespace(
+        scheduler=LlamaBatchScheduler(FakeContext, pool_size=2),
+        count_tokens=lambda text: len(text.split()),
+        stats=lambda: {'contexts': 2},
+        warm_up=lambda: None
+    )
+    return LazyBackend(lambda: llama, 'llama', model_name='tiny.gguf', default_concurrency=2)
+
+class TestModelServer(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(model_server, 'llm_backend', fake_llama_backend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_openai_compatible_routes(self):
+        """Test the completion, chat, model and readiness routes"""
+        with TestClient(model_server.application) as client:
+            model_server.llm_backend.get()
+            self.assertEqual(client.get('/ready').status_code, 200)
+            self.assertEqual(client.get('/v1/models').json()['data'][0]['id'], 'tiny.gguf')
+
+            response = client.post('/v1/completions', json={'prompt': 'ab cd', 'max_tokens': 3})
+            data = response.json()
+            self.assertEqual(data['choices'][0]['text'], ' ab0 ab1 ab2')
+            self.assertEqual(data['usage']['completion_tokens'], 3)
+            self.assertEqual(data['timings']['prompt_tokens'], 2)
+
+            response = client.post('/v1/chat/completions', json={
+                'messages': [{'role': 'user', 'content': 'xy'}], 'max_tokens': 2, 'stream': True
+            })
+            lines = [line for line in response.text.split('\n\n') if line]
+            self.assertEqual(lines[-1], 'data: [DONE]')
+            self.assertIn('"delta": {"content": " xy0"}', lines[0])
+            self.assertEqual(client.post('/v1/completions', json={'prompt': 1}).status_code, 400)
+        print("Model server routes test passed!")
+
+    def test_client_backend(self):
+        """Test that the app workers' backend streams, counts tokens and waits for readiness"""
+        with TestClient(model_server.application) as client:
+            backend = ModelServerBackend('http://model-server', model_name='tiny.gguf', startup_timeout=10)
+            # TestClient is an httpx.Client that calls the app in process
+            backend.client = client
+            backend.warm_up()
+
+            timings = {}
+            tokens = list(backend.stream('ef gh', timings=timings))
+            self.assertEqual(tokens[0], ' ef0')
+            self.assertEqual(timings['prompt_tokens'], 2)
+            self.assertTrue(backend.complete('ef gh').startswith(' ef0'))
+            self.assertEqual(backend.count_tokens('three word text'), 3)
+            self.assertEqual(backend.stats()['contexts'], 2)
+        print("Model server client test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
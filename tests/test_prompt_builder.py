@@ -0,0 +1,106 @@
+import unittest
+from utils.prompt_builder import (PromptBuilder, PromptTooLongError, TokenCounter, build_prompt, split_sections,
+                                  truncate_tokens)
+
+def count_words(text):
+    return len(text.split())
+
+class TestPromptBuilder(unittest.TestCase):
+    def setUp(self):
+        self.document = " ".join(f"w{i}" for i in range(1000))
+
+    def test_truncation_keeps_head_or_tail(self):
+        """Test that head and tail truncation keep the longest start or end that fits"""
+        head = truncate_tokens(self.document, 10, count_words)
+        self.assertEqual(head, " ".join(f"w{i}" for i in range(10)))
+        tail = truncate_tokens(self.document, 10, count_words, keep='tail')
+        self.assertEqual(tail, " ".join(f"w{i}" for i in range(990, 1000)))
+        self.assertEqual(truncate_tokens("short text", 10, count_words), "short text")
+        self.assertEqual(truncate_tokens(self.document, 0, count_words), "")
+
+        sections = split_sections("a b c\nd e\nf g h i\n\nj", 5, count_words)
+        self.assertEqual(sections, ["a b c\nd e", "f g h i\nj"])
+        print("Truncation test passed!")
+
+    def test_prompt_fits_context_window(self):
+        """Test that the window is split into fixed shares and the prompt never exceeds it"""
+        builder = PromptBuilder(count_words, context_window=300, completion_tokens=50, question_tokens=20,
+                                history_tokens=1000)
+        allocation = builder.allocation()
+        self.assertEqual(allocation.history, 115)  # half of what the answer and question leave
+        self.assertEqual(allocation.document, 300 - 50 - 20 - 115 - allocation.template)
+
+        history = [("first question", "first answer")]
+        prompt, stats = builder.build(self.document, history, "What is w3?")
+        self.assertLessEqual(count_words(prompt), 300 - 50)
+        self.assertEqual(stats['truncation'], 'head')
+        self.assertEqual(stats['max_tokens'], 50)
+        self.assertTrue(prompt.startswith("Context:\nw0 w1"))
+
+        # The document part stays the same from turn to turn, so the prompt prefix does too
+        next_prompt, _ = builder.build(self.document, history + [("What is w3?", "w3")], "And w4?")
+        document_part = prompt.split("\n\nConversation:")[0]
+        self.assertTrue(next_prompt.startswith(document_part))
+
+        with self.assertRaises(PromptTooLongError):
+            builder.build(self.document, [], "word " * 21)
+        with self.assertRaises(ValueError):
+            PromptBuilder(count_words, context_window=60, completion_tokens=50, question_tokens=20)
+        print("Context window test passed!")
+
+    def test_map_reduce_summarizes_sections(self):
+        """Test that map_reduce summarizes each section once and falls back to head truncation"""
+        calls = []
+
+        def summarize(prompt, max_tokens):
+            calls.append(max_tokens)
+            return f"summary {len(calls)} " + "padding " * 100
+
+        document = "\n".join(" ".join(f"line{i}word{j}" for j in range(10)) for i in range(100))
+        builder = PromptBuilder(count_words, context_window=600, completion_tokens=50, question_tokens=20,
+                                history_tokens=100, strategy='map_reduce', summarize_fn=summarize,
+                                section_tokens=200)
+        fitted, strategy = builder.fit_document(document, budget=100)
+        self.assertEqual(strategy, 'map_reduce')
+        # 1000 words in sections of 200, then one reduce as 5 summaries of at least 32 words are too long
+        self.assertEqual(calls, [32, 32, 32, 32, 32, 100])
+        self.assertLessEqual(count_words(fitted), 100)
+        self.assertTrue(fitted.startswith("summary 6"))
+
+        # Summaries are cached per section, so the next question reuses them
+        builder._fitted = type(builder._fitted)(64)
+        builder.fit_document(document, budget=100)
+        self.assertEqual(len(calls), 6)
+
+        def failing(prompt, max_tokens):
+            raise RuntimeError("backend down")
+
+        builder = PromptBuilder(count_words, context_window=600, completion_tokens=50, question_tokens=20,
+                                history_tokens=100, strategy='map_reduce', summarize_fn=failing)
+        fitted, strategy = builder.fit_document(document, budget=100)
+        self.assertEqual(strategy, 'head')
+        self.assertTrue(fitted.startswith("line0word0"))
+        print("Map-reduce test passed!")
+
+    def test_token_counts_are_cached(self):
+        """Test that repeated segments go through the tokenizer once"""
+        counted = []
+
+        def count(text):
+            counted.append(text)
+            return count_words(text)
+
+        counter = TokenCounter(count, max_entries=2)
+        long_text = "word " * 100
+        self.assertEqual(counter(long_text), 100)
+        self.assertEqual(counter(long_text), 100)
+        self.assertEqual(counter("a b"), 2)
+        self.assertEqual(counter("c"), 1)
+        self.assertEqual(counter(long_text), 100)  # evicted by the two newer entries
+        self.assertEqual(len(counted), 4)
+        self.assertEqual(counter.stats(), {'entries': 2, 'hits': 1, 'misses': 4})
+        self.assertEqual(build_prompt("doc", [], "q?"), "Context:\ndoc\n\nConversation:\nQ: q?\nA:")
+        print("Token cache test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
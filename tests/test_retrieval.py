@@ -0,0 +1,49 @@
+import unittest
+from utils.retrieval import BM25Index, chunk_segments, chunk_text, estimate_tokens
+from utils.segments import make_segments
+
+class TestRetrieval(unittest.TestCase):
+    def setUp(self):
+        filler = " ".join(f"filler{i}" for i in range(400))
+        self.text = (
+            f"{filler} The quarterly revenue was 42 million dollars. {filler} "
+            f"The office cat is named Biscuit. {filler}"
+        )
+
+    def test_chunks_overlap(self):
+        """Test that chunks cover the text with the requested overlap"""
+        chunks = chunk_text(self.text, chunk_size=50, overlap=10)
+        self.assertGreater(len(chunks), 1)
+        first_words = chunks[0].text.split()
+        second_words = chunks[1].text.split()
+        self.assertEqual(first_words[-10:], second_words[:10])
+        self.assertEqual(chunks[-1].end, len(self.text))
+        print("Chunk overlap test passed!")
+
+    def test_chunk_segment_stream(self):
+        """Test that chunking a segment stream keeps offsets into the joined text"""
+        pages = [('page', f'page {n} ' + ' '.join(f'w{n}_{i}' for i in range(30)), f'page {n}') for n in range(3)]
+        joined = ''.join(text + '\n' for _, text, _ in pages)
+        chunks = list(chunk_segments(make_segments(pages), chunk_size=25, overlap=5))
+        self.assertEqual(chunks[0].text.split(), joined[chunks[0].start:chunks[0].end].split())
+        self.assertEqual(chunks[-1].end, len(joined) - 1)
+        print("Segment chunking test passed!")
+
+    def test_search_ranks_relevant_chunk_first(self):
+        """Test that BM25 ranks the chunk containing the query terms first"""
+        index = BM25Index(self.text, chunk_size=50, overlap=10)
+        results = index.search("What is the cat named?", top_k=3)
+        self.assertIn('Biscuit', results[0][1].text)
+        print("BM25 ranking test passed!")
+
+    def test_context_respects_budget(self):
+        """Test that packed context stays within the token budget"""
+        index = BM25Index(self.text, chunk_size=50, overlap=10)
+        context = index.build_context("quarterly revenue", top_k=5, budget_tokens=200)
+        self.assertIn('42 million', context)
+        self.assertLessEqual(estimate_tokens(context), 200)
+        self.assertLess(len(context), len(self.text))
+        print("Context budget test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
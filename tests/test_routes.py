@@ -1,18 +1,36 @@
 import unittest
+from unittest import mock
+import hashlib
+import io
 import os
-from app import app
+import shutil
+import app as app_module
+from utils.llm_backends import FakeBackend, LazyBackend
+from utils.work_queue import BoundedWorkQueue
 import json
+import logging
+from utils.log_pipeline import JsonFormatter
+
+app = app_module.create_app(start=False)
 
 class TestFlaskRoutes(unittest.TestCase):
     def setUp(self):
         # Set up test client
         self.app = app.test_client()
         self.app.testing = True
+        # Answers are cached by content, so one test's fake answer must not answer another's question
+        app_module.answer_cache.clear()
         
         # Create test directories
         os.makedirs('data', exist_ok=True)
         os.makedirs('logs', exist_ok=True)
 
+    def session_path(self, file_name, client=None):
+        """Path of a file in the test client's own session directory"""
+        session_id = json.loads((client or self.app).get('/session').data)['session_id']
+        os.makedirs(os.path.join('data', session_id), exist_ok=True)
+        return os.path.join('data', session_id, file_name)
+
     def test_home_route(self):
         """Test the home route"""
         response = self.app.get('/')
@@ -38,11 +56,69 @@ class TestFlaskRoutes(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('message', data)
         print("Upload route test passed!")
+
+        # The upload is ingested in the background; its job can be polled
+        app_module.ingestion.get(data['job_id']).wait(timeout=10)
+        job = json.loads(self.app.get(f"/jobs/{data['job_id']}").data)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['progress'], {'done': 1, 'total': 1, 'unit': 'file'})
+        self.assertEqual(self.app.get('/jobs/unknown').status_code, 404)
         
         # Clean up
         os.remove(test_file_path)
-        if os.path.exists(os.path.join('data', test_file_path)):
-            os.remove(os.path.join('data', test_file_path))
+        if os.path.exists(self.session_path(test_file_path)):
+            os.remove(self.session_path(test_file_path))
+
+    def test_replaced_upload_releases_its_blob(self):
+        """Test that uploading over a file removes the blob only it linked to, without a full scan"""
+        def upload(content):
+            response = self.app.post('/upload', data={'file': (io.BytesIO(content), 'replaced.txt')},
+                                     content_type='multipart/form-data')
+            return json.loads(response.data)['sha256']
+
+        old_digest = upload(b'First version of the file.')
+        with mock.patch.object(app_module.upload_store, 'collect_garbage') as collect_garbage:
+            new_digest = upload(b'Second version of the file.')
+        collect_garbage.assert_not_called()
+        self.assertFalse(os.path.exists(app_module.upload_store.blob_path(old_digest)))
+        self.assertTrue(os.path.exists(app_module.upload_store.blob_path(new_digest)))
+        os.remove(self.session_path('replaced.txt'))
+        print("Replaced upload test passed!")
+
+    def test_chunked_upload_route(self):
+        """Test a chunked upload that resumes, and a duplicate that reuses the first one's index"""
+        content = ('Chunked upload content about the harbour. ' * 200).encode('utf-8')
+        started = self.app.post('/uploads', json={'file_name': 'chunked.txt', 'size': len(content)})
+        self.assertEqual(started.status_code, 201)
+        upload_id = json.loads(started.data)['upload_id']
+
+        self.app.put(f'/uploads/{upload_id}?offset=0', data=content[:1000])
+        # A retried chunk is refused with the offset to resume from
+        retried = self.app.put(f'/uploads/{upload_id}?offset=0', data=content[:1000])
+        self.assertEqual(retried.status_code, 409)
+        self.assertEqual(json.loads(retried.data)['offset'], 1000)
+        offset = json.loads(self.app.get(f'/uploads/{upload_id}').data)['offset']
+        self.app.put(f'/uploads/{upload_id}?offset={offset}', data=content[offset:])
+
+        committed = self.app.post(f'/uploads/{upload_id}/commit', json={'sha256': hashlib.sha256(content).hexdigest()})
+        self.assertEqual(committed.status_code, 200)
+        data = json.loads(committed.data)
+        self.assertFalse(data['duplicate'])
+        app_module.ingestion.get(data['job_id']).wait(timeout=10)
+        self.assertEqual(json.loads(self.app.get('/files').data)['files'], ['chunked.txt'])
+        self.assertEqual(self.app.get(f'/uploads/{upload_id}').status_code, 404)
+
+        # The same bytes from another session are not parsed or indexed again
+        other = app.test_client()
+        with mock.patch.object(app_module.corpus_index, 'add_document') as add_document:
+            response = other.post('/upload', data={'file': (io.BytesIO(content), 'copy.txt')},
+                                  content_type='multipart/form-data')
+            data = json.loads(response.data)
+            app_module.ingestion.get(data['job_id']).wait(timeout=10)
+        self.assertTrue(data['duplicate'])
+        add_document.assert_not_called()
+        self.assertEqual(json.loads(other.get('/files').data)['files'], ['copy.txt'])
+        print("Chunked upload route test passed!")
 
     def test_ask_route(self):
         """Test the question asking route"""
@@ -72,15 +148,243 @@ class TestFlaskRoutes(unittest.TestCase):
         
         # Clean up
         os.remove(test_file_path)
-        if os.path.exists(os.path.join('data', test_file_path)):
-            os.remove(os.path.join('data', test_file_path))
+        if os.path.exists(self.session_path(test_file_path)):
+            os.remove(self.session_path(test_file_path))
+
+    def test_ask_rejects_invalid_body(self):
+        """Test that a body that is not a JSON object is a 400, not a 500"""
+        with open(self.session_path('body.txt'), 'w') as f:
+            f.write('This is a test file.')
+        for route in ('/ask', '/ask/stream'):
+            for body, content_type in (('not json', 'application/json'), ('{"question": "Hi?"}', 'text/plain'),
+                                       ('["a list"]', 'application/json'), ('', None)):
+                response = self.app.post(route, data=body, content_type=content_type)
+                self.assertEqual(response.status_code, 400, (route, body, content_type))
+                self.assertEqual(json.loads(response.data)['error'], 'Request body must be a JSON object')
+        os.remove(self.session_path('body.txt'))
+        print("Invalid body test passed!")
+
+    def test_ask_stream_route(self):
+        """Test that /ask/stream sends tokens as Server-Sent Events"""
+        with open(self.session_path('stream.txt'), 'w') as f:
+            f.write('This is a test file.')
+
+        with mock.patch.object(app_module, 'llm_backend', FakeBackend(answer='This is a fake answer.')):
+            response = self.app.post('/ask/stream', json={'question': 'What is this file about?'})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.content_type.startswith('text/event-stream'))
+            body = response.get_data(as_text=True)
+
+        events = [message for message in body.split('\n\n') if message]
+        tokens = [json.loads(e[len('data: '):])['token'] for e in events if e.startswith('data: ')]
+        self.assertEqual(''.join(tokens), 'This is a fake answer.')
+        done = json.loads(events[-1].split('data: ', 1)[1])
+        self.assertTrue(events[-1].startswith('event: done'))
+        self.assertEqual(done['answer'], 'This is a fake answer.')
+        self.assertIn('ttft_ms', done)
+        print("Ask stream route test passed!")
+
+    def test_logs_since(self):
+        """Test that /logs only returns lines newer than ?since and honours ?level"""
+        last_seq = json.loads(self.app.get('/logs').data)['last_seq']
+        app_module.logger.warning("first new line")
+        app_module.logger.error("second new line")
+        app_module.log_listener.flush()
+        data = json.loads(self.app.get(f'/logs?since={last_seq}&level=warning').data)
+        messages = [e['message'] for e in data['logs']]
+        self.assertEqual(len(messages), 2)
+        self.assertIn("first new line", messages[0])
+        self.assertGreater(data['last_seq'], last_seq + 1)
+
+        data = json.loads(self.app.get(f'/logs?since={last_seq}&level=error').data)
+        self.assertEqual([e['level'] for e in data['logs']], ['ERROR'])
+        self.assertEqual(self.app.get('/logs?level=LOUD').status_code, 400)
+        print("Logs since test passed!")
+
+    def test_logs_stream(self):
+        """Test that /logs/stream pushes new lines as Server-Sent Events"""
+        last_seq = json.loads(self.app.get('/logs').data)['last_seq']
+        app_module.logger.error("streamed line")
+        response = self.app.get('/logs/stream?level=ERROR', headers={'Last-Event-ID': str(last_seq)})
+        self.assertTrue(response.content_type.startswith('text/event-stream'))
+        message = next(response.response)
+        message = message.decode() if isinstance(message, bytes) else message
+        response.close()
+        self.assertGreater(int(message.split('\n')[0][len('id: '):]), last_seq)
+        self.assertIn("streamed line", message)
+        print("Logs stream test passed!")
+
+    def test_request_id_and_timing_are_logged(self):
+        """Test that each request is logged with its request ID and duration"""
+        lines = []
+        capture = logging.Handler()
+        capture.setFormatter(JsonFormatter())
+        capture.emit = lambda record: lines.append(capture.format(record))
+        listener = app_module.log_listener
+        with mock.patch.object(listener, 'handlers', listener.handlers + (capture,)):
+            response = self.app.get('/files', headers={'X-Request-ID': 'req-42'})
+            listener.flush()
+        self.assertEqual(response.headers['X-Request-ID'], 'req-42')
+        records = [json.loads(line) for line in lines]
+        completed = [r for r in records if r.get('path') == '/files' and r['request_id'] == 'req-42']
+        self.assertEqual(completed[-1]['status'], 200)
+        self.assertIn('duration_ms', completed[-1])
+        self.assertIn('req-42', [r['request_id'] for r in records if r['message'].startswith('File list')])
+        print("Request logging test passed!")
+
+    def test_metrics(self):
+        """Test that /metrics reports per-stage timings, token counts and cache lookups of /ask"""
+        with open(self.session_path('metrics.txt'), 'w') as f:
+            f.write('Metrics are collected per stage.')
+        with mock.patch.object(app_module, 'llm_backend', FakeBackend(answer="Per stage.")):
+            before = app_module.stage_seconds.count(stage='generate')
+            self.app.post('/ask', json={'question': 'How are metrics collected?'})
+        self.assertEqual(app_module.stage_seconds.count(stage='generate'), before + 1)
+
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.data.decode()
+        for stage in ('ingestion_wait', 'context', 'prompt', 'queue_wait', 'generate'):
+            self.assertIn(f'fileqa_ask_stage_duration_seconds_count{{stage="{stage}"}}', text)
+        self.assertIn('fileqa_completion_tokens_count{backend="fake"}', text)
+        self.assertIn('fileqa_answer_cache_lookups_total{result="miss"}', text)
+        self.assertIn('fileqa_http_request_duration_seconds_bucket{method="POST",route="/ask",status="200"', text)
+        self.assertIn('fileqa_queue_depth 0', text)
+        print("Metrics route test passed!")
+
+    def test_health_and_ready(self):
+        """Test that /health always answers and /ready follows the backend's load state"""
+        self.assertEqual(self.app.get('/health').status_code, 200)
+        backend = LazyBackend(lambda: FakeBackend(), 'fake')
+        with mock.patch.object(app_module, 'llm_backend', backend):
+            backend.start_warm_up().join(timeout=10)
+            response = self.app.get('/ready')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data)['state'], 'ready')
+
+        loading = mock.Mock(**{'status.return_value': {'backend': 'llama', 'state': 'loading'}})
+        with mock.patch.object(app_module, 'llm_backend', loading):
+            self.assertEqual(self.app.get('/ready').status_code, 503)
+            self.assertEqual(self.app.get('/health').status_code, 200)
+        print("Health and readiness test passed!")
+
+    def test_ask_returns_503_when_queue_full(self):
+        """Test that /ask applies backpressure when the backend queue is full"""
+        with open(self.session_path('busy.txt'), 'w') as f:
+            f.write('This is a test file.')
+
+        full_queue = BoundedWorkQueue('fake', max_concurrency=1, max_queue_depth=0)
+        full_queue.acquire()
+        with mock.patch.object(app_module, 'llm_backend', FakeBackend()), \
+                mock.patch.object(app_module, 'llm_queue', full_queue):
+            response = self.app.post('/ask', json={'question': 'Anyone there?'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(full_queue.stats()['rejected'], 1)
+        print("Ask backpressure test passed!")
+
+    def test_repeated_question_is_cached(self):
+        """Test that a repeated question on the same document is answered from the cache"""
+        with mock.patch.object(app_module, 'llm_backend', FakeBackend()):
+            answers = []
+            for _ in range(2):
+                self.app.post('/clear_session')
+                with open(self.session_path('cached.txt'), 'w') as f:
+                    f.write('The same document every time.')
+                response = self.app.post('/ask', json={'question': 'Summarize this file.'})
+                self.assertEqual(response.status_code, 200)
+                answers.append(json.loads(response.data))
+        self.assertFalse(answers[0]['cached'])
+        self.assertTrue(answers[1]['cached'])
+        self.assertEqual(answers[0]['answer'], answers[1]['answer'])
+        print("Answer cache route test passed!")
+
+    def test_ask_across_corpus(self):
+        """Test that corpus mode answers from passages of every uploaded file with sources"""
+        self.app.post('/clear_session')
+        for name, text in (('animals.txt', 'The office cat is named Biscuit.'),
+                           ('finance.txt', 'The quarterly revenue was 42 million dollars.')):
+            with open(name, 'w') as f:
+                f.write(text)
+            with open(name, 'rb') as f:
+                self.app.post('/upload', data={'file': (f, name)}, content_type='multipart/form-data')
+            os.remove(name)
+
+        with mock.patch.object(app_module, 'llm_backend', FakeBackend()):
+            response = self.app.post('/ask', json={'question': 'What was the revenue?', 'mode': 'corpus'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['sources'][0]['file'], 'finance.txt')
+        self.assertEqual(data['sources'][0]['source'], 'lines 1-1')
+        session_id = json.loads(self.app.get('/session').data)['session_id']
+        self.assertIn(f'{session_id}/finance.txt', app_module.corpus_index.document_names())
+
+        self.app.post('/clear_session')
+        self.assertFalse(any(name.startswith(session_id) for name in app_module.corpus_index.document_names()))
+        print("Corpus question test passed!")
+
+    def test_prompt_fits_context_window(self):
+        """Test that an oversized document is cut to the context window and long questions are refused"""
+        with open(self.session_path('huge.txt'), 'w') as f:
+            f.write('Every line of this document repeats the same words. ' * 5000)
+        builder = app_module.prompt_builder
+        with mock.patch.object(app_module, 'llm_backend', FakeBackend(answer='word ' * 1000)), \
+                mock.patch.dict(app_module.retrieval_config, {'enabled': False}):
+            data = json.loads(self.app.post('/ask', json={'question': 'What repeats?'}).data)
+            too_long = self.app.post('/ask', json={'question': 'why ' * 2000})
+        self.assertEqual(data['prompt']['truncation'], 'head')
+        self.assertLessEqual(data['prompt']['tokens'], builder.context_window - builder.completion_tokens)
+        # The answer is capped by the completion reservation
+        self.assertEqual(len(data['answer'].split()), builder.completion_tokens)
+        self.assertEqual(too_long.status_code, 400)
+        self.assertIn('Question has', json.loads(too_long.data)['error'])
+        print("Context window route test passed!")
+
+    def test_prompt_history_is_bounded(self):
+        """Test that long conversations keep a bounded prompt and gain a summary"""
+        with open(self.session_path('long.txt'), 'w') as f:
+            f.write('A short document.')
+        manager = app_module.HistoryManager(lambda text: len(text.split()), budget_tokens=40,
+                                            max_recent_turns=3, summarize_fn=lambda prompt: 'Earlier turns.')
+        with mock.patch.object(app_module, 'llm_backend', FakeBackend()), \
+                mock.patch.object(app_module, 'history_manager', manager):
+            sizes = []
+            for i in range(8):
+                data = json.loads(self.app.post('/ask', json={'question': f'Question number {i}?'}).data)
+                sizes.append(data['prompt']['tokens'])
+                manager._executor.submit(lambda: None).result(timeout=5)
+        self.assertLessEqual(data['prompt']['history_turns'], 3)
+        self.assertTrue(data['prompt']['summarized'])
+        self.assertEqual(json.loads(self.app.get('/session').data)['summary'], 'Earlier turns.')
+        self.assertLess(max(sizes[4:]) - min(sizes[4:]), 50)
+        print("Bounded prompt test passed!")
+
+    def test_sessions_are_isolated(self):
+        """Test that each session cookie gets its own files and history"""
+        other = app.test_client()
+        with open(self.session_path('mine.txt'), 'w') as f:
+            f.write('Only the first client uploaded this.')
+        with open(self.session_path('theirs.txt', client=other), 'w') as f:
+            f.write('Only the second client uploaded this.')
+
+        self.assertEqual(json.loads(self.app.get('/files').data)['files'], ['mine.txt'])
+        self.assertEqual(json.loads(other.get('/files').data)['files'], ['theirs.txt'])
+
+        with mock.patch.object(app_module, 'llm_backend', FakeBackend()):
+            self.app.post('/ask', json={'question': 'Who uploaded this?'})
+        self.assertEqual(json.loads(self.app.get('/session').data)['turns'], 1)
+        self.assertEqual(json.loads(other.get('/session').data)['turns'], 0)
+
+        self.app.post('/clear_session')
+        self.assertEqual(json.loads(self.app.get('/files').data)['files'], [])
+        self.assertEqual(json.loads(other.get('/files').data)['files'], ['theirs.txt'])
+        print("Session isolation test passed!")
 
     def tearDown(self):
         # Clean up test directories
         if os.path.exists('data'):
-            for file in os.listdir('data'):
-                os.remove(os.path.join('data', file))
-            os.rmdir('data')
+            shutil.rmtree('data')
         if os.path.exists('logs'):
             for file in os.listdir('logs'):
                 os.remove(os.path.join('logs', file))
@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+import os
+import sqlite3
+import time
+import shutil
+import tempfile
+from utils.session_store import MemorySessionStore, SQLiteSessionStore, is_valid_session_id, new_session_id
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.evicted = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def stores(self, **options):
+        options.setdefault('on_evict', self.evicted.append)
+        return [
+            MemorySessionStore(**options),
+            SQLiteSessionStore(os.path.join(self.tmp_dir, f'sessions-{len(os.listdir(self.tmp_dir))}.sqlite3'), **options)
+        ]
+
+    def test_turns_are_kept_per_session(self):
+        """Test that history and current file are stored per session and bounded"""
+        for store in self.stores(max_turns=2):
+            store.record_turn('a', 'q1', 'a1', 'one.txt')
+            store.record_turn('a', 'q2', 'a2', 'two.txt')
+            store.record_turn('a', 'q3', 'a3', 'two.txt')
+            state = store.get('a')
+            self.assertEqual(state['conversation_history'], [('q2', 'a2'), ('q3', 'a3')])
+            self.assertEqual(state['current_file'], 'two.txt')
+            self.assertEqual(store.get('b')['conversation_history'], [])
+            store.delete('a')
+            self.assertEqual(store.get('a')['current_file'], None)
+        print("Session turns test passed!")
+
+    def test_least_recently_used_session_is_evicted(self):
+        """Test that sessions beyond max_sessions are evicted oldest first"""
+        for store in self.stores(max_sessions=2):
+            self.evicted.clear()
+            store.record_turn('a', 'q', 'a', None)
+            store.record_turn('b', 'q', 'a', None)
+            store.get('a')
+            store.record_turn('c', 'q', 'a', None)
+            self.assertEqual(self.evicted, ['b'])
+            self.assertEqual(store.get('a')['conversation_history'], [('q', 'a')])
+        print("Session eviction test passed!")
+
+    def test_expired_session_is_evicted_when_used(self):
+        """Test that using a session past its TTL reports it as evicted and starts it over"""
+        for store in self.stores(ttl=60):
+            self.evicted.clear()
+            store.record_turn('a', 'q', 'a', 'one.txt')
+            later = time.time() + 120
+            with mock.patch('utils.session_store.time.time', return_value=later):
+                state = store.get('a')
+            self.assertEqual(self.evicted, ['a'])
+            self.assertEqual(state['conversation_history'], [])
+            self.assertEqual(store.get('a')['current_file'], None)
+            self.assertEqual(self.evicted, ['a'])
+        print("Session expiry test passed!")
+
+    def test_sqlite_connection_is_reused(self):
+        """Test that session reads and writes reuse the thread's connection, reopened after the file is removed"""
+        db_path = os.path.join(self.tmp_dir, 'reused.sqlite3')
+        store = SQLiteSessionStore(db_path)
+        store.record_turn('a', 'q', 'a', None)
+        with mock.patch('utils.session_store.sqlite3.connect', wraps=sqlite3.connect) as connect:
+            for _ in range(3):
+                store.get('a')
+            store.stats()
+            self.assertEqual(connect.call_count, 0)
+        os.remove(db_path)
+        self.assertEqual(store.get('a')['conversation_history'], [])
+        self.assertEqual(store.stats()['sessions'], 1)
+        print("Session connection test passed!")
+
+    def test_session_ids_are_validated(self):
+        """Test that only generated session IDs are accepted, since they name directories"""
+        self.assertTrue(is_valid_session_id(new_session_id()))
+        self.assertFalse(is_valid_session_id('../data'))
+        self.assertFalse(is_valid_session_id(None))
+        print("Session ID test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import hashlib
+import io
+import os
+import shutil
+from utils.upload_store import UploadIntegrityError, UploadNotFoundError, UploadOffsetError, UploadStore
+
+class TestUploadStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = 'test_upload_data'
+        self.store = UploadStore(os.path.join(self.test_dir, '.uploads'), os.path.join(self.test_dir, '.blobs'))
+        self.content = b'0123456789' * 1000
+
+    def test_chunks_resume_after_interruption(self):
+        """Test that an upload resumes from the offset the store reports"""
+        upload_id = self.store.init('s1', 'doc.txt', len(self.content))['upload_id']
+        self.store.append(upload_id, 's1', 0, io.BytesIO(self.content[:4000]))
+
+        # A new store instance stands in for a restarted server
+        store = UploadStore(self.store.upload_dir, self.store.blob_dir)
+        offset = store.status(upload_id, 's1')['offset']
+        self.assertEqual(offset, 4000)
+        store.append(upload_id, 's1', offset, io.BytesIO(self.content[offset:]))
+        file_path, digest, duplicate = store.commit(upload_id, 's1', os.path.join(self.test_dir, 's1'),
+                                                    sha256=hashlib.sha256(self.content).hexdigest())
+
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(digest, hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(duplicate)
+        print("Upload resume test passed!")
+
+    def test_wrong_offset_is_rejected(self):
+        """Test that a chunk for the wrong offset is refused with the expected offset"""
+        upload_id = self.store.init('s1', 'doc.txt')['upload_id']
+        self.store.append(upload_id, 's1', 0, io.BytesIO(self.content[:100]))
+        with self.assertRaises(UploadOffsetError) as raised:
+            self.store.append(upload_id, 's1', 0, io.BytesIO(self.content[:100]))
+        self.assertEqual(raised.exception.expected, 100)
+        self.assertEqual(self.store.status(upload_id, 's1')['offset'], 100)
+        print("Upload offset test passed!")
+
+    def test_integrity_and_ownership_are_checked(self):
+        """Test that size and SHA-256 mismatches fail and other sessions cannot see an upload"""
+        upload_id = self.store.init('s1', 'doc.txt', len(self.content))['upload_id']
+        with self.assertRaises(UploadNotFoundError):
+            self.store.status(upload_id, 's2')
+        self.store.append(upload_id, 's1', 0, io.BytesIO(self.content[:10]))
+        with self.assertRaises(UploadIntegrityError):
+            self.store.commit(upload_id, 's1', self.test_dir)
+        self.store.append(upload_id, 's1', 10, io.BytesIO(self.content[10:]))
+        with self.assertRaises(UploadIntegrityError):
+            self.store.commit(upload_id, 's1', self.test_dir, sha256='0' * 64)
+        print("Upload integrity test passed!")
+
+    def test_duplicate_content_is_stored_once(self):
+        """Test that the same bytes uploaded twice share one blob until both files are gone"""
+        first, digest, duplicate = self.store.save('s1', 'a.txt', io.BytesIO(self.content),
+                                                   os.path.join(self.test_dir, 's1'))
+        self.assertFalse(duplicate)
+        second, same_digest, duplicate = self.store.save('s2', 'b.txt', io.BytesIO(self.content),
+                                                         os.path.join(self.test_dir, 's2'))
+        self.assertTrue(duplicate)
+        self.assertEqual(digest, same_digest)
+        self.assertEqual(os.stat(first).st_ino, os.stat(second).st_ino)
+
+        os.remove(first)
+        self.assertEqual(self.store.collect_garbage(), [])
+        os.remove(second)
+        self.assertEqual(self.store.collect_garbage(), [digest])
+        self.assertFalse(os.path.exists(self.store.blob_path(digest)))
+        print("Upload dedup test passed!")
+
+    def test_release_removes_only_unlinked_blob(self):
+        """Test that release removes a replaced file's blob once nothing links to it"""
+        directory = os.path.join(self.test_dir, 's1')
+        _, old_digest, _ = self.store.save('s1', 'a.txt', io.BytesIO(self.content), directory)
+        self.store.save('s1', 'copy.txt', io.BytesIO(self.content), directory)
+        self.store.save('s1', 'a.txt', io.BytesIO(b'new content'), directory)
+        self.assertFalse(self.store.release(old_digest))  # copy.txt still links to it
+        os.remove(os.path.join(directory, 'copy.txt'))
+        self.assertTrue(self.store.release(old_digest))
+        self.assertFalse(os.path.exists(self.store.blob_path(old_digest)))
+        self.assertFalse(self.store.release(old_digest))
+        print("Upload release test passed!")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+import numpy as np
+from utils.vector_index import HashingEmbedder, VectorIndex, fuse_rankings
+from utils.segments import make_segments
+
+class TestVectorIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        filler = " ".join(f"filler{i}" for i in range(60))
+        self.segments = {
+            'report.pdf': list(make_segments([
+                ('page', filler, 'page 1'),
+                ('page', 'The quarterly revenue was 42 million dollars.', 'page 2'),
+            ])),
+            'notes.txt': list(make_segments([('lines', f'The office cat is named Biscuit. {filler}', 'lines 1-3')])),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def build(self, dtype):
+        index = VectorIndex(os.path.join(self.tmp_dir, dtype), HashingEmbedder(256), dtype=dtype,
+                            chunk_size=20, overlap=5, batch_size=2)
+        for name, segments in self.segments.items():
+            index.add_document(name, f'key-{name}', segments)
+        return index
+
+    def test_search_float16_and_int8(self):
+        """Test that both storage types rank the matching chunk first"""
+        for dtype in ('float16', 'int8'):
+            index = self.build(dtype)
+            result = index.search("quarterly revenue in dollars", top_k=3)[0]
+            self.assertEqual((result['file'], result['source']), ('report.pdf', 'page 2'))
+            self.assertIn('42 million', result['text'])
+            self.assertEqual(index.search("office cat", top_k=1)[0]['file'], 'notes.txt')
+        print("Vector search test passed!")
+
+    def test_shards_persist_and_are_replaced(self):
+        """Test that shards survive a restart and a changed document replaces its shard"""
+        index = self.build('float16')
+        reopened = VectorIndex(index.index_dir, HashingEmbedder(256), chunk_size=20, overlap=5)
+        self.assertTrue(reopened.has_document('notes.txt', 'key-notes.txt'))
+        reopened.add_document('notes.txt', 'key-new', make_segments([('lines', 'Costs fell sharply.', 'lines 1-1')]))
+        self.assertEqual(reopened.search("costs fell", top_k=1)[0]['text'], 'Costs fell sharply.')
+        reopened.remove_document('report.pdf')
+        self.assertEqual(reopened.document_names(), ['notes.txt'])
+        self.assertEqual(len([n for n in os.listdir(index.index_dir) if n.endswith('.jsonl')]), 1)
+        print("Vector persistence test passed!")
+
+    def test_queries_reuse_open_shards(self):
+        """Test that repeated queries open no files and still see documents added by another process"""
+        index = self.build('int8')
+        index.search("office cat", top_k=1)
+        with mock.patch('utils.vector_index.np.load', side_effect=AssertionError('shard reopened')), \
+                mock.patch('utils.vector_index.json.load', side_effect=AssertionError('manifest reread')):
+            self.assertEqual(index.search("office cat", top_k=1)[0]['file'], 'notes.txt')
+
+        other = VectorIndex(index.index_dir, HashingEmbedder(256), dtype='int8', chunk_size=20, overlap=5)
+        other.add_document('minutes.txt', 'key-minutes',
+                           make_segments([('lines', 'The budget vote passed.', 'lines 1-1')]))
+        self.assertEqual(index.search("budget vote", top_k=1)[0]['file'], 'minutes.txt')
+        print("Shard reuse test passed!")
+
+    def test_search_survives_concurrent_removal(self):
+        """Test that a query keeps the shards it started with and skips shards removed before it opened them"""
+        index = self.build('float16')
+        snapshot = index._snapshot
+
+        def remove_during_query(prefix):
+            taken = snapshot(prefix)
+            index.remove_document('notes.txt')  # deletes the shard files mid-query
+            return taken
+
+        with mock.patch.object(index, '_snapshot', side_effect=remove_during_query):
+            self.assertEqual(index.search("office cat", top_k=1)[0]['file'], 'notes.txt')
+
+        other = VectorIndex(index.index_dir, HashingEmbedder(256), chunk_size=20, overlap=5)
+        entry = other._read_manifest()['report.pdf']
+        os.remove(other._shard_path(entry['shard'], '.jsonl'))
+        self.assertEqual(other.search("quarterly revenue", top_k=1), [])
+        print("Concurrent removal test passed!")
+
+    def test_embedder_is_normalized_and_stable(self):
+        """Test that hashed embeddings are unit length and identical across calls"""
+        embedder = HashingEmbedder(128)
+        first, second = embedder.embed(["the same text", "the same text"])
+        self.assertAlmostEqual(float(np.linalg.norm(first)), 1.0, places=5)
+        np.testing.assert_array_equal(first, second)
+        print("Embedder test passed!")
+
+    def test_fuse_rankings(self):
+        """Test that reciprocal rank fusion favours passages found by both rankings"""
+        a = {'file': 'a', 'source': None, 'text': 'a', 'score': 1.0}
+        b = {'file': 'b', 'source': None, 'text': 'b', 'score': 1.0}
+        c = {'file': 'c', 'source': None, 'text': 'c', 'score': 1.0}
+        fused = fuse_rankings([[a, b], [c, b]], top_k=2)
+        self.assertEqual(fused[0]['file'], 'b')
+        self.assertEqual(len(fused), 2)
+        print("Rank fusion test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import threading
+import time
+from utils.llm_backends import FakeBackend
+from utils.work_queue import BoundedWorkQueue, QueueFullError
+
+class TestBoundedWorkQueue(unittest.TestCase):
+    def test_concurrency_is_limited(self):
+        """Test that no more than max_concurrency requests run at once"""
+        queue = BoundedWorkQueue('test', max_concurrency=2, max_queue_depth=10)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with queue.slot():
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.02)
+                with lock:
+                    running.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max(peak), 2)
+        stats = queue.stats()
+        self.assertEqual(stats['completed'], 6)
+        self.assertGreater(stats['wait_ms_max'], 0)
+        print("Concurrency limit test passed!")
+
+    def test_full_queue_rejects(self):
+        """Test that requests beyond the queue depth are rejected"""
+        queue = BoundedWorkQueue('test', max_concurrency=1, max_queue_depth=0)
+        queue.acquire()
+        with self.assertRaises(QueueFullError):
+            queue.acquire()
+        queue.release()
+        self.assertEqual(queue.stats()['rejected'], 1)
+        print("Full queue test passed!")
+
+    def test_wait_times_out(self):
+        """Test that a queued request gives up after the timeout"""
+        queue = BoundedWorkQueue('test', max_concurrency=1, max_queue_depth=1, timeout=0.05)
+        queue.acquire()
+        with self.assertRaises(QueueFullError):
+            queue.acquire()
+        print("Queue timeout test passed!")
+
+class TestFakeBackend(unittest.TestCase):
+    def test_fake_backend_is_deterministic(self):
+        """Test that the fake backend streams the same answer it completes"""
+        backend = FakeBackend()
+        answer = backend.complete('Question: what?')
+        self.assertEqual(answer, backend.complete('Question: what?'))
+        self.assertEqual(''.join(backend.stream('Question: what?')), answer)
+        print("Fake backend test passed!")
+
+if __name__ == '__main__':
+    unittest.main()
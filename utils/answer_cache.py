@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+QUESTION_TERM_PATTERN = re.compile(r"\w+")
+
+
+def normalize_question(question):
+    """Lowercase a question and reduce it to its words, ignoring punctuation and spacing."""
+    return " ".join(QUESTION_TERM_PATTERN.findall(question.lower()))
+
+
+def token_overlap(a, b):
+    """Jaccard similarity of the word sets of two normalized questions."""
+    a_terms, b_terms = set(a.split()), set(b.split())
+    if not a_terms or not b_terms:
+        return 0.0
+    return len(a_terms & b_terms) / len(a_terms | b_terms)
+
+
+class AnswerCache:
+    """Answers to previously asked questions, with TTL and LRU eviction.
+
+    Entries are grouped by scope, a digest of everything besides the question
+    that shapes the answer: the document content key, backend, model and the
+    conversation history and summary in the prompt. With near_duplicate enabled, a
+    question whose word overlap with a cached question in the same scope
+    reaches similarity_threshold is also a hit.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, near_duplicate=False, similarity_threshold=0.85):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_duplicate = near_duplicate
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # (scope, normalized question) -> (answer, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope(content_key, backend, model, history, summary=None):
+        digest = hashlib.sha256()
+        for part in (content_key, backend, model or '', summary or ''):
+            digest.update(part.encode('utf-8') + b'\0')
+        for question, answer in history:
+            digest.update(question.encode('utf-8') + b'\0' + answer.encode('utf-8') + b'\0')
+        return digest.hexdigest()
+
+    def get(self, scope, question):
+        """Return the cached answer for a question, or None."""
+        normalized = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            key = (scope, normalized)
+            entry = self._entries.get(key)
+            if entry is None and self.near_duplicate:
+                key, entry = self._find_similar(scope, normalized, now)
+            if entry is not None and entry[1] < now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if key[1] != normalized:
+                self.near_hits += 1
+                logger.info(f"Answer cache near-duplicate hit: '{normalized}' ~ '{key[1]}'")
+            return entry[0]
+
+    def put(self, scope, question, answer):
+        with self._lock:
+            key = (scope, normalize_question(question))
+            self._entries[key] = (answer, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'near_duplicate_hits': self.near_hits,
+                'misses': self.misses
+            }
+
+    def _find_similar(self, scope, normalized, now):
+        best_key, best_entry, best_score = None, None, self.similarity_threshold
+        for key, entry in self._entries.items():
+            if key[0] != scope or entry[1] < now:
+                continue
+            score = token_overlap(normalized, key[1])
+            if score >= best_score:
+                best_key, best_entry, best_score = key, entry, score
+        return best_key, best_entry
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import random
+import threading
+from contextlib import aclosing
+
+from utils.llm_backends import SYSTEM_PROMPT, max_tokens_argument
+
+logger = logging.getLogger(__name__)
+
+
+async def iterate_in_thread(tokens):
+    """Yield from a blocking generator without blocking the event loop.
+
+    Each next() runs in a worker thread. When the consumer goes away (the
+    client disconnected and the task was cancelled), the generator is closed
+    once the next() still running in its thread has returned: closing a
+    generator that another thread is executing raises ValueError and leaves
+    it open, and a Llama context would keep decoding for nobody.
+    """
+    done = object()
+    lock = threading.Lock()
+
+    def step():
+        with lock:
+            return next(tokens, done)
+
+    def close():
+        with lock:
+            tokens.close()
+
+    try:
+        while True:
+            token = await asyncio.to_thread(step)
+            if token is done:
+                return
+            yield token
+    finally:
+        # Shielded, so the generator is closed even if this await is cancelled again
+        await asyncio.shield(asyncio.to_thread(close))
+
+
+class AsyncOpenAIBackend:
+    """OpenAI chat completions for the async server.
+
+    All requests share one pooled httpx.AsyncClient, so connections are kept
+    alive across questions and at most max_connections are open at once.
+    Rate-limited requests are retried with exponential backoff and full
+    jitter (honouring Retry-After when the server sends it); the SDK's own
+    retries are turned off so attempts are not multiplied.
+    """
+
+    name = 'openai'
+
+    def __init__(self, api_key, model="gpt-3.5-turbo", base_url=None, max_connections=100, timeout=60.0,
+                 connect_timeout=5.0, max_retries=5, backoff_base=0.5, backoff_max=8.0, http_client=None):
+        import httpx
+        from openai import AsyncOpenAI
+        self.http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+        self.model = model
+        self.model_name = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limited = 0
+        self.retries = 0
+        logger.info(f"Async OpenAI client initialized with up to {max_connections} pooled connections")
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = getattr(getattr(error, 'response', None), 'headers', {}).get('retry-after')
+        try:
+            delay = max(delay, min(float(retry_after), self.backoff_max)) if retry_after else delay
+        except ValueError:
+            pass
+        return delay
+
+    async def _create(self, prompt, **kwargs):
+        from openai import RateLimitError
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.client.chat.completions.create(
+                    model=self.model, messages=self._messages(prompt), **kwargs
+                )
+            except RateLimitError as e:
+                self.rate_limited += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                self.retries += 1
+                logger.warning(f"OpenAI rate limit hit, retrying in {delay:.2f} s (attempt {attempt + 1})")
+                await asyncio.sleep(delay)
+
+    async def complete(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        response = await self._create(prompt, **max_tokens_argument(max_tokens))
+        return response.choices[0].message.content
+
+    async def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        stream = await self._create(prompt, stream=True, **max_tokens_argument(max_tokens))
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing the response hands the connection back to the pool,
+            # also when the client disconnected and the generator was cancelled
+            await stream.close()
+
+    def _messages(self, prompt):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def stats(self):
+        return {'rate_limited': self.rate_limited, 'retries': self.retries}
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+class ThreadedAsyncBackend:
+    """Runs a synchronous backend (Llama, fake) in worker threads for the async server."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.model_name = backend.model_name
+
+    async def complete(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        return await asyncio.to_thread(self.backend.complete, prompt, cache_key=cache_key, timings=timings,
+                                       max_tokens=max_tokens)
+
+    async def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        tokens = self.backend.stream(prompt, cache_key=cache_key, timings=timings, max_tokens=max_tokens)
+        # Closing the backend generator stops generation (and frees a Llama context) when the client goes away
+        async with aclosing(iterate_in_thread(tokens)) as stream:
+            async for token in stream:
+                yield token
+
+    def stats(self):
+        return self.backend.stats()
+
+    async def aclose(self):
+        pass
+
+
+class LazyAsyncBackend:
+    """An async backend that is constructed on first use, or in the background by start_warm_up().
+
+    The async counterpart of LazyBackend: name and model_name come from the
+    configuration, so asgi.py can set up its queue without importing openai
+    or opening an HTTP client pool. The first call constructs the backend
+    in a worker thread, off the event loop.
+    """
+
+    def __init__(self, factory, name, model_name=None):
+        self._factory = factory
+        self.name = name
+        self.model_name = model_name
+        self._backend = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The real backend, constructed now if needed."""
+        backend = self._backend
+        if backend is not None:
+            return backend
+        with self._lock:
+            if self._backend is None:
+                self._backend = self._factory()
+            return self._backend
+
+    def start_warm_up(self):
+        """Construct the backend on a background thread; returns the thread."""
+        def warm_up():
+            try:
+                self.get()
+            except Exception as e:
+                logger.error(f"Error initializing async LLM backend {self.name}: {str(e)}")
+
+        thread = threading.Thread(target=warm_up, name=f"{self.name}-async-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    async def _get(self):
+        return self._backend or await asyncio.to_thread(self.get)
+
+    async def complete(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        backend = await self._get()
+        return await backend.complete(prompt, cache_key=cache_key, timings=timings, max_tokens=max_tokens)
+
+    async def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        backend = await self._get()
+        tokens = backend.stream(prompt, cache_key=cache_key, timings=timings, max_tokens=max_tokens)
+        async with aclosing(tokens) as stream:
+            async for token in stream:
+                yield token
+
+    def stats(self):
+        # Reporting statistics must not construct the backend
+        return self._backend.stats() if self._backend is not None else {}
+
+    async def aclose(self):
+        if self._backend is not None:
+            await self._backend.aclose()
+
+
+def create_async_backend(llm_config, sync_backend, lazy=False):
+    """Async counterpart of the configured backend: native for OpenAI, threaded otherwise.
+
+    With lazy=True the OpenAI backend is a LazyAsyncBackend, so nothing is
+    imported or opened until it is first used or warmed up; the threaded
+    backend only wraps sync_backend and is built right away.
+    """
+    if llm_config['backend'] != 'openai':
+        return ThreadedAsyncBackend(sync_backend)
+    if lazy:
+        return LazyAsyncBackend(lambda: create_async_backend(llm_config, sync_backend), 'openai',
+                                model_name=llm_config['openai'].get('model', "gpt-3.5-turbo"))
+    openai_config = llm_config['openai']
+    async_config = openai_config.get('async') or {}
+    return AsyncOpenAIBackend(
+        api_key=openai_config['api_key'],
+        model=openai_config.get('model', "gpt-3.5-turbo"),
+        base_url=openai_config.get('base_url'),
+        max_connections=async_config.get('max_connections', 100),
+        timeout=async_config.get('timeout', 60.0),
+        connect_timeout=async_config.get('connect_timeout', 5.0),
+        max_retries=async_config.get('max_retries', 5),
+        backoff_base=async_config.get('backoff_base', 0.5),
+        backoff_max=async_config.get('backoff_max', 8.0)
+    )
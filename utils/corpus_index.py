@@ -0,0 +1,238 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from utils.retrieval import chunk_segments, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Words too common to help ranking; leaving them out keeps OR queries
+# from touching most of the postings in a large corpus
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me of on or "
+    "please tell that the this to was what when where which who why will with you".split()
+)
+
+# Stored as PRAGMA user_version; an index of an older version is dropped and
+# rebuilt, as startup re-indexes every file the index does not have
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    content_key TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    indexed_at REAL NOT NULL,
+    -- The document's chunks are the rows first_rowid..last_rowid of chunks, so they are
+    -- deleted by rowid rather than by the unindexed document_id column
+    first_rowid INTEGER,
+    last_rowid INTEGER
+);
+CREATE INDEX IF NOT EXISTS documents_content_key ON documents (content_key);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+    text,
+    scope,
+    document_id UNINDEXED,
+    source UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+"""
+
+
+def build_match_query(question):
+    """Turn a free-text question into an FTS5 query that ORs its quoted terms."""
+    terms = [term for term in dict.fromkeys(tokenize(question)) if term not in STOPWORDS]
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def prefix_bounds(prefix):
+    """(low, high) such that a name starts with prefix exactly when low <= name < high."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def document_scope(name):
+    """The directory part of a document name ('<session>/<file>' gives '<session>')."""
+    return name.rpartition('/')[0]
+
+
+class CorpusIndex:
+    """Persistent full-text index over every uploaded document, in SQLite FTS5.
+
+    Documents are chunked from their segment stream and stored with their
+    content key, so re-uploading an unchanged file or restarting the server
+    does not re-index it. Searches rank chunks with FTS5's built-in BM25.
+    Each chunk also indexes its document's directory as scope, so a search
+    limited to one directory (one session) only matches and ranks that
+    directory's chunks.
+    """
+
+    def __init__(self, db_path, chunk_size=200, overlap=40):
+        self.db_path = db_path
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._write_lock = threading.Lock()
+        # One connection per thread, reused across calls
+        self._local = threading.local()
+        self._create_schema()
+
+    def _create_schema(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # One transaction, so workers starting together rebuild an old index once
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks'").fetchone():
+                    logger.warning(f"Corpus index has schema version {version}, rebuilding it")
+                conn.execute("DROP TABLE IF EXISTS chunks")
+                conn.execute("DROP TABLE IF EXISTS documents")
+                for statement in SCHEMA.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                # The scope only filters; it does not add to a chunk's score
+                conn.execute("INSERT INTO chunks (chunks, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _connection(self):
+        """This thread's connection, opened again if the database file was removed or replaced."""
+        try:
+            inode = os.stat(self.db_path).st_ino
+        except FileNotFoundError:
+            self._create_schema()
+            inode = os.stat(self.db_path).st_ino
+        local = self._local
+        if getattr(local, 'inode', None) != inode:
+            if getattr(local, 'conn', None) is not None:
+                local.conn.close()
+            local.conn = sqlite3.connect(self.db_path, timeout=30)
+            local.inode = inode
+        return local.conn
+
+    def has_document(self, name, content_key):
+        row = self._connection().execute("SELECT content_key FROM documents WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == content_key
+
+    def add_document(self, name, content_key, segments):
+        """Index a document's segments, replacing any older version of it."""
+        started = time.perf_counter()
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                self._delete(conn, name)
+                cursor = conn.execute(
+                    "INSERT INTO documents (name, content_key, chunk_count, indexed_at) VALUES (?, ?, 0, ?)",
+                    (name, content_key, time.time())
+                )
+                document_id = cursor.lastrowid
+                scope = document_scope(name)
+                count, first_rowid, last_rowid = 0, None, None
+                for chunk in chunk_segments(segments, self.chunk_size, self.overlap):
+                    last_rowid = conn.execute(
+                        "INSERT INTO chunks (text, scope, document_id, source) VALUES (?, ?, ?, ?)",
+                        (chunk.text, scope, document_id, chunk.source)
+                    ).lastrowid
+                    if first_rowid is None:
+                        first_rowid = last_rowid
+                    count += 1
+                conn.execute(
+                    "UPDATE documents SET chunk_count = ?, first_rowid = ?, last_rowid = ? WHERE id = ?",
+                    (count, first_rowid, last_rowid, document_id)
+                )
+        logger.info(f"Indexed {count} chunks of {name} into corpus in {time.perf_counter() - started:.2f} s")
+        return count
+
+    def copy_document(self, name, content_key):
+        """Index name with the chunks of a document that has the same content.
+
+        Returns False, changing nothing, if no such document is indexed.
+        """
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                row = conn.execute(
+                    "SELECT chunk_count, first_rowid, last_rowid FROM documents "
+                    "WHERE content_key = ? AND name != ? LIMIT 1",
+                    (content_key, name)
+                ).fetchone()
+                if row is None:
+                    return False
+                self._delete(conn, name)
+                # The copies get the rowids after the current last one, in the same order
+                end = conn.execute("SELECT coalesce(max(rowid), 0) FROM chunks").fetchone()[0]
+                first_rowid, last_rowid = (end + 1, end + row[0]) if row[0] else (None, None)
+                cursor = conn.execute(
+                    "INSERT INTO documents (name, content_key, chunk_count, indexed_at, first_rowid, last_rowid) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, content_key, row[0], time.time(), first_rowid, last_rowid)
+                )
+                if row[0]:
+                    conn.execute(
+                        "INSERT INTO chunks (rowid, text, scope, document_id, source) "
+                        "SELECT rowid - ? + ?, text, ?, ?, source FROM chunks WHERE rowid BETWEEN ? AND ?",
+                        (row[1], first_rowid, document_scope(name), cursor.lastrowid, row[1], row[2])
+                    )
+        logger.info(f"Copied {row[0]} corpus chunks into {name} from a document with the same content")
+        return True
+
+    def remove_document(self, name):
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                self._delete(conn, name)
+
+    def document_names(self, prefix=''):
+        """Names of the indexed documents that start with prefix, in order; a range scan of the name index."""
+        if not prefix:
+            return [row[0] for row in self._connection().execute("SELECT name FROM documents ORDER BY name")]
+        return [row[0] for row in self._connection().execute(
+            "SELECT name FROM documents WHERE name >= ? AND name < ? ORDER BY name", prefix_bounds(prefix)
+        )]
+
+    def clear(self):
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM chunks")
+                conn.execute("DELETE FROM documents")
+        logger.info("Corpus index cleared")
+
+    def search(self, question, top_k=5, prefix=''):
+        """Return the top_k chunks as dicts with file, source, text and score.
+
+        Only documents whose name starts with prefix are searched. A prefix
+        that ends in '/' also limits the match to that directory's scope, so
+        chunks of other directories are not ranked at all.
+        """
+        query = build_match_query(question)
+        if not query:
+            return []
+        query = f"text : ({query})"
+        if prefix.endswith('/'):
+            scope = prefix[:-1].replace('"', '""')
+            query = f'scope : ^"{scope}" AND {query}'
+        rows = self._connection().execute(
+            "SELECT documents.name, chunks.source, chunks.text, chunks.rank "
+            "FROM chunks JOIN documents ON documents.id = chunks.document_id "
+            "WHERE chunks MATCH ? AND substr(documents.name, 1, ?) = ? ORDER BY chunks.rank LIMIT ?",
+            (query, len(prefix), prefix, top_k)
+        ).fetchall()
+        # FTS5 ranks by negated BM25; flip it so higher is better
+        return [
+            {'file': name, 'source': source, 'text': text, 'score': round(-rank, 4)}
+            for name, source, text, rank in rows
+        ]
+
+    def _delete(self, conn, name):
+        row = conn.execute("SELECT id, first_rowid, last_rowid FROM documents WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            if row[1] is not None:
+                conn.execute("DELETE FROM chunks WHERE rowid BETWEEN ? AND ?", (row[1], row[2]))
+            conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
@@ -1,32 +1,178 @@
-from docx import Document
 import logging
+import zipfile
+import xml.etree.ElementTree as ET
+from utils.segments import join_segments, make_segments
 
 logger = logging.getLogger(__name__)
 
-def extract_text(file_path):
+EXTRACTOR_VERSION = 2
+
+DOCUMENT_PART = 'word/document.xml'
+
+# Report progress after about this many bytes of document.xml
+PROGRESS_BYTES = 1024 * 1024
+
+# Subtrees whose text duplicates text found elsewhere: the VML fallback of
+# drawings (text boxes) and the source of moved text in tracked changes
+SKIPPED = {'Fallback', 'moveFrom'}
+
+# The only elements the parser loop looks at; runs and cell properties are
+# read from their children when they end
+STRUCTURE = {'body', 'p', 'r', 'tbl', 'tr', 'tc', 'tcPr'} | SKIPPED
+
+# Run children and the text they stand for
+RUN_TEXT = {'tab': "\t", 'br': "\n", 'cr': "\n", 'noBreakHyphen': "-"}
+
+def local_name(tag):
+    """'{namespace}p' -> 'p', so transitional and strict OOXML parse alike."""
+    return tag.rpartition('}')[2]
+
+class _CountingReader:
+    """File wrapper that counts the bytes iterparse has consumed, for progress."""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+def format_cell(paragraphs):
+    """A cell's paragraphs as one field of a tab-separated row."""
+    text = " ".join(p for p in paragraphs if p.strip())
+    return text.replace("\t", " ").replace("\r", " ").replace("\n", " ").strip()
+
+def _iter_blocks(file_path, progress=None):
+    """Yield the body in document order as (kind, text, source).
+
+    word/document.xml is streamed out of the zip with iterparse and every
+    finished top-level block is cleared, so memory stays flat however large
+    the document is. A paragraph becomes a 'paragraph' segment and a table
+    row a tab-separated 'table_row' segment. A cell spanning several grid
+    columns appears once, followed by empty fields that keep the columns
+    aligned; cells that continue a vertical merge are left empty instead of
+    repeating the merged text. Nested tables are flattened into their cell.
+    """
+    names = {}  # tag -> local name
+    with zipfile.ZipFile(file_path) as package:
+        total_bytes = package.getinfo(DOCUMENT_PART).file_size
+        with package.open(DOCUMENT_PART) as part:
+            reader = _CountingReader(part)
+            paragraphs = []     # text buffers of the open paragraphs (text boxes nest them)
+            rows = []           # field lists of the open table rows
+            cells = []          # open cells: [paragraph texts, grid span, continues a vertical merge]
+            body = table = None
+            open_tables = skip_depth = 0
+            paragraph_number = table_number = row_number = 0
+            reported = 0
+
+            for event, elem in ET.iterparse(reader, events=('start', 'end')):
+                name = names.get(elem.tag)
+                if name is None:
+                    name = names[elem.tag] = local_name(elem.tag)
+                if name not in STRUCTURE:
+                    continue
+                if name in SKIPPED:
+                    skip_depth += 1 if event == 'start' else -1
+                    continue
+                if skip_depth:
+                    continue
+
+                if event == 'start':
+                    if name == 'p':
+                        paragraphs.append([])
+                    elif name == 'tc':
+                        cells.append([[], 1, False])
+                    elif name == 'tr':
+                        rows.append([])
+                    elif name == 'tbl':
+                        if not open_tables:
+                            table = elem
+                            table_number += 1
+                            row_number = 0
+                        open_tables += 1
+                    elif name == 'body':
+                        body = elem
+                    continue
+
+                top_level_done = False
+                if name == 'r':
+                    if paragraphs:
+                        for child in elem:
+                            child_name = names.get(child.tag) or local_name(child.tag)
+                            if child_name == 't':
+                                if child.text:
+                                    paragraphs[-1].append(child.text)
+                            elif child_name in RUN_TEXT:
+                                paragraphs[-1].append(RUN_TEXT[child_name])
+                elif name == 'p':
+                    text = "".join(paragraphs.pop())
+                    if paragraphs:
+                        # A text box inside a paragraph
+                        paragraphs[-1].append(f" {text}")
+                    elif cells:
+                        cells[-1][0].append(text)
+                    else:
+                        paragraph_number += 1
+                        top_level_done = True
+                        if text.strip():
+                            yield 'paragraph', text, f"paragraph {paragraph_number}"
+                elif name == 'tcPr':
+                    if cells:
+                        namespace = elem.tag[:-len(name)]
+                        for child in elem:
+                            child_name = local_name(child.tag)
+                            if child_name == 'gridSpan':
+                                cells[-1][1] = max(1, int(child.get(f'{namespace}val', 1)))
+                            elif child_name == 'vMerge':
+                                cells[-1][2] = child.get(f'{namespace}val', 'continue') == 'continue'
+                elif name == 'tc':
+                    texts, span, merged = cells.pop()
+                    if rows:
+                        rows[-1].append("" if merged else format_cell(texts))
+                        rows[-1].extend([""] * (span - 1))
+                elif name == 'tr':
+                    fields = rows.pop()
+                    while fields and not fields[-1]:
+                        fields.pop()
+                    if cells:
+                        # A row of a nested table belongs to the enclosing cell
+                        cells[-1][0].append(" ".join(f for f in fields if f))
+                    else:
+                        row_number += 1
+                        if fields:
+                            yield 'table_row', "\t".join(fields), f"table {table_number} row {row_number}"
+                        table.clear()
+                elif name == 'tbl':
+                    open_tables -= 1
+                    top_level_done = not open_tables
+
+                if top_level_done and body is not None:
+                    # Drop finished blocks so the tree never holds more than the current one
+                    body.clear()
+                    if progress and reader.bytes_read - reported >= PROGRESS_BYTES:
+                        reported = reader.bytes_read
+                        progress(reported, total_bytes, 'byte')
+    if progress:
+        progress(total_bytes, total_bytes, 'byte')
+
+def iter_segments(file_path, progress=None):
+    """Yield paragraphs and table rows in document order."""
+    yield from make_segments(_iter_blocks(file_path, progress))
+
+def extract_text(file_path, progress=None):
     try:
         logger.info(f"Extracting text from Word document: {file_path}")
-        doc = Document(file_path)
-        text = ""
-        
-        # Extract text from paragraphs
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():  # Only add non-empty paragraphs
-                text += paragraph.text + "\n"
-        
-        # Extract text from tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    if cell.text.strip():  # Only add non-empty cells
-                        text += cell.text + "\n"
-        
+        text = join_segments(iter_segments(file_path, progress))
+
         if not text.strip():
             logger.warning(f"No text content found in document: {file_path}")
             return "No text content found in document."
-            
+
         logger.info(f"Successfully extracted text from Word document: {file_path}")
         return text
     except Exception as e:
         logger.error(f"Error extracting text from Word document {file_path}: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
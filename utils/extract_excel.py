@@ -1,23 +1,64 @@
 from openpyxl import load_workbook
 import logging
+from utils.segments import join_segments, make_segments
 
 logger = logging.getLogger(__name__)
 
-def extract_text(file_path):
+EXTRACTOR_VERSION = 2
+
+# Per-sheet limits; rows and columns beyond them are left out of the text
+MAX_ROWS_PER_SHEET = 100_000
+MAX_COLUMNS = 64
+
+def format_cell(value):
+    """Render a cell value compactly for a tab-separated row."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).replace("\t", " ").replace("\r", " ").replace("\n", " ")
+
+def _iter_rows(file_path, max_rows, max_columns, progress):
+    """Yield the workbook as (kind, text, source): a header per sheet, then one tab-separated line per row.
+
+    The workbook is streamed in read-only mode with cached formula values, so
+    memory stays flat however many rows a sheet has. Empty rows and trailing
+    empty cells are skipped.
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
     try:
-        logger.info(f"Extracting text from Excel file: {file_path}")
-        wb = load_workbook(file_path)
-        text = ""
-        for sheet in wb.sheetnames:
+        for number, sheet in enumerate(wb.sheetnames, start=1):
             logger.info(f"Processing sheet: {sheet}")
-            ws = wb[sheet]
-            for row in ws.iter_rows():
-                for cell in row:
-                    if cell.value:
-                        text += str(cell.value) + " "
-                text += "\n"
+            yield 'sheet', f"## Sheet: {sheet}", sheet
+            rows = 0
+            for row_number, values in enumerate(wb[sheet].iter_rows(max_col=max_columns, values_only=True), start=1):
+                cells = [format_cell(value) for value in values]
+                while cells and not cells[-1]:
+                    cells.pop()
+                if not cells:
+                    continue
+                if rows == max_rows:
+                    logger.warning(f"Sheet {sheet} truncated after {max_rows} rows")
+                    yield 'sheet_row', f"(truncated after {max_rows} rows)", f"{sheet}!{row_number}"
+                    break
+                rows += 1
+                yield 'sheet_row', "\t".join(cells), f"{sheet}!{row_number}"
+            if progress:
+                progress(number, len(wb.sheetnames), 'sheet')
+    finally:
+        # Read-only workbooks keep the file open until closed
+        wb.close()
+
+def iter_segments(file_path, progress=None, max_rows=MAX_ROWS_PER_SHEET, max_columns=MAX_COLUMNS):
+    """Yield a segment per sheet header and per non-empty row."""
+    yield from make_segments(_iter_rows(file_path, max_rows, max_columns, progress))
+
+def extract_text(file_path, progress=None, max_rows=MAX_ROWS_PER_SHEET, max_columns=MAX_COLUMNS):
+    try:
+        logger.info(f"Extracting text from Excel file: {file_path}")
+        text = join_segments(iter_segments(file_path, progress, max_rows, max_columns))
         logger.info(f"Successfully extracted text from Excel file: {file_path}")
         return text
     except Exception as e:
         logger.error(f"Error extracting text from Excel file {file_path}: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
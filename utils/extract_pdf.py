@@ -1,17 +1,142 @@
 import pdfplumber
+import io
 import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils.segments import join_segments, make_segments, recording
 
 logger = logging.getLogger(__name__)
 
-def extract_text(file_path):
+EXTRACTOR_VERSION = 1
+
+# Below this many pages, starting worker processes costs more than it saves
+PARALLEL_MIN_PAGES = 16
+# Shards per worker; more, smaller shards balance uneven pages better
+SHARDS_PER_WORKER = 4
+
+# Worker pools by size, started on first use and shared by every PDF after
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _start_method():
+    """forkserver where available, so workers are not forked from a process whose
+    ingestion, logging and model threads may hold locks; spawn elsewhere."""
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def _get_pool(max_workers):
+    with _pools_lock:
+        pool = _pools.get(max_workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=max_workers,
+                                       mp_context=multiprocessing.get_context(_start_method()))
+            _pools[max_workers] = pool
+        return pool
+
+def _discard_pool(max_workers, pool):
+    """Forget a broken pool so the next PDF starts a new one."""
+    with _pools_lock:
+        if _pools.get(max_workers) is pool:
+            del _pools[max_workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _extract_page_range(file_path, start, stop):
+    """Extract pages [start, stop) in a worker process that opens the file itself."""
+    texts = []
+    with pdfplumber.open(file_path) as pdf:
+        for index in range(start, stop):
+            page = pdf.pages[index]
+            texts.append(page.extract_text() or "")
+            page.close()
+    return start, texts
+
+def _iter_serial(file_path, total, progress=None):
+    with pdfplumber.open(file_path) as pdf:
+        for number, page in enumerate(pdf.pages, start=1):
+            yield page.extract_text() or ""
+            # Drop pdfplumber's cached layout objects so memory stays flat
+            page.close()
+            if progress:
+                progress(number, total, 'page')
+
+def _iter_parallel(file_path, total, max_workers, progress=None):
+    """Yield page texts in order while shards finish in any order."""
+    shard_size = max(1, -(-total // (max_workers * SHARDS_PER_WORKER)))
+    finished = {}
+    next_start = 0
+    done = 0
+    pool = _get_pool(max_workers)
+    futures = []
+    try:
+        for start in range(0, total, shard_size):
+            futures.append(pool.submit(_extract_page_range, file_path, start, min(start + shard_size, total)))
+        for future in as_completed(futures):
+            start, shard = future.result()
+            finished[start] = shard
+            done += len(shard)
+            if progress:
+                progress(done, total, 'page')
+            while next_start in finished:
+                shard = finished.pop(next_start)
+                yield from shard
+                next_start += len(shard)
+    except (OSError, RuntimeError):
+        _discard_pool(max_workers, pool)
+        raise
+    finally:
+        # A reader that stops early leaves the shared pool to other PDFs
+        for future in futures:
+            future.cancel()
+
+def iter_pages(file_path, progress=None, max_workers=None):
+    """Yield the text of every page, in page order.
+
+    Large files are split into page ranges extracted by a process pool that
+    is started once and reused; small files, max_workers=1, or a pool that
+    cannot start fall back to extracting serially in this process.
+    """
+    with pdfplumber.open(file_path) as pdf:
+        total = len(pdf.pages)
+    max_workers = min(max_workers or os.cpu_count() or 1, max(total, 1))
+    if max_workers > 1 and total >= PARALLEL_MIN_PAGES:
+        logger.info(f"Extracting {total} PDF pages with {max_workers} worker processes")
+        pages = _iter_parallel(file_path, total, max_workers, progress)
+        try:
+            first = next(pages, None)
+        except (OSError, RuntimeError) as e:
+            # BrokenProcessPool is a RuntimeError; sandboxes may forbid forking
+            logger.warning(f"Parallel PDF extraction failed, falling back to serial: {str(e)}")
+        else:
+            if first is not None:
+                yield first
+                yield from pages
+            return
+    yield from _iter_serial(file_path, total, progress)
+
+def extract_pages(file_path, progress=None, max_workers=None):
+    """Return the text of every page, in page order."""
+    return list(iter_pages(file_path, progress, max_workers))
+
+def iter_segments(file_path, progress=None, max_workers=None):
+    """Yield one segment per page."""
+    yield from make_segments(
+        ('page', text, f"page {number}")
+        for number, text in enumerate(iter_pages(file_path, progress, max_workers), start=1)
+    )
+
+def extract_text_with_offsets(file_path, progress=None, max_workers=None):
+    """Return the document text and the character offset at which each page starts."""
+    text = io.StringIO()
+    offsets = [segment.offset for segment in recording(iter_segments(file_path, progress, max_workers), text)]
+    return text.getvalue(), offsets
+
+def extract_text(file_path, progress=None, max_workers=None):
     try:
         logger.info(f"Extracting text from PDF: {file_path}")
-        text = ""
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
+        text = join_segments(iter_segments(file_path, progress, max_workers))
         logger.info(f"Successfully extracted text from PDF: {file_path}")
         return text
     except Exception as e:
         logger.error(f"Error extracting text from PDF {file_path}: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
@@ -1,14 +1,39 @@
 import logging
+from utils.segments import join_segments, make_segments
 
 logger = logging.getLogger(__name__)
 
-def extract_text(file_path):
+EXTRACTOR_VERSION = 2
+
+# Lines are grouped into segments of about this many characters
+BLOCK_CHARS = 64 * 1024
+
+def _iter_blocks(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        lines = []
+        size = 0
+        first_line = 1
+        for line_number, line in enumerate(f, start=1):
+            lines.append(line)
+            size += len(line)
+            if size >= BLOCK_CHARS:
+                yield 'text', "".join(lines).removesuffix("\n"), f"lines {first_line}-{line_number}"
+                lines, size, first_line = [], 0, line_number + 1
+        if lines:
+            yield 'text', "".join(lines).removesuffix("\n"), f"lines {first_line}-{first_line + len(lines) - 1}"
+
+def iter_segments(file_path, progress=None):
+    """Yield the file as blocks of whole lines, reading it incrementally."""
+    yield from make_segments(_iter_blocks(file_path))
+    if progress:
+        progress(1, 1, 'file')
+
+def extract_text(file_path, progress=None):
     try:
         logger.info(f"Extracting text from {file_path}")
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = join_segments(iter_segments(file_path, progress))
         logger.info(f"Successfully extracted text from {file_path}")
         return content
     except Exception as e:
         logger.error(f"Error extracting text from {file_path}: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path):
+    """Return the SHA-256 hex digest of a file, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_extractor_version(extract_text):
+    """Return the EXTRACTOR_VERSION declared by the module of an extractor."""
+    module = sys.modules.get(extract_text.__module__)
+    return getattr(module, 'EXTRACTOR_VERSION', 0)
+
+
+class ExtractionCache:
+    """Extracted text keyed by file content hash and extractor version.
+
+    Entries live in a size-bounded in-memory LRU and are written through to
+    an on-disk store, so a restart does not re-parse documents either.
+    """
+
+    def __init__(self, cache_dir, max_entries=32, max_chars=50_000_000):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries = OrderedDict()
+        self._total_chars = 0
+        # file_path -> (mtime_ns, size, digest), so unchanged files are not re-hashed
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def key_for(self, file_path, extract_text):
+        """Return the cache key for a file and the extractor that reads it."""
+        stat = os.stat(file_path)
+        with self._lock:
+            known = self._digests.get(file_path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            digest = known[2]
+        else:
+            digest = file_digest(file_path)
+            with self._lock:
+                self._digests[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+        ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+        return f"{digest}-{ext}-v{get_extractor_version(extract_text)}"
+
+    def get_text(self, file_path, extract_text, progress=None):
+        """Return the extracted text of a file, running the extractor on a miss.
+
+        progress is passed on to the extractor when it has to run.
+        """
+        key = self.key_for(file_path, extract_text)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                logger.info(f"Extraction cache hit (memory) for {file_path}")
+                return self._entries[key]
+
+        text = self._read_disk(key)
+        if text is not None:
+            logger.info(f"Extraction cache hit (disk) for {file_path}")
+        else:
+            logger.info(f"Extraction cache miss for {file_path}")
+            text = extract_text(file_path, progress=progress) if progress else extract_text(file_path)
+            self._write_disk(key, text)
+        self._remember(key, text)
+        return text
+
+    def put(self, file_path, extract_text, text):
+        """Store text that was extracted elsewhere, e.g. joined from a segment stream."""
+        key = self.key_for(file_path, extract_text)
+        self._write_disk(key, text)
+        self._remember(key, text)
+        return text
+
+    def record_digest(self, file_path, digest):
+        """Remember the content hash of a file whose digest is already known, e.g. from its upload."""
+        stat = os.stat(file_path)
+        with self._lock:
+            self._digests[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+
+    def forget(self, file_path):
+        """Drop the remembered hash of a file path; returns the digest it had, if any.
+
+        The extracted text stays cached, since other files may have the same content.
+        """
+        with self._lock:
+            known = self._digests.pop(file_path, None)
+        return known[2] if known else None
+
+    def remove_content(self, digest):
+        """Delete every cached entry for a content hash, in memory and on disk."""
+        prefix = f"{digest}-"
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._total_chars -= len(self._entries.pop(key))
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(prefix):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def invalidate(self, file_path):
+        """Drop everything cached for a file that is about to change or go away."""
+        digest = self.forget(file_path)
+        if not digest:
+            return
+        self.remove_content(digest)
+        logger.info(f"Extraction cache invalidated for {file_path}")
+
+    def clear(self):
+        """Forget all in-memory entries (the disk store is removed with data/)."""
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._total_chars = 0
+        logger.info("Extraction cache cleared")
+
+    def _remember(self, key, text):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = text
+            self._total_chars += len(text)
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._total_chars > self.max_chars):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_chars -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key, text):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self._disk_path(key)}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, self._disk_path(key))
+        except (OSError, UnicodeError) as e:
+            logger.warning(f"Could not write extraction cache entry {key}: {str(e)}")
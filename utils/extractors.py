@@ -0,0 +1,40 @@
+import importlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# File extension -> extractor module. Every module provides
+# iter_segments(file_path, progress=None), a generator of Segments, and
+# extract_text(file_path, progress=None), which joins them into one string.
+EXTRACTORS = {
+    '.txt': 'utils.extract_txt',
+    '.pdf': 'utils.extract_pdf',
+    '.docx': 'utils.extract_docx',
+    '.xlsx': 'utils.extract_excel',
+}
+
+
+def register_extractor(file_ext, module_name):
+    """Register (or replace) the extractor module for a file extension."""
+    EXTRACTORS[file_ext.lower()] = module_name
+
+
+def get_extractor_module(file_path):
+    """Import and return the extractor module for a file, based on its extension."""
+    file_ext = os.path.splitext(file_path)[1].lower()
+    module_name = EXTRACTORS.get(file_ext)
+    if module_name is None:
+        raise ValueError(f"Unsupported file type: {file_ext}")
+    # Imported on first use so unused parsers (pdfplumber, openpyxl, ...) are never loaded
+    return importlib.import_module(module_name)
+
+
+def get_segment_iterator(file_path):
+    """Get the generator function that streams a file's segments."""
+    return get_extractor_module(file_path).iter_segments
+
+
+def get_file_extractor(file_path):
+    """Get the appropriate extractor based on file extension."""
+    return get_extractor_module(file_path).extract_text
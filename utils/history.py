@@ -0,0 +1,84 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize the conversation below in a few sentences. Keep the facts, names "
+    "and numbers needed to answer follow-up questions."
+)
+
+
+def format_turns(turns):
+    """Render turns exactly as they appear in the prompt."""
+    return "".join(f"Q: {q}\nA: {a}\n" for q, a in turns)
+
+
+def build_summary_prompt(summary, turns):
+    previous = f"Summary so far:\n{summary}\n\n" if summary else ""
+    return f"{SUMMARY_INSTRUCTIONS}\n\n{previous}Conversation:\n{format_turns(turns)}\nSummary:"
+
+
+class HistoryManager:
+    """Keeps the conversation part of each prompt within a token budget.
+
+    The newest turns are kept verbatim, at most max_recent_turns of them, as
+    long as they and the rolling summary fit budget_tokens. Older turns are
+    folded into the summary by summarize_fn on a background thread once an
+    answer has been sent, so summarizing never delays a response.
+    """
+
+    def __init__(self, count_tokens, budget_tokens=1000, max_recent_turns=6, summarize_fn=None):
+        self.count_tokens = count_tokens
+        self.budget_tokens = budget_tokens
+        self.max_recent_turns = max_recent_turns
+        self.summarize_fn = summarize_fn
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='summarize')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def select(self, history, summary=None):
+        """Split history into (older turns, recent turns) for the prompt.
+
+        Recent turns are sent verbatim; older turns are only represented by
+        the summary.
+        """
+        used = self.count_tokens(summary) if summary else 0
+        keep = 0
+        for q, a in reversed(history[-self.max_recent_turns:] if self.max_recent_turns else []):
+            cost = self.count_tokens(format_turns([(q, a)]))
+            if used + cost > self.budget_tokens:
+                break
+            used += cost
+            keep += 1
+        split = len(history) - keep
+        return history[:split], history[split:]
+
+    def schedule_summary(self, key, history, summary, on_summary):
+        """Fold the turns that no longer fit into the summary, in the background.
+
+        on_summary(new_summary, covered_turns) is called with the result. At
+        most one summary per key is in progress at a time.
+        """
+        if self.summarize_fn is None:
+            return None
+        older, _ = self.select(history, summary)
+        if not older:
+            return None
+        with self._lock:
+            if key in self._in_flight:
+                return None
+            self._in_flight.add(key)
+        return self._executor.submit(self._summarize, key, older, summary, on_summary)
+
+    def _summarize(self, key, older, summary, on_summary):
+        try:
+            new_summary = self.summarize_fn(build_summary_prompt(summary, older)).strip()
+            on_summary(new_summary, older)
+            logger.info(f"Summarized {len(older)} older turns into {self.count_tokens(new_summary)} tokens")
+        except Exception as e:
+            logger.warning(f"Could not summarize conversation history: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionJob:
+    """Status of one uploaded file moving through extraction and indexing."""
+
+    def __init__(self, file_name, file_path):
+        self.id = uuid.uuid4().hex
+        self.file_name = file_name
+        self.file_path = file_path
+        self.status = 'queued'
+        self.stage = None
+        self.progress = {'done': 0, 'total': None, 'unit': None}
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    def set_stage(self, stage):
+        self.stage = stage
+
+    def report_progress(self, done, total, unit):
+        """Progress callback handed to the extractors (pages, sheets, ...)."""
+        self.progress = {'done': done, 'total': total, 'unit': unit}
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'file': self.file_name,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class IngestionPipeline:
+    """Runs ingest_fn(job) for uploaded files on a pool of worker threads.
+
+    Jobs are remembered (up to max_jobs, oldest first out) so clients can
+    poll them, and the latest job per file path lets /ask wait for the
+    artifacts of a file that is still being ingested.
+    """
+
+    def __init__(self, ingest_fn, max_workers=2, max_jobs=1000):
+        self.ingest_fn = ingest_fn
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+        self._jobs = OrderedDict()
+        self._latest_by_path = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_name, file_path):
+        job = IngestionJob(file_name, file_path)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._latest_by_path[file_path] = job
+            while len(self._jobs) > self.max_jobs:
+                _, old = self._jobs.popitem(last=False)
+                if self._latest_by_path.get(old.file_path) is old:
+                    del self._latest_by_path[old.file_path]
+        self._executor.submit(self._run, job)
+        logger.info(f"Ingestion job {job.id} queued for {file_name}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait_for_file(self, file_path, timeout=None):
+        """Block until the latest job for a file is finished; returns the job or None."""
+        with self._lock:
+            job = self._latest_by_path.get(file_path)
+        if job is not None and not job.wait(timeout):
+            logger.warning(f"Timed out waiting for ingestion of {job.file_name}")
+        return job
+
+    def clear(self, path_prefix=None):
+        """Forget all jobs, or only those for files whose path starts with path_prefix."""
+        with self._lock:
+            if path_prefix is None:
+                self._jobs.clear()
+                self._latest_by_path.clear()
+                return
+            for job_id in [i for i, job in self._jobs.items() if job.file_path.startswith(path_prefix)]:
+                del self._jobs[job_id]
+            for file_path in [p for p in self._latest_by_path if p.startswith(path_prefix)]:
+                del self._latest_by_path[file_path]
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            self.ingest_fn(job)
+            job.status = 'done'
+            logger.info(f"Ingestion job {job.id} for {job.file_name} finished in "
+                        f"{time.time() - job.started_at:.2f} s")
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.error(f"Ingestion job {job.id} for {job.file_name} failed: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            job._finished.set()
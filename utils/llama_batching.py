@@ -0,0 +1,224 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class ThroughputMeter:
+    """Generated-token throughput across every context of the server."""
+
+    def __init__(self, window=10.0):
+        self.window = window
+        self.tokens_total = 0
+        self.requests_total = 0
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def record_tokens(self, count=1):
+        now = time.monotonic()
+        with self._lock:
+            self.tokens_total += count
+            self._events.append((now, count))
+            self._prune(now)
+
+    def record_request(self):
+        with self._lock:
+            self.requests_total += 1
+
+    def tokens_per_second(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            return sum(count for _, count in self._events) / self.window
+
+    def _prune(self, now):
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+
+class PrefixStateCache:
+    """LRU of saved llama_cpp context states, keyed per document and session.
+
+    Restoring a state puts its evaluated tokens back into a context, and
+    llama_cpp then only evaluates the part of the next prompt past the
+    longest common prefix.
+    """
+
+    def __init__(self, max_entries=4, max_bytes=2 * 1024 ** 3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._states = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+            return state
+
+    def put(self, key, state):
+        size = getattr(state, 'llama_state_size', 0)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._states.pop(key, None)
+            if old is not None:
+                self._total_bytes -= getattr(old, 'llama_state_size', 0)
+            self._states[key] = state
+            self._total_bytes += size
+            while len(self._states) > self.max_entries or self._total_bytes > self.max_bytes:
+                _, evicted = self._states.popitem(last=False)
+                self._total_bytes -= getattr(evicted, 'llama_state_size', 0)
+
+
+def count_reused_tokens(model, prompt_tokens):
+    """Number of leading prompt tokens already evaluated in a context."""
+    evaluated = model.input_ids[:model.n_tokens] if getattr(model, 'n_tokens', 0) else []
+    reused = 0
+    for cached, token in zip(evaluated, prompt_tokens):
+        if cached != token:
+            break
+        reused += 1
+    return reused
+
+
+class _Generation:
+    def __init__(self, prompt, max_tokens, cache_key=None, timings=None):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.cache_key = cache_key
+        self.timings = timings if timings is not None else {}
+        self.output = queue.Queue()
+        self.cancelled = False
+        self.submitted_at = time.perf_counter()
+
+
+class LlamaBatchScheduler:
+    """Continuously batches generation requests over a pool of llama_cpp contexts.
+
+    llama_cpp's Python API samples one sequence per context, so concurrent
+    requests are decoded side by side on separate contexts (each created by
+    model_factory, sharing the memory-mapped weights) rather than as one
+    multi-sequence batch. A request starts as soon as any context frees up,
+    so the set of sequences in flight changes continuously instead of in
+    fixed rounds.
+
+    With a state_cache, the context state after each request is saved under
+    the request's cache_key and restored before the next request with the
+    same key, wherever it is scheduled.
+    """
+
+    def __init__(self, model_factory, pool_size=1, throughput_window=10.0, state_cache=None):
+        self.pool_size = pool_size
+        self.state_cache = state_cache
+        self.meter = ThroughputMeter(throughput_window)
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self.active = 0
+        self._workers = []
+        for i in range(pool_size):
+            model = model_factory()
+            worker = threading.Thread(
+                target=self._run, args=(model,), name=f"llama-context-{i}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Llama batch scheduler started with {pool_size} context(s)")
+
+    def generate(self, prompt, max_tokens, cache_key=None, timings=None):
+        """Yield generated text for prompt once a context picks it up.
+
+        If given, timings is filled in with prompt_tokens, reused_tokens and
+        prompt_eval_ms before the first text is yielded.
+        """
+        generation = _Generation(prompt, max_tokens, cache_key, timings)
+        self._pending.put(generation)
+        try:
+            while True:
+                item = generation.output.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Lets the context move on if the caller stopped reading early
+            generation.cancelled = True
+
+    def stats(self):
+        with self._lock:
+            active = self.active
+        return {
+            'contexts': self.pool_size,
+            'active_contexts': active,
+            'pending': self._pending.qsize(),
+            'requests_total': self.meter.requests_total,
+            'tokens_total': self.meter.tokens_total,
+            'tokens_per_second': round(self.meter.tokens_per_second(), 2)
+        }
+
+    def _restore_state(self, model, generation, loaded_key):
+        """Load the saved state for the request unless the context already holds it."""
+        if not (self.state_cache and generation.cache_key) or generation.cache_key == loaded_key:
+            return
+        state = self.state_cache.get(generation.cache_key)
+        if state is not None:
+            model.load_state(state)
+
+    def _run(self, model):
+        loaded_key = None
+        while True:
+            generation = self._pending.get()
+            if generation.cancelled:
+                continue
+            with self._lock:
+                self.active += 1
+            started = time.perf_counter()
+            tokens = 0
+            try:
+                self._restore_state(model, generation, loaded_key)
+                prompt_tokens = model.tokenize(generation.prompt.encode('utf-8'))
+                reused = count_reused_tokens(model, prompt_tokens)
+                eval_started = time.perf_counter()
+                # Without a max_tokens the answer may fill the rest of the context
+                max_tokens = generation.max_tokens or max(1, model.n_ctx() - len(prompt_tokens))
+                for chunk in model(generation.prompt, max_tokens=max_tokens, stream=True):
+                    if tokens == 0:
+                        # The first token arrives once the new part of the prompt is evaluated
+                        generation.timings.update({
+                            'prompt_tokens': len(prompt_tokens),
+                            'reused_tokens': reused,
+                            'prompt_eval_ms': round((time.perf_counter() - eval_started) * 1000, 1)
+                        })
+                    if generation.cancelled:
+                        break
+                    tokens += 1
+                    self.meter.record_tokens()
+                    generation.output.put(chunk['choices'][0]['text'])
+                if self.state_cache and generation.cache_key:
+                    self.state_cache.put(generation.cache_key, model.save_state())
+                loaded_key = generation.cache_key
+            except Exception as e:
+                logger.error(f"Llama generation failed: {str(e)}")
+                loaded_key = None
+                generation.output.put(e)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                self.meter.record_request()
+                generation.output.put(_DONE)
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Llama generated {tokens} tokens in {elapsed:.2f} s "
+                f"(queued {started - generation.submitted_at:.2f} s, "
+                f"prompt eval {generation.timings.get('prompt_eval_ms', 0)} ms for "
+                f"{generation.timings.get('prompt_tokens', 0) - generation.timings.get('reused_tokens', 0)} new tokens); "
+                f"server throughput {self.meter.tokens_per_second():.1f} tokens/s"
+            )
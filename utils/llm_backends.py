@@ -0,0 +1,439 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from utils.llama_batching import LlamaBatchScheduler, PrefixStateCache
+from utils.retrieval import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+# Context windows of OpenAI chat models, for configurations without llm.openai.context_window
+OPENAI_CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4': 8192,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+
+def max_tokens_argument(max_tokens):
+    """Keyword arguments capping an OpenAI chat completion; none when the answer is not capped."""
+    return {'max_tokens': max_tokens} if max_tokens else {}
+
+
+class LLMBackend:
+    """Common interface for the language models that answer questions."""
+
+    name = 'base'
+    model_name = None
+    # How many requests the backend may serve at once unless configured otherwise
+    default_concurrency = 1
+
+    def complete(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        """Return the full answer for a prompt.
+
+        cache_key identifies the document and conversation the prompt belongs
+        to, so backends can reuse work from earlier turns; backends may record
+        per-call measurements in the timings dict. max_tokens caps the answer;
+        None leaves it to the backend.
+        """
+        return "".join(self.stream(prompt, cache_key=cache_key, timings=timings, max_tokens=max_tokens))
+
+    def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        """Yield answer text for a prompt as it is generated."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Backend-specific runtime statistics."""
+        return {}
+
+    def status(self):
+        """Whether the backend can answer yet; see LazyBackend."""
+        return {'backend': self.name, 'state': 'ready'}
+
+    def warm_up(self):
+        """Do the work a first request would otherwise pay for, e.g. paging in model weights."""
+
+    def count_tokens(self, text):
+        """Number of tokens text takes in this backend's prompts; a length estimate unless overridden."""
+        return estimate_tokens(text)
+
+
+class OpenAIBackend(LLMBackend):
+    name = 'openai'
+    default_concurrency = 8
+
+    def __init__(self, api_key, model="gpt-3.5-turbo", base_url=None):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.model = model
+        self.model_name = model
+        self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.encoding_for_model(model)
+        except Exception as e:
+            # tiktoken is optional and may need to download its tables
+            logger.info(f"tiktoken unavailable, estimating token counts: {str(e)}")
+        logger.info("OpenAI client initialized")
+
+    def count_tokens(self, text):
+        if self._encoding is None:
+            return estimate_tokens(text)
+        return len(self._encoding.encode(text))
+
+    def _messages(self, prompt):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def complete(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            **max_tokens_argument(max_tokens)
+        )
+        return response.choices[0].message.content
+
+    def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            stream=True,
+            **max_tokens_argument(max_tokens)
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class LlamaBackend(LLMBackend):
+    name = 'llama'
+    default_concurrency = 1
+
+    def __init__(self, model_path, context_size, device, max_tokens=None, pool_size=1, n_threads=None,
+                 prefix_cache_entries=0, prefix_cache_bytes=0, use_mmap=True):
+        from llama_cpp import Llama
+        # Contexts share the memory-mapped weights; split the cores between them
+        n_threads = n_threads or max(1, (os.cpu_count() or 1) // pool_size)
+
+        def load_model():
+            return Llama(
+                model_path=model_path,
+                n_ctx=context_size,
+                n_gpu_layers=0 if device == 'cpu' else -1,
+                n_threads=n_threads,
+                # Mapped weights are page cache shared by every context and worker process
+                use_mmap=use_mmap
+            )
+
+        # A llama_cpp context is not thread-safe, so each one is owned by a scheduler worker
+        state_cache = None
+        if prefix_cache_entries:
+            state_cache = PrefixStateCache(prefix_cache_entries, prefix_cache_bytes)
+        self.scheduler = LlamaBatchScheduler(load_model, pool_size, state_cache=state_cache)
+        # Vocabulary-only model for counting tokens outside the scheduler's contexts
+        self._tokenizer = Llama(model_path=model_path, vocab_only=True, verbose=False)
+        self._tokenizer_lock = threading.Lock()
+        self.default_concurrency = pool_size
+        # Answers without a max_tokens of their own may fill the rest of the context
+        self.max_tokens = max_tokens
+        self.context_window = context_size
+        self.model_name = os.path.basename(model_path)
+        logger.info(f"Llama model initialized with device: {device}, {pool_size} context(s)")
+
+    def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        yield from self.scheduler.generate(prompt, max_tokens or self.max_tokens, cache_key=cache_key,
+                                           timings=timings)
+
+    def warm_up(self):
+        # One token evaluates every layer, so the mapped weights are read in before the first question
+        for _ in self.scheduler.generate("Hello", 1):
+            pass
+
+    def stats(self):
+        return self.scheduler.stats()
+
+    def count_tokens(self, text):
+        with self._tokenizer_lock:
+            return len(self._tokenizer.tokenize(text.encode('utf-8'), add_bos=False))
+
+
+class ModelServerBackend(LLMBackend):
+    """Client of model_server.py, the process that owns the Llama model for every app worker.
+
+    url is http://host:port or unix:/path/to/socket. Prompts go to the
+    server's /v1/completions with their cache_key, so context states are
+    reused across workers as they are within one process.
+    """
+
+    name = 'model_server'
+    default_concurrency = 4
+
+    def __init__(self, url, model_name=None, timeout=300.0, connect_timeout=5.0, max_connections=16,
+                 startup_timeout=300.0):
+        import httpx
+        self._httpx = httpx
+        uds = url[len('unix:'):] if url.startswith('unix:') else None
+        transport = httpx.HTTPTransport(uds=uds, limits=httpx.Limits(max_connections=max_connections))
+        self.client = httpx.Client(base_url='http://model-server' if uds else url, transport=transport,
+                                   timeout=httpx.Timeout(timeout, connect=connect_timeout))
+        self.model_name = model_name
+        self.startup_timeout = startup_timeout
+        logger.info(f"Model server client initialized for {url}")
+
+    def warm_up(self):
+        # The server may still be loading its model; wait until it answers questions
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                if self.client.get('/ready', timeout=5).status_code == 200:
+                    return
+            except self._httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Model server not ready after {self.startup_timeout} s")
+            time.sleep(0.5)
+
+    def complete(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        response = self.client.post('/v1/completions',
+                                    json={'prompt': prompt, 'cache_key': cache_key, 'max_tokens': max_tokens})
+        response.raise_for_status()
+        data = response.json()
+        if timings is not None:
+            timings.update(data.get('timings') or {})
+        return data['choices'][0]['text']
+
+    def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        body = {'prompt': prompt, 'cache_key': cache_key, 'max_tokens': max_tokens, 'stream': True}
+        with self.client.stream('POST', '/v1/completions', json=body) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith('data: '):
+                    continue
+                if line == 'data: [DONE]':
+                    return
+                chunk = json.loads(line[len('data: '):])
+                if timings is not None and 'timings' in chunk:
+                    timings.update(chunk['timings'])
+                if chunk['choices'][0]['text']:
+                    yield chunk['choices'][0]['text']
+
+    def count_tokens(self, text):
+        response = self.client.post('/tokenize', json={'content': text})
+        response.raise_for_status()
+        return response.json()['count']
+
+    def stats(self):
+        try:
+            return dict(self.client.get('/stats', timeout=2).json(), server='model_server')
+        except (self._httpx.HTTPError, ValueError) as e:
+            return {'server': 'model_server', 'error': str(e)}
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic backend for tests and load generation; needs no model or network."""
+
+    name = 'fake'
+    model_name = 'fake'
+    default_concurrency = 4
+
+    def __init__(self, answer=None, token_delay=0.0):
+        self.answer = answer
+        self.token_delay = token_delay
+
+    def _answer_for(self, prompt):
+        if self.answer is not None:
+            return self.answer
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+        return f"Fake answer {digest} for a {len(prompt)} character prompt."
+
+    def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        # A word stands for a token
+        words = self._answer_for(prompt).split(' ')[:max_tokens]
+        for i, word in enumerate(words):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield word if i == 0 else f" {word}"
+
+
+class LazyBackend(LLMBackend):
+    """A backend that is constructed on first use, or in the background by start_warm_up().
+
+    name, model_name and default_concurrency come from the configuration,
+    so the app can set up its queue and caches without importing openai or
+    loading a model. Calls made while the backend loads wait for it.
+    """
+
+    def __init__(self, factory, name, model_name=None, default_concurrency=1):
+        self._factory = factory
+        self.name = name
+        self.model_name = model_name
+        self.default_concurrency = default_concurrency
+        self._backend = None
+        self._state = 'cold'
+        self._error = None
+        self._load_seconds = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The real backend, constructed and warmed up now if needed; raises if that fails."""
+        backend = self._backend
+        if backend is not None:
+            return backend
+        with self._lock:
+            if self._backend is None:
+                self._state = 'loading'
+                started = time.perf_counter()
+                try:
+                    backend = self._factory()
+                    backend.warm_up()
+                except Exception as e:
+                    # The next call tries again, e.g. once the model file is in place
+                    self._state = 'failed'
+                    self._error = str(e)
+                    logger.error(f"Error initializing LLM backend {self.name}: {str(e)}")
+                    raise
+                self._load_seconds = time.perf_counter() - started
+                self._error = None
+                self._state = 'ready'
+                self._backend = backend
+                logger.info(f"LLM backend initialized: {self.name} in {self._load_seconds:.2f} s")
+            return self._backend
+
+    def start_warm_up(self):
+        """Construct the backend on a background thread; returns the thread."""
+        def warm_up():
+            try:
+                self.get()
+            except Exception:
+                pass  # Logged by get() and reported by status()
+
+        thread = threading.Thread(target=warm_up, name=f"{self.name}-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self):
+        return self._backend is not None
+
+    def status(self):
+        status = {'backend': self.name, 'state': self._state}
+        if self._load_seconds is not None:
+            status['load_seconds'] = round(self._load_seconds, 3)
+        if self._error:
+            status['error'] = self._error
+        return status
+
+    def complete(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        return self.get().complete(prompt, cache_key=cache_key, timings=timings, max_tokens=max_tokens)
+
+    def stream(self, prompt, cache_key=None, timings=None, max_tokens=None):
+        return self.get().stream(prompt, cache_key=cache_key, timings=timings, max_tokens=max_tokens)
+
+    def count_tokens(self, text):
+        return self.get().count_tokens(text)
+
+    def stats(self):
+        # Reporting statistics must not trigger loading the model
+        return self._backend.stats() if self._backend is not None else {}
+
+
+def create_backend(llm_config, lazy=False):
+    """Build the backend selected by the llm section of config.yaml.
+
+    With lazy=True a LazyBackend is returned and nothing is imported or
+    loaded until the backend is first used or warmed up.
+    """
+    if lazy:
+        return create_lazy_backend(llm_config)
+    backend = llm_config['backend']
+    if backend == 'openai':
+        return OpenAIBackend(
+            api_key=llm_config['openai']['api_key'],
+            model=llm_config['openai'].get('model', "gpt-3.5-turbo"),
+            base_url=llm_config['openai'].get('base_url')
+        )
+    if backend == 'llama':
+        prefix_cache = llm_config['llama'].get('prefix_cache') or {}
+        return LlamaBackend(
+            model_path=llm_config['llama']['model_path'],
+            context_size=llm_config['llama']['context_size'],
+            device=llm_config['llama']['device'],
+            max_tokens=llm_config['llama'].get('max_tokens'),
+            pool_size=llm_config['llama'].get('pool_size', 1),
+            n_threads=llm_config['llama'].get('n_threads'),
+            prefix_cache_entries=prefix_cache.get('max_entries', 4) if prefix_cache.get('enabled', True) else 0,
+            prefix_cache_bytes=prefix_cache.get('max_bytes', 2 * 1024 ** 3),
+            use_mmap=llm_config['llama'].get('use_mmap', True)
+        )
+    if backend == 'model_server':
+        server_config = llm_config.get('model_server') or {}
+        return ModelServerBackend(
+            url=server_config.get('url', 'http://127.0.0.1:8001'),
+            model_name=model_server_model_name(llm_config),
+            timeout=server_config.get('timeout', 300.0),
+            connect_timeout=server_config.get('connect_timeout', 5.0),
+            max_connections=server_config.get('max_connections', 16),
+            startup_timeout=server_config.get('startup_timeout', 300.0)
+        )
+    if backend == 'fake':
+        fake_config = llm_config.get('fake') or {}
+        return FakeBackend(
+            answer=fake_config.get('answer'),
+            token_delay=fake_config.get('token_delay', 0.0)
+        )
+    raise ValueError(f"Unsupported LLM backend: {backend}")
+
+
+def create_lazy_backend(llm_config):
+    """LazyBackend for the configured backend, described from the configuration alone."""
+    backend = llm_config['backend']
+    if backend == 'openai':
+        model_name = llm_config['openai'].get('model', "gpt-3.5-turbo")
+        default_concurrency = OpenAIBackend.default_concurrency
+    elif backend == 'llama':
+        model_name = os.path.basename(llm_config['llama']['model_path'])
+        default_concurrency = llm_config['llama'].get('pool_size', 1)
+    elif backend == 'model_server':
+        model_name = model_server_model_name(llm_config)
+        default_concurrency = ModelServerBackend.default_concurrency
+    elif backend == 'fake':
+        model_name = FakeBackend.model_name
+        default_concurrency = FakeBackend.default_concurrency
+    else:
+        raise ValueError(f"Unsupported LLM backend: {backend}")
+    return LazyBackend(lambda: create_backend(llm_config), backend, model_name=model_name,
+                       default_concurrency=default_concurrency)
+
+
+def model_server_model_name(llm_config):
+    """The server loads llm.llama.model_path from the same config.yaml, so the name is known here."""
+    model_path = (llm_config.get('llama') or {}).get('model_path')
+    return os.path.basename(model_path) if model_path else 'model_server'
+
+
+def context_window(llm_config):
+    """Tokens the configured model attends to, prompt and answer together, known from the configuration.
+
+    The Llama backends use llm.llama.context_size (the model server loads
+    the same section); OpenAI models use llm.openai.context_window or the
+    window of the model when it is a known one.
+    """
+    backend = llm_config['backend']
+    if backend in ('llama', 'model_server'):
+        return int(llm_config['llama']['context_size'])
+    section = llm_config.get(backend) or {}
+    if section.get('context_window'):
+        return int(section['context_window'])
+    if backend == 'openai':
+        return OPENAI_CONTEXT_WINDOWS.get(section.get('model', "gpt-3.5-turbo"), DEFAULT_CONTEXT_WINDOW)
+    return DEFAULT_CONTEXT_WINDOW
@@ -0,0 +1,99 @@
+import asyncio
+import itertools
+import logging
+import threading
+from collections import deque
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class LogBuffer:
+    """The most recent log lines, each numbered with a sequence number.
+
+    Sequence numbers increase by one per line and are never reused, so a
+    reader that remembers the last number it saw can fetch only the lines
+    added since, and can block in wait() until there are any.
+    """
+
+    def __init__(self, maxlen=1000):
+        self._entries = deque(maxlen=maxlen)
+        self._last_seq = 0
+        self._changed = threading.Condition()
+        # (loop, future) of coroutines suspended in wait_async()
+        self._async_waiters = set()
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def append(self, level, message):
+        with self._changed:
+            self._last_seq += 1
+            self._entries.append({'seq': self._last_seq, 'level': level, 'message': message})
+            self._changed.notify_all()
+            waiters, self._async_waiters = self._async_waiters, set()
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # The loop was closed
+
+    def since(self, seq=0, min_level=logging.NOTSET):
+        """Return (entries newer than seq at or above min_level, oldest first, last_seq).
+
+        Only the new tail of the buffer is copied; lines that already
+        rotated out of the buffer are skipped. Pass last_seq as seq next
+        time to continue where this call ended.
+        """
+        with self._changed:
+            last_seq = self._last_seq
+            count = min(len(self._entries), max(0, last_seq - seq))
+            entries = list(itertools.islice(reversed(self._entries), count))
+        entries.reverse()
+        if min_level > logging.NOTSET:
+            entries = [e for e in entries if logging.getLevelName(e['level']) >= min_level]
+        return entries, last_seq
+
+    def wait(self, seq, timeout=None):
+        """Block until a line newer than seq is added or timeout passes; return whether one was."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._last_seq > seq, timeout)
+
+    async def wait_async(self, seq, timeout=None):
+        """wait() for coroutines: suspends the caller instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        entry = (loop, waiter)
+        with self._changed:
+            if self._last_seq > seq:
+                return True
+            self._async_waiters.add(entry)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._last_seq > seq
+        finally:
+            with self._changed:
+                self._async_waiters.discard(entry)
+
+
+
+class MemoryHandler(logging.Handler):
+    """Logging handler that formats records into a LogBuffer for the web UI."""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+        self.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+        ))
+
+    def emit(self, record):
+        try:
+            self.buffer.append(record.levelname, self.format(record))
+        except Exception:
+            self.handleError(record)
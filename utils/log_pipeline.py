@@ -0,0 +1,104 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# ID of the request being handled on the current thread or task, added to every record
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request ID while still on the request's thread."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request_id and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'location': f"{record.module}:{record.lineno}"
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _Flush:
+    """Queue marker that LogListener answers by setting an event."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LogListener(QueueListener):
+    """QueueListener whose flush() waits until everything queued before it is written."""
+
+    def handle(self, record):
+        if isinstance(record, _Flush):
+            record.done.set()
+        else:
+            super().handle(record)
+
+    def flush(self, timeout=5.0):
+        if self._thread is None:
+            return True
+        marker = _Flush()
+        self.queue.put_nowait(marker)
+        return marker.done.wait(timeout)
+
+
+def start_logging(log_config, extra_handlers=()):
+    """Send all log records through a queue to the log file, stderr and extra_handlers.
+
+    Callers only format the message and enqueue the record; formatting,
+    file writes and rotation happen on the listener thread. Returns the
+    started LogListener, which should be stopped at exit to flush it.
+    """
+    level = logging.getLevelName(str(log_config.get('level', 'INFO')).upper())
+    path = log_config.get('file', os.path.join('logs', 'app.log'))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        path,
+        maxBytes=log_config.get('max_bytes', 10 * 1024 * 1024),
+        backupCount=log_config.get('backup_count', 5),
+        encoding='utf-8',
+        delay=True
+    )
+    text_formatter = logging.Formatter(TEXT_FORMAT)
+    file_handler.setFormatter(JsonFormatter() if log_config.get('format', 'json') == 'json' else text_formatter)
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setFormatter(text_formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = LogListener(log_queue, file_handler, console_handler, *extra_handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,327 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from utils.history import format_turns
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('head', 'tail', 'map_reduce')
+
+WORD_PATTERN = re.compile(r"\S+")
+
+# Cuts are searched for in the first (or last) this many characters per
+# budgeted token, so truncating a large document does not tokenize all of it
+MAX_CHARS_PER_TOKEN = 8
+
+# Chat backends wrap the system prompt and the prompt in messages with role markers
+MESSAGE_OVERHEAD_TOKENS = 8
+
+# map_reduce summarizes the joined section summaries again at most this often
+MAX_REDUCE_ROUNDS = 3
+MIN_SECTION_SUMMARY_TOKENS = 32
+
+SECTION_INSTRUCTIONS = (
+    "Summarize this part of a document in at most {words} words. Keep the facts, names "
+    "and numbers a reader may ask about."
+)
+
+# How the context window is split, in tokens
+Allocation = namedtuple('Allocation', ['context_window', 'completion', 'system', 'template', 'question',
+                                       'history', 'document'])
+
+
+class PromptTooLongError(ValueError):
+    """The question does not fit the tokens reserved for it."""
+
+
+def build_prompt(content, history, question, summary=None):
+    """Lay out the prompt so consecutive turns share the longest possible prefix.
+
+    The document comes first, then the summary of older turns, then the
+    recent turns, then the new question, written exactly as the turn will
+    later appear in the history. A model that keeps its evaluated tokens
+    between turns (llama_cpp) then only has to process the newest question
+    and answer.
+    """
+    earlier = f"Summary of the earlier conversation:\n{summary}\n\n" if summary else ""
+    return f"Context:\n{content}\n\n{earlier}Conversation:\n{format_turns(history)}Q: {question}\nA:"
+
+
+def build_section_prompt(section, max_tokens):
+    words = max(1, max_tokens * 3 // 4)
+    return f"{SECTION_INSTRUCTIONS.format(words=words)}\n\nText:\n{section}\n\nSummary:"
+
+
+def text_key(text):
+    """Cache key of a text; long texts are keyed by a digest so the cache does not keep them alive."""
+    if len(text) <= 256:
+        return text
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class _LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TokenCounter:
+    """count_tokens with an LRU cache of the results.
+
+    The document, the turns of a conversation and the system prompt are
+    counted again for every question; with the cache only new text goes
+    through the tokenizer, which for the model_server backend is an HTTP
+    call. The uncached function stays available as count_tokens, for the
+    one-off pieces truncation probes.
+    """
+
+    def __init__(self, count_tokens, max_entries=4096):
+        self.count_tokens = count_tokens
+        self._cache = _LRUCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, text):
+        key = text_key(text)
+        count = self._cache.get(key)
+        if count is not None:
+            self.hits += 1
+            return count
+        self.misses += 1
+        count = self.count_tokens(text)
+        self._cache.put(key, count)
+        return count
+
+    def stats(self):
+        return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+def truncate_tokens(text, budget, count_tokens, keep='head'):
+    """The longest start (keep='head') or end (keep='tail') of text that fits budget tokens.
+
+    Text is cut between words; the cut is found by binary search, so
+    count_tokens is called about log2(words) times.
+    """
+    if budget <= 0:
+        return ""
+    window = budget * MAX_CHARS_PER_TOKEN
+    if len(text) <= window:
+        if count_tokens(text) <= budget:
+            return text
+        piece = text
+    else:
+        piece = text[:window] if keep == 'head' else text[-window:]
+        if count_tokens(piece) <= budget:
+            piece = text  # Denser text than assumed
+    words = list(WORD_PATTERN.finditer(piece))
+    if keep == 'head':
+        # The last word end whose prefix fits
+        low, high, best = 0, len(words) - 1, ""
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = piece[:words[middle].end()]
+            if count_tokens(candidate) <= budget:
+                best, low = candidate, middle + 1
+            else:
+                high = middle - 1
+        return best
+    # The first word start whose suffix fits
+    low, high, best = 0, len(words) - 1, ""
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = piece[words[middle].start():]
+        if count_tokens(candidate) <= budget:
+            best, high = candidate, middle - 1
+        else:
+            low = middle + 1
+    return best
+
+
+def split_sections(text, section_tokens, count_tokens):
+    """Split text into sections of at most section_tokens, between lines where possible."""
+    sections, lines, used = [], [], 0
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        cost = count_tokens(line)
+        if lines and used + cost > section_tokens:
+            sections.append("\n".join(lines))
+            lines, used = [], 0
+        if cost <= section_tokens:
+            lines.append(line)
+            used += cost
+            continue
+        # A line longer than a section is cut into sections of its own
+        while line:
+            piece = truncate_tokens(line, section_tokens, count_tokens) or line[:section_tokens]
+            sections.append(piece)
+            line = line[len(piece):].strip()
+    if lines:
+        sections.append("\n".join(lines))
+    return sections
+
+
+class PromptBuilder:
+    """Fits the parts of a prompt into the model's context window.
+
+    The window is split from the configuration alone: completion_tokens are
+    reserved for the answer and question_tokens for the question, the
+    history gets history_tokens but at most half of what remains, and the
+    document gets the rest. As the split does not change from one turn to
+    the next, neither does a truncated document, and the prompt prefix a
+    Llama context saved stays valid.
+
+    A document over its budget is shortened by strategy: 'head' keeps its
+    start, 'tail' its end, and 'map_reduce' summarizes it section by section
+    with summarize_fn(prompt, max_tokens), then summarizes the joined
+    summaries again while they are still too long. Section summaries are
+    cached, so later questions about the same document reuse them.
+    """
+
+    def __init__(self, count_tokens, context_window, completion_tokens=512, question_tokens=256,
+                 history_tokens=1000, system_prompt=None, strategy='head', summarize_fn=None,
+                 section_tokens=1000, max_sections=32, cache_entries=4096, summary_cache_entries=1024):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown truncation strategy: {strategy}")
+        available = context_window - completion_tokens - question_tokens
+        if available <= 0:
+            raise ValueError(f"A context window of {context_window} tokens leaves no room for the prompt "
+                             f"after {completion_tokens} completion and {question_tokens} question tokens")
+        self.count_tokens = TokenCounter(count_tokens, cache_entries)
+        self.context_window = context_window
+        self.completion_tokens = completion_tokens
+        self.question_tokens = question_tokens
+        self.history_tokens = min(history_tokens, available // 2)
+        self.system_prompt = system_prompt
+        self.strategy = strategy
+        self.summarize_fn = summarize_fn
+        # A section and its summary must fit one summarizing call
+        self.section_tokens = min(section_tokens, available // 2)
+        self.max_sections = max_sections
+        self._allocation = None
+        self._fitted = _LRUCache(64)
+        self._summaries = _LRUCache(summary_cache_entries)
+
+    def allocation(self):
+        """The split of the context window; computed on first use, as it needs the tokenizer."""
+        if self._allocation is None:
+            system = self.count_tokens(self.system_prompt) + MESSAGE_OVERHEAD_TOKENS if self.system_prompt else 0
+            # The text around the parts, including the summary heading the history budget does not count
+            template = self.count_tokens(build_prompt("", [], "", summary=" "))
+            document = (self.context_window - self.completion_tokens - system - template - self.question_tokens
+                        - self.history_tokens)
+            self._allocation = Allocation(self.context_window, self.completion_tokens, system, template,
+                                          self.question_tokens, self.history_tokens, max(0, document))
+            logger.info(f"Prompt budget: {self._allocation._asdict()}")
+        return self._allocation
+
+    @property
+    def document_tokens(self):
+        return self.allocation().document
+
+    def fit_document(self, content, budget=None, strategy=None):
+        """Return (content shortened to budget tokens, the strategy used or None if it fit).
+
+        budget defaults to the document allocation and strategy to the
+        configured one.
+        """
+        budget = self.document_tokens if budget is None else budget
+        strategy = strategy or self.strategy
+        if self.count_tokens(content) <= budget:
+            return content, None
+        key = (text_key(content), budget, strategy)
+        fitted = self._fitted.get(key)
+        if fitted is None:
+            if strategy == 'map_reduce':
+                try:
+                    fitted = self._map_reduce(content, budget)
+                except Exception as e:
+                    logger.warning(f"Could not summarize document, keeping its start instead: {str(e)}")
+                    strategy = 'head'
+            if strategy != 'map_reduce':
+                fitted = truncate_tokens(content, budget, self.count_tokens.count_tokens, keep=strategy)
+            self._fitted.put(key, fitted)
+            logger.info(f"Document of {self.count_tokens(content)} tokens shortened to {budget} ({strategy})")
+        return fitted, strategy
+
+    def _map_reduce(self, content, budget):
+        if self.summarize_fn is None:
+            raise ValueError("map_reduce needs a summarize function")
+        count = self.count_tokens.count_tokens
+        limit = self.section_tokens * self.max_sections
+        text = truncate_tokens(content, limit, count)
+        if len(text) < len(content):
+            logger.warning(f"Document exceeds {self.max_sections} sections; only its first {limit} tokens "
+                           f"are summarized")
+        for _ in range(MAX_REDUCE_ROUNDS):
+            sections = split_sections(text, self.section_tokens, count)
+            per_section = max(MIN_SECTION_SUMMARY_TOKENS, budget // max(1, len(sections)))
+            text = "\n\n".join(self._summarize_section(section, per_section) for section in sections)
+            if count(text) <= budget:
+                return text
+        return truncate_tokens(text, budget, count)
+
+    def _summarize_section(self, section, max_tokens):
+        key = (text_key(section), max_tokens)
+        summary = self._summaries.get(key)
+        if summary is None:
+            summary = self.summarize_fn(build_section_prompt(section, max_tokens), max_tokens).strip()
+            # Models do not always keep to the length they were asked for
+            summary = truncate_tokens(summary, max_tokens, self.count_tokens.count_tokens)
+            self._summaries.put(key, summary)
+        return summary
+
+    def build(self, content, history, question, summary=None, strategy=None):
+        """Return (prompt, stats) for a question about content, within the context window.
+
+        content over the document allocation is shortened with strategy, the
+        configured one by default. Raises PromptTooLongError if the question
+        is longer than its reservation. If the whole prompt still comes out
+        over the window,
+        e.g. because tokens merge differently where the parts meet, the end
+        of the document is cut by the excess.
+        """
+        allocation = self.allocation()
+        question_tokens = self.count_tokens(question)
+        if question_tokens > allocation.question:
+            raise PromptTooLongError(f"Question has {question_tokens} tokens, at most {allocation.question} "
+                                     f"are allowed")
+        document, truncation = self.fit_document(content, strategy=strategy)
+        limit = allocation.context_window - allocation.completion - allocation.system
+        prompt = build_prompt(document, history, question, summary)
+        tokens = self.count_tokens.count_tokens(prompt)
+        while tokens > limit and document:
+            excess = tokens - limit
+            document = truncate_tokens(document, self.count_tokens(document) - excess, self.count_tokens.count_tokens)
+            truncation = truncation or 'head'
+            prompt = build_prompt(document, history, question, summary)
+            tokens = self.count_tokens.count_tokens(prompt)
+        if tokens > limit:
+            raise PromptTooLongError(f"Prompt has {tokens} tokens without the document, the window allows {limit}")
+        return prompt, {
+            'tokens': tokens,
+            'document_tokens': self.count_tokens(document),
+            'max_tokens': allocation.completion,
+            'truncation': truncation
+        }
@@ -0,0 +1,146 @@
+import logging
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+
+from utils.segments import Segment
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\S+")
+TERM_PATTERN = re.compile(r"\w+")
+
+# source is where the chunk's first word came from, e.g. 'page 3'
+Chunk = namedtuple('Chunk', ['index', 'start', 'end', 'text', 'source'], defaults=(None,))
+
+
+def tokenize(text):
+    """Split text into lowercase index terms."""
+    return TERM_PATTERN.findall(text.lower())
+
+
+def estimate_tokens(text):
+    """Cheap LLM token estimate (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def chunk_segments(segments, chunk_size=200, overlap=40):
+    """Yield chunks of chunk_size words, overlapping by overlap words, from a segment stream.
+
+    Only the current window of words is held in memory, so extraction,
+    chunking and indexing can run in one pass over a large document. Chunk
+    offsets refer to the joined document text, so neighbouring selections
+    can be merged back into one passage.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("chunk overlap must be smaller than chunk size")
+    step = chunk_size - overlap
+    window = []  # (start, end, word, source) in document offsets
+    index = 0
+    for segment in segments:
+        for match in WORD_PATTERN.finditer(segment.text):
+            window.append((segment.offset + match.start(), segment.offset + match.end(), match.group(), segment.source))
+            if len(window) == chunk_size:
+                yield Chunk(index, window[0][0], window[-1][1], " ".join(w[2] for w in window), window[0][3])
+                index += 1
+                window = window[step:]
+    # The tail is only a new chunk if it holds words the last chunk did not
+    if window and (index == 0 or len(window) > overlap):
+        yield Chunk(index, window[0][0], window[-1][1], " ".join(w[2] for w in window), window[0][3])
+
+
+def chunk_text(text, chunk_size=200, overlap=40):
+    """Split text into chunks of chunk_size words, overlapping by overlap words."""
+    return list(chunk_segments([Segment('text', text, 0, None)], chunk_size, overlap))
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of document chunks."""
+
+    def __init__(self, text, chunk_size=200, overlap=40, k1=1.5, b=0.75):
+        self.text = text
+        self.k1 = k1
+        self.b = b
+        self.chunks = chunk_text(text, chunk_size, overlap)
+        self.postings = defaultdict(list)
+        self.chunk_lengths = []
+        for chunk in self.chunks:
+            terms = Counter(tokenize(chunk.text))
+            self.chunk_lengths.append(sum(terms.values()))
+            for term, freq in terms.items():
+                self.postings[term].append((chunk.index, freq))
+        self.avg_length = (sum(self.chunk_lengths) / len(self.chunks)) if self.chunks else 0.0
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.chunks) - df + 0.5) / (df + 0.5))
+
+    def search(self, query, top_k=5):
+        """Return up to top_k (score, chunk) pairs, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for chunk_index, freq in postings:
+                norm = 1 - self.b + self.b * self.chunk_lengths[chunk_index] / self.avg_length
+                scores[chunk_index] += idf * freq * (self.k1 + 1) / (freq + self.k1 * norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(score, self.chunks[chunk_index]) for chunk_index, score in ranked]
+
+    def build_context(self, query, top_k=5, budget_tokens=1500):
+        """Pack the best matching chunks into at most budget_tokens of context.
+
+        Chunks are taken in score order while they fit, then emitted in
+        document order with overlapping neighbours merged into one passage.
+        """
+        selected = []
+        used = 0
+        for _, chunk in self.search(query, top_k):
+            cost = estimate_tokens(chunk.text)
+            if used + cost > budget_tokens:
+                continue
+            selected.append(chunk)
+            used += cost
+        if not selected:
+            # Nothing matched the question; fall back to the start of the document
+            selected = list(self.chunks[:1])
+
+        passages = []
+        for chunk in sorted(selected, key=lambda c: c.start):
+            if passages and chunk.start <= passages[-1][1]:
+                passages[-1][1] = max(passages[-1][1], chunk.end)
+            else:
+                passages.append([chunk.start, chunk.end])
+        return "\n...\n".join(self.text[start:end] for start, end in passages)
+
+
+class IndexCache:
+    """Size-bounded LRU of BM25 indexes keyed by extraction cache key."""
+
+    def __init__(self, max_entries=32, chunk_size=200, overlap=40):
+        self.max_entries = max_entries
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_index(self, key, text):
+        """Return the index for key, building it from text on a miss."""
+        with self._lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+        index = BM25Index(text, self.chunk_size, self.overlap)
+        logger.info(f"Built retrieval index with {len(index.chunks)} chunks for {key}")
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
@@ -0,0 +1,113 @@
+import io
+import queue
+import threading
+from collections import namedtuple
+
+# One unit of extracted text. kind is e.g. 'page', 'paragraph', 'table_row',
+# 'sheet' or 'sheet_row'; offset is where the segment starts in the joined
+# document text and source says where it came from (e.g. 'page 3').
+Segment = namedtuple('Segment', ['kind', 'text', 'offset', 'source'])
+
+
+def make_segments(items):
+    """Turn (kind, text, source) tuples into Segments with running offsets."""
+    offset = 0
+    for kind, text, source in items:
+        yield Segment(kind, text, offset, source)
+        offset += len(text) + 1
+
+
+def join_segments(segments):
+    """Join segments into the document text, one newline after each."""
+    buffer = io.StringIO()
+    for segment in segments:
+        buffer.write(segment.text)
+        buffer.write("\n")
+    return buffer.getvalue()
+
+
+def recording(segments, buffer):
+    """Pass segments through, writing the document text to buffer as join_segments would."""
+    for segment in segments:
+        buffer.write(segment.text)
+        buffer.write("\n")
+        yield segment
+
+
+class SegmentStreamError(RuntimeError):
+    """The segment stream a fan_out consumer was reading failed."""
+
+
+_END = object()
+_FAILED = object()
+
+
+def fan_out(segments, consumers, max_buffered=64):
+    """Feed one pass over segments to every consumer(iterator) at once; returns their results.
+
+    Each consumer but the last runs on its own thread and reads from a
+    queue holding at most max_buffered segments, so the stream is read
+    once and never held whole. If the stream fails, the consumers' reads
+    raise SegmentStreamError and the stream's exception is re-raised;
+    otherwise the first consumer exception is.
+    """
+    if len(consumers) == 1:
+        return [consumers[0](segments)]
+    queues = [queue.Queue(max_buffered) for _ in consumers[:-1]]
+    results = [None] * len(consumers)
+    errors = [None] * len(consumers)
+
+    def read(q, ended):
+        while True:
+            item = q.get()
+            if item is _END or item is _FAILED:
+                ended.set()
+                if item is _FAILED:
+                    raise SegmentStreamError("The segment stream failed")
+                return
+            yield item
+
+    def run(i, q):
+        ended = threading.Event()
+        try:
+            results[i] = consumers[i](read(q, ended))
+        except BaseException as e:
+            errors[i] = e
+        finally:
+            # A consumer that stopped early must not block the stream
+            while not ended.is_set():
+                if q.get() in (_END, _FAILED):
+                    break
+
+    threads = [threading.Thread(target=run, args=(i, q), name=f"segments-{i}", daemon=True)
+               for i, q in enumerate(queues)]
+    for thread in threads:
+        thread.start()
+
+    def source():
+        for segment in segments:
+            for q in queues:
+                q.put(segment)
+            yield segment
+
+    end = _FAILED
+    try:
+        try:
+            results[-1] = consumers[-1](source())
+        except BaseException as e:
+            errors[-1] = e
+        else:
+            # The last consumer may stop before the end; the others still get the rest
+            for segment in segments:
+                for q in queues:
+                    q.put(segment)
+        end = _END if errors[-1] is None else _FAILED
+    finally:
+        for q in queues:
+            q.put(end)
+        for thread in threads:
+            thread.join()
+    for error in errors[-1:] + errors[:-1]:
+        if error is not None:
+            raise error
+    return results
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id):
+    """Session IDs name directories under data/, so only our own format is accepted."""
+    return bool(session_id) and SESSION_ID_PATTERN.match(session_id) is not None
+
+
+def empty_session():
+    return {'conversation_history': [], 'current_file': None, 'summary': None}
+
+
+def add_turn(state, question, answer, current_file, max_turns, max_chars):
+    return dict(state, current_file=current_file, conversation_history=trim_history(
+        state['conversation_history'] + [(question, answer)], max_turns, max_chars
+    ))
+
+
+def fold_into_summary(state, summary, covered_turns):
+    """Replace the leading turns a new summary covers by the summary itself.
+
+    Turns recorded while the summary was being written stay in the history.
+    """
+    history = list(state['conversation_history'])
+    covered = set(covered_turns)
+    while history and history[0] in covered:
+        history.pop(0)
+    return dict(state, summary=summary, conversation_history=history)
+
+
+def trim_history(history, max_turns, max_chars):
+    """Drop the oldest turns until the history fits max_turns and max_chars."""
+    history = list(history)[-max_turns:] if max_turns else list(history)
+    total = sum(len(q) + len(a) for q, a in history)
+    while history and max_chars and total > max_chars:
+        q, a = history.pop(0)
+        total -= len(q) + len(a)
+    return history
+
+
+class MemorySessionStore:
+    """Per-session state in process memory, with LRU and idle-TTL eviction.
+
+    Each session holds its conversation history, capped at max_turns turns
+    and max_chars characters, a rolling summary of the turns folded out of
+    the history, and the file it is asking about. on_evict is called with
+    the ID of every session that is evicted or expires, so its files can be
+    removed too.
+    """
+
+    def __init__(self, max_sessions=1000, ttl=86400, max_turns=50, max_chars=100_000, on_evict=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()  # id -> (state, last_access)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return a copy of a session's state, starting a new session if needed."""
+        state = self._update(session_id, lambda state: state)
+        return dict(state, conversation_history=list(state['conversation_history']))
+
+    def _update(self, session_id, change):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            expired = entry is not None and entry[1] < now - self.ttl
+            state = entry[0] if entry is not None and not expired else empty_session()
+            state = change(state)
+            self._sessions[session_id] = (state, now)
+            self._sessions.move_to_end(session_id)
+            # An expired session that is used again starts over, so its files go like an evicted one's
+            evicted = ([session_id] if expired else []) + self._evict(now)
+        self._notify(evicted)
+        return state
+
+    def record_turn(self, session_id, question, answer, current_file):
+        """Append a turn and set the current file in one step."""
+        self._update(session_id, lambda state: add_turn(
+            state, question, answer, current_file, self.max_turns, self.max_chars
+        ))
+
+    def apply_summary(self, session_id, summary, covered_turns):
+        """Store a new rolling summary and drop the turns it covers from the history."""
+        self._update(session_id, lambda state: fold_into_summary(state, summary, covered_turns))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'sessions': len(self._sessions)}
+
+    def _evict(self, now):
+        evicted = []
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and last_access >= now - self.ttl:
+                break
+            del self._sessions[session_id]
+            evicted.append(session_id)
+        return evicted
+
+    def _notify(self, evicted):
+        for session_id in evicted:
+            logger.info(f"Session {session_id} evicted")
+            if self.on_evict:
+                self.on_evict(session_id)
+
+
+class SQLiteSessionStore(MemorySessionStore):
+    """Session state in an SQLite file, shared by every worker process on the host.
+
+    Updates run in IMMEDIATE transactions, so concurrent turns from several
+    processes are serialized by SQLite's write lock.
+    """
+
+    def __init__(self, db_path, max_sessions=1000, ttl=86400, max_turns=50, max_chars=100_000, on_evict=None):
+        super().__init__(max_sessions, ttl, max_turns, max_chars, on_evict)
+        self.db_path = db_path
+        # One connection per thread, reused across calls
+        self._local = threading.local()
+        self._create_schema()
+
+    def _create_schema(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(id TEXT PRIMARY KEY, state TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    def _connection(self):
+        """This thread's connection, opened again if the database file was removed or replaced."""
+        try:
+            inode = os.stat(self.db_path).st_ino
+        except FileNotFoundError:
+            self._create_schema()
+            inode = os.stat(self.db_path).st_ino
+        local = self._local
+        if getattr(local, 'inode', None) != inode:
+            if getattr(local, 'conn', None) is not None:
+                local.conn.close()
+            local.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            local.inode = inode
+        return local.conn
+
+    def _update(self, session_id, change):
+        """Apply change(state) -> state to a session in one transaction and evict stale sessions."""
+        now = time.time()
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT state, last_access FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            expired = row is not None and row[1] < now - self.ttl
+            state = dict(empty_session(), **json.loads(row[0])) if row is not None and not expired else empty_session()
+            state['conversation_history'] = [tuple(turn) for turn in state['conversation_history']]
+            state = change(state)
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, last_access) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), now)
+            )
+            evicted = [r[0] for r in conn.execute(
+                "SELECT id FROM sessions WHERE last_access < ? UNION "
+                "SELECT id FROM (SELECT id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (now - self.ttl, self.max_sessions)
+            )]
+            conn.executemany("DELETE FROM sessions WHERE id = ?", [(i,) for i in evicted])
+            conn.execute("COMMIT")
+            if expired:
+                evicted.insert(0, session_id)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._notify(evicted)
+        return state
+
+    def get(self, session_id):
+        return self._update(session_id, lambda state: state)
+
+    def delete(self, session_id):
+        self._connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def stats(self):
+        count = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {'backend': 'sqlite', 'sessions': count}
+
+
+def create_session_store(session_config, on_evict=None):
+    """Create the session store selected by session.backend ('memory' or 'sqlite')."""
+    backend = session_config.get('backend', 'memory')
+    options = {
+        'max_sessions': session_config.get('max_sessions', 1000),
+        'ttl': session_config.get('ttl', 86400),
+        'max_turns': session_config.get('max_turns', 50),
+        'max_chars': session_config.get('max_chars', 100_000),
+        'on_evict': on_evict
+    }
+    if backend == 'memory':
+        return MemorySessionStore(**options)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(session_config.get('path', os.path.join('data', '.sessions.sqlite3')), **options)
+    raise ValueError(f"Unsupported session backend: {backend}")
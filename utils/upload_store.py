@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from utils.extraction_cache import HASH_BLOCK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class UploadNotFoundError(Exception):
+    """The upload ID is unknown, expired or belongs to another session."""
+
+
+class UploadOffsetError(Exception):
+    """A chunk was sent for an offset other than the end of what is stored."""
+
+    def __init__(self, expected):
+        super().__init__(f"Chunk must start at offset {expected}")
+        self.expected = expected
+
+
+class UploadIntegrityError(Exception):
+    """A committed upload does not match its declared size or SHA-256."""
+
+
+class UploadStore:
+    """Chunked, resumable uploads stored by content hash.
+
+    An upload is started with init(), receives its bytes with append() in
+    order, and becomes a file with commit(). Chunks are streamed straight to
+    a partial file while a rolling SHA-256 is updated, so nothing is
+    buffered in memory and the digest is known the moment the last chunk
+    lands. A client that lost its connection asks status() for the offset
+    to resume from; partial files survive restarts.
+
+    Committed content lives once under blob_dir, named by its digest. A
+    second upload of the same bytes is detected at commit and only adds
+    another hard link to the existing blob.
+    """
+
+    def __init__(self, upload_dir, blob_dir, ttl=86400):
+        self.upload_dir = upload_dir
+        self.blob_dir = blob_dir
+        self.ttl = ttl
+        self._hashers = {}  # upload_id -> (offset, sha256 object) of the partial file
+        self._locks = {}
+        self._lock = threading.Lock()
+        # Held while blobs are created, linked or collected, so a blob is never removed mid-commit
+        self._blob_lock = threading.Lock()
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.upload_dir, f"{upload_id}.json")
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.upload_dir, f"{upload_id}.part")
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _read_meta(self, upload_id, session_id):
+        if not upload_id.isalnum():
+            raise UploadNotFoundError(upload_id)
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFoundError(upload_id) from None
+        if meta['session_id'] != session_id:
+            raise UploadNotFoundError(upload_id)
+        return meta
+
+    def init(self, session_id, file_name, size=None):
+        """Start an upload; returns its status with the new upload_id."""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        meta = {'upload_id': upload_id, 'session_id': session_id, 'file_name': file_name, 'size': size,
+                'created_at': time.time()}
+        open(self._part_path(upload_id), 'wb').close()
+        with open(self._meta_path(upload_id), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return self.status(upload_id, session_id)
+
+    def status(self, upload_id, session_id):
+        """The upload's file name, declared size and the offset the next chunk must start at."""
+        meta = self._read_meta(upload_id, session_id)
+        return {'upload_id': upload_id, 'file_name': meta['file_name'], 'size': meta['size'],
+                'offset': os.path.getsize(self._part_path(upload_id))}
+
+    def append(self, upload_id, session_id, offset, stream):
+        """Write the bytes read from stream at offset; returns the new status.
+
+        offset must equal the bytes stored so far, so a retried chunk that
+        already arrived is rejected with UploadOffsetError instead of being
+        written twice.
+        """
+        meta = self._read_meta(upload_id, session_id)
+        with self._upload_lock(upload_id):
+            part_path = self._part_path(upload_id)
+            stored, digest = self._hasher(upload_id, part_path)
+            if offset != stored:
+                raise UploadOffsetError(stored)
+            try:
+                with open(part_path, 'ab') as f:
+                    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+                        if meta['size'] is not None and stored + len(block) > meta['size']:
+                            raise UploadIntegrityError(f"Upload is larger than its declared {meta['size']} bytes")
+                        f.write(block)
+                        digest.update(block)
+                        stored += len(block)
+            finally:
+                # Whatever arrived before a dropped connection stays, and the client resumes after it
+                with self._lock:
+                    self._hashers[upload_id] = (stored, digest)
+        os.utime(self._meta_path(upload_id))
+        return {'upload_id': upload_id, 'file_name': meta['file_name'], 'size': meta['size'], 'offset': stored}
+
+    def _hasher(self, upload_id, part_path):
+        """The rolling digest of the partial file, rebuilt from disk after a restart or failed write."""
+        size = os.path.getsize(part_path)
+        with self._lock:
+            known = self._hashers.get(upload_id)
+        if known is not None and known[0] == size:
+            return size, known[1]
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return size, digest
+
+    def commit(self, upload_id, session_id, directory, sha256=None):
+        """Finish an upload and link it into directory under its file name.
+
+        Returns (file path, digest, whether the content was already stored).
+        """
+        meta = self._read_meta(upload_id, session_id)
+        with self._upload_lock(upload_id), self._blob_lock:
+            part_path = self._part_path(upload_id)
+            stored, digest = self._hasher(upload_id, part_path)
+            if meta['size'] is not None and stored != meta['size']:
+                raise UploadIntegrityError(f"Received {stored} of {meta['size']} bytes")
+            digest = digest.hexdigest()
+            if sha256 and sha256.lower() != digest:
+                raise UploadIntegrityError(f"SHA-256 mismatch: received content hashes to {digest}")
+            blob_path = self.blob_path(digest)
+            duplicate = os.path.exists(blob_path)
+            if duplicate:
+                os.remove(part_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(part_path, blob_path)
+            os.makedirs(directory, exist_ok=True)
+            file_path = os.path.join(directory, meta['file_name'])
+            self._link(blob_path, file_path)
+            self._discard(upload_id)
+        logger.info(f"Upload {upload_id} committed as {digest[:12]}{' (duplicate)' if duplicate else ''}")
+        return file_path, digest, duplicate
+
+    def save(self, session_id, file_name, stream, directory):
+        """Store a whole file read from stream in one go, e.g. a classic multipart upload."""
+        upload_id = self.init(session_id, file_name)['upload_id']
+        try:
+            self.append(upload_id, session_id, 0, stream)
+        except Exception:
+            self.abort(upload_id, session_id)
+            raise
+        return self.commit(upload_id, session_id, directory)
+
+    def abort(self, upload_id, session_id):
+        self._read_meta(upload_id, session_id)
+        with self._upload_lock(upload_id):
+            self._remove_part(upload_id)
+            self._discard(upload_id)
+
+    def _remove_part(self, upload_id):
+        try:
+            os.remove(self._part_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def _discard(self, upload_id):
+        try:
+            os.remove(self._meta_path(upload_id))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+
+    def _link(self, blob_path, file_path):
+        """Make file_path name the blob's content, replacing whatever file_path was."""
+        # Dot files are not listed as uploads while the link is being made
+        directory, name = os.path.split(file_path)
+        tmp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            # Filesystems without hard links get a copy
+            shutil.copyfile(blob_path, tmp_path)
+        os.replace(tmp_path, file_path)
+
+    def release(self, digest):
+        """Remove the blob of digest if no uploaded file links to it any more; returns whether it was removed.
+
+        Checks the one blob a replaced file pointed to, where collect_garbage()
+        would stat every blob.
+        """
+        path = self.blob_path(digest)
+        with self._blob_lock:
+            try:
+                if os.stat(path).st_nlink > 1:
+                    return False
+                os.remove(path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def collect_garbage(self):
+        """Remove blobs no uploaded file links to any more and uploads idle for longer than ttl.
+
+        Returns the digests of the removed blobs.
+        """
+        with self._blob_lock:
+            removed = self._remove_unlinked_blobs()
+        if os.path.isdir(self.upload_dir):
+            expired_before = time.time() - self.ttl
+            for name in os.listdir(self.upload_dir):
+                path = os.path.join(self.upload_dir, name)
+                if name.endswith('.json') and os.path.getmtime(path) < expired_before:
+                    upload_id = name[:-len('.json')]
+                    with self._upload_lock(upload_id):
+                        self._remove_part(upload_id)
+                        self._discard(upload_id)
+        return removed
+
+    def _remove_unlinked_blobs(self):
+        removed = []
+        if not os.path.isdir(self.blob_dir):
+            return removed
+        for prefix in os.listdir(self.blob_dir):
+            directory = os.path.join(self.blob_dir, prefix)
+            for digest in os.listdir(directory):
+                path = os.path.join(directory, digest)
+                if os.stat(path).st_nlink <= 1:
+                    os.remove(path)
+                    removed.append(digest)
+        return removed
@@ -0,0 +1,382 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from array import array
+
+import numpy as np
+
+from utils.retrieval import chunk_segments
+
+logger = logging.getLogger(__name__)
+
+EMBED_TERM_PATTERN = re.compile(r"\w+")
+
+# Rows scored per dot product; bounds the float32 copy made of int8/float16 blocks
+SEARCH_BLOCK_ROWS = 16384
+
+
+class HashingEmbedder:
+    """Dependency-free embedder: signed feature hashing of words and word bigrams.
+
+    It only matches shared vocabulary, so it is a fallback for machines
+    without an embedding model rather than a semantic model.
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _features(self, text):
+        words = EMBED_TERM_PATTERN.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            # crc32 rather than hash() so vectors stay valid across processes
+            hashes = np.array([zlib.crc32(f.encode('utf-8')) for f in self._features(text)], dtype=np.uint64)
+            if hashes.size:
+                signs = np.where(hashes & 1, 1.0, -1.0).astype(np.float32)
+                np.add.at(vectors[row], (hashes >> 1) % self.dim, signs)
+        return normalize(vectors)
+
+
+class LlamaEmbedder:
+    """Embeddings from a local GGUF model loaded with llama_cpp in embedding mode."""
+
+    name = 'llama'
+
+    def __init__(self, model_path, context_size=512, n_threads=None):
+        from llama_cpp import Llama
+        self.model = Llama(model_path=model_path, embedding=True, n_ctx=context_size,
+                           n_threads=n_threads, verbose=False)
+        self.dim = self.model.n_embd()
+        # Ingestion workers and request threads share the context, which is not thread-safe
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        with self._lock:
+            vectors = self.model.embed(list(texts))
+        return normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def create_embedder(vector_config, llm_config=None):
+    """Create the embedder named by retrieval.vector.embedder."""
+    kind = vector_config.get('embedder', 'hashing')
+    if kind == 'hashing':
+        return HashingEmbedder(vector_config.get('dim', 512))
+    if kind == 'llama':
+        llama_config = (llm_config or {}).get('llama', {})
+        return LlamaEmbedder(
+            vector_config.get('model_path') or llama_config['model_path'],
+            context_size=vector_config.get('context_size', 512),
+            n_threads=vector_config.get('n_threads')
+        )
+    raise ValueError(f"Unsupported embedder: {kind}")
+
+
+def quantize(vectors, dtype):
+    """Convert float32 unit vectors to the stored dtype; int8 rows get a scale each."""
+    if dtype == 'float16':
+        return vectors.astype(np.float16), None
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class VectorIndex:
+    """Dense chunk vectors per document, memory-mapped from disk.
+
+    Each document is a shard: an .npy matrix of float16 (or int8 plus
+    per-row scales) unit vectors, and a JSON-lines file with the source and
+    text of every row whose byte offsets are memory-mapped too, so neither
+    vectors nor texts are held in memory. A manifest maps file names to
+    content keys, so unchanged files survive restarts.
+
+    Shards keep a session's search to its own documents. The manifest and
+    the memory maps of the shards are kept open between queries, so a query
+    opens no files; the manifest is only read again when another process
+    has replaced it. Shard files are written under a temporary name and
+    renamed, so an open map never sees a file being rewritten.
+    """
+
+    def __init__(self, index_dir, embedder, dtype='float16', chunk_size=200, overlap=40, batch_size=256):
+        if dtype not in ('float16', 'int8'):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.index_dir = index_dir
+        self.embedder = embedder
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        # (file identity, manifest); the manifest is never changed in place, writers replace it
+        self._manifest = (None, {})
+        self._shards = {}  # shard -> (vectors, scales, offsets, records) memory maps
+
+    def _manifest_path(self):
+        return os.path.join(self.index_dir, 'manifest.json')
+
+    def _read_manifest(self):
+        """The manifest, read from disk only when the file was replaced since the last read.
+
+        Called with self._lock held, as it updates the cached manifest and maps.
+        """
+        try:
+            stat = os.stat(self._manifest_path())
+        except FileNotFoundError:
+            self._manifest = (None, {})
+            return {}
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        cached_identity, manifest = self._manifest
+        if identity != cached_identity:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self._manifest = (identity, manifest)
+            # Drop the maps of shards that another process removed
+            live = {entry['shard'] for entry in manifest.values()}
+            for shard in [shard for shard in self._shards if shard not in live]:
+                self._shards.pop(shard, None)
+        return manifest
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+        stat = os.stat(self._manifest_path())
+        self._manifest = ((stat.st_ino, stat.st_mtime_ns), manifest)
+
+    def _open_shard(self, shard, dtype):
+        """Memory maps of a shard's vectors, int8 scales (or None), record offsets and records, opened once.
+
+        Called with self._lock held. The maps stay readable after the shard's
+        files are removed or replaced, so a query keeps the shard it started with.
+        """
+        maps = self._shards.get(shard)
+        if maps is None:
+            with open(self._shard_path(shard, '.jsonl'), 'rb') as f:
+                records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            maps = (
+                np.load(self._shard_path(shard, '.vectors.npy'), mmap_mode='r'),
+                np.load(self._shard_path(shard, '.scales.npy'), mmap_mode='r') if dtype == 'int8' else None,
+                np.load(self._shard_path(shard, '.offsets.npy'), mmap_mode='r'),
+                records
+            )
+            self._shards[shard] = maps
+        return maps
+
+    def _snapshot(self, prefix):
+        """[(name, maps)] of the non-empty documents whose name starts with prefix.
+
+        Taken under the lock, so writers cannot change the manifest or the
+        maps while it is built; a shard removed before it could be opened is
+        left out.
+        """
+        snapshot = []
+        with self._lock:
+            for name, entry in self._read_manifest().items():
+                if entry['rows'] == 0 or not name.startswith(prefix):
+                    continue
+                try:
+                    snapshot.append((name, self._open_shard(entry['shard'], entry['dtype'])))
+                except FileNotFoundError:
+                    logger.warning(f"Shard of {name} was removed during the query, skipping it")
+        return snapshot
+
+    def _shard_path(self, shard, suffix):
+        return os.path.join(self.index_dir, f"{shard}{suffix}")
+
+    def has_document(self, name, content_key):
+        with self._lock:
+            entry = self._read_manifest().get(name)
+        return entry is not None and entry['content_key'] == content_key
+
+    def document_names(self, prefix=''):
+        with self._lock:
+            return sorted(name for name in self._read_manifest() if name.startswith(prefix))
+
+    def add_document(self, name, content_key, segments):
+        """Embed a document's chunks in batches and store them as its shard."""
+        def batches():
+            batch = []
+            for chunk in chunk_segments(segments, self.chunk_size, self.overlap):
+                batch.append((chunk.source, chunk.text))
+                if len(batch) == self.batch_size:
+                    yield self.embedder.embed([text for _, text in batch]), batch
+                    batch = []
+            if batch:
+                yield self.embedder.embed([text for _, text in batch]), batch
+        return self.add_vectors(name, content_key, batches())
+
+    def add_vectors(self, name, content_key, batches):
+        """Store a shard from (vectors, [(source, text), ...]) batches of unit vectors."""
+        started = time.perf_counter()
+        shard = hashlib.sha256(f"{name}\0{content_key}".encode('utf-8')).hexdigest()[:24]
+        os.makedirs(self.index_dir, exist_ok=True)
+        dtype = np.int8 if self.dtype == 'int8' else np.float16
+        dim = getattr(self.embedder, 'dim', 0)
+        offsets, scales = array('q'), array('f')
+        raw_path = self._shard_path(shard, '.vectors.tmp')
+        records_path = self._shard_path(shard, '.jsonl.tmp')
+        # Batches go to a raw file first so the build never holds the whole matrix
+        with open(records_path, 'wb') as records_file, open(raw_path, 'wb') as raw_file:
+            for vectors, records in batches:
+                stored, row_scales = quantize(np.asarray(vectors, dtype=np.float32), self.dtype)
+                dim = stored.shape[1]
+                raw_file.write(stored.tobytes())
+                if row_scales is not None:
+                    scales.extend(row_scales)
+                for source, text in records:
+                    offsets.append(records_file.tell())
+                    records_file.write(json.dumps([source, text]).encode('utf-8') + b"\n")
+        # Prepend the .npy header now that the shape is known, copying the rows through a buffer
+        with open(self._shard_path(shard, '.vectors.npy.tmp'), 'wb') as f, open(raw_path, 'rb') as raw_file:
+            np.lib.format.write_array_header_1_0(f, {
+                'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                'fortran_order': False,
+                'shape': (len(offsets), dim)
+            })
+            shutil.copyfileobj(raw_file, f, 1024 * 1024)
+        os.remove(raw_path)
+        save_array(self._shard_path(shard, '.offsets.npy'), np.frombuffer(offsets, dtype=np.int64))
+        if self.dtype == 'int8':
+            save_array(self._shard_path(shard, '.scales.npy'), np.frombuffer(scales, dtype=np.float32))
+        # Records and vectors last, so a complete shard replaces one that is mapped for searching
+        os.replace(records_path, self._shard_path(shard, '.jsonl'))
+        os.replace(self._shard_path(shard, '.vectors.npy.tmp'), self._shard_path(shard, '.vectors.npy'))
+
+        with self._lock:
+            self._shards.pop(shard, None)
+            manifest = dict(self._read_manifest())
+            old = manifest.get(name)
+            manifest[name] = {'content_key': content_key, 'shard': shard, 'rows': len(offsets), 'dtype': self.dtype}
+            self._write_manifest(manifest)
+            if old is not None and old['shard'] != shard:
+                self._delete_shard(old['shard'])
+        logger.info(f"Embedded {len(offsets)} chunks of {name} in {time.perf_counter() - started:.2f} s")
+        return len(offsets)
+
+    def copy_document(self, name, content_key):
+        """Give name the shard of a document that has the same content, hard-linking its files.
+
+        Returns False, changing nothing, if no such document is indexed.
+        """
+        with self._lock:
+            manifest = dict(self._read_manifest())
+            source = next((entry for other, entry in manifest.items()
+                           if other != name and entry['content_key'] == content_key), None)
+            if source is None:
+                return False
+            shard = hashlib.sha256(f"{name}\0{content_key}".encode('utf-8')).hexdigest()[:24]
+            for suffix in ('.vectors.npy', '.scales.npy', '.offsets.npy', '.jsonl'):
+                if os.path.exists(self._shard_path(source['shard'], suffix)):
+                    link_or_copy(self._shard_path(source['shard'], suffix), self._shard_path(shard, suffix))
+            self._shards.pop(shard, None)
+            old = manifest.get(name)
+            manifest[name] = dict(source, shard=shard)
+            self._write_manifest(manifest)
+            if old is not None and old['shard'] != shard:
+                self._delete_shard(old['shard'])
+        logger.info(f"Copied {source['rows']} vectors into {name} from a document with the same content")
+        return True
+
+    def remove_document(self, name):
+        with self._lock:
+            manifest = dict(self._read_manifest())
+            entry = manifest.pop(name, None)
+            if entry is None:
+                return
+            self._write_manifest(manifest)
+            self._delete_shard(entry['shard'])
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.index_dir, ignore_errors=True)
+            self._manifest = (None, {})
+            self._shards.clear()
+        logger.info("Vector index cleared")
+
+    def search(self, question, top_k=5, prefix=''):
+        """Return the top_k chunks by cosine similarity as dicts with file, source, text and score.
+
+        Only documents whose name starts with prefix are searched.
+        """
+        query = self.embedder.embed([question])[0].astype(np.float32)
+        candidates = []  # (score, name, maps, row)
+        for name, maps in self._snapshot(prefix):
+            vectors, scales, _, _ = maps
+            for start in range(0, vectors.shape[0], SEARCH_BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                scores = block @ query
+                if scales is not None:
+                    scores *= scales[start:start + SEARCH_BLOCK_ROWS]
+                best = np.argpartition(-scores, min(top_k, len(scores)) - 1)[:top_k]
+                candidates.extend((float(scores[i]), name, maps, start + int(i)) for i in best)
+        candidates.sort(key=lambda c: -c[0])
+        return [self._result(score, name, maps, row) for score, name, maps, row in candidates[:top_k]]
+
+    def _result(self, score, name, maps, row):
+        _, _, offsets, records = maps
+        start = int(offsets[row])
+        end = records.find(b"\n", start)
+        source, text = json.loads(records[start:end if end != -1 else len(records)])
+        return {'file': name, 'source': source, 'text': text, 'score': round(score, 4)}
+
+    def _delete_shard(self, shard):
+        self._shards.pop(shard, None)
+        for suffix in ('.vectors.npy', '.vectors.npy.tmp', '.vectors.tmp', '.scales.npy', '.offsets.npy', '.jsonl',
+                       '.jsonl.tmp'):
+            try:
+                os.remove(self._shard_path(shard, suffix))
+            except FileNotFoundError:
+                pass
+
+
+def save_array(path, values):
+    """np.save under a temporary name, then renamed over path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp_path, path)
+
+
+def link_or_copy(source, destination):
+    """Hard-link source to destination (replacing it), or copy where hard links are not supported."""
+    tmp_path = f"{destination}.tmp"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def fuse_rankings(rankings, top_k, k=60):
+    """Merge ranked passage lists with reciprocal rank fusion.
+
+    Passages are matched by file, source and text; the fused score of each
+    is the sum of 1 / (k + rank) over the lists it appears in.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, passage in enumerate(ranking, start=1):
+            key = (passage['file'], passage['source'], passage['text'])
+            entry = fused.setdefault(key, dict(passage, score=0.0))
+            entry['score'] += 1.0 / (k + rank)
+    results = sorted(fused.values(), key=lambda p: -p['score'])[:top_k]
+    for passage in results:
+        passage['score'] = round(passage['score'], 6)
+    return results
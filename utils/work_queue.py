@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a request cannot be admitted to a work queue."""
+
+
+class BoundedWorkQueue:
+    """Admission control in front of a backend.
+
+    At most max_concurrency requests run at once; up to max_queue_depth more
+    wait in line (in arrival order) for at most timeout seconds. Anything
+    beyond that is rejected immediately with QueueFullError so callers can
+    answer 503 instead of piling up threads.
+    """
+
+    def __init__(self, name, max_concurrency=1, max_queue_depth=16, timeout=30.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.timeout = timeout
+        self._slots = threading.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def acquire(self):
+        """Wait for a slot; raise QueueFullError if the queue is full or the wait times out."""
+        self._enter_queue()
+        started = time.perf_counter()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        waited = time.perf_counter() - started
+        self._leave_queue(acquired, waited)
+        return waited
+
+    def _enter_queue(self):
+        with self._lock:
+            if self.active + self.waiting >= self.max_concurrency + self.max_queue_depth:
+                self.rejected += 1
+                logger.warning(f"{self.name} queue full ({self.waiting} waiting), rejecting request")
+                raise QueueFullError(f"{self.name} queue is full")
+            self.waiting += 1
+
+    def _leave_queue(self, acquired, waited):
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.rejected += 1
+                logger.warning(f"{self.name} queue wait timed out after {waited:.1f} s")
+                raise QueueFullError(f"Timed out waiting for {self.name} backend")
+            self.active += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def release(self):
+        """Give back a slot taken with acquire()."""
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+        self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of a with block; yields the seconds spent waiting."""
+        waited = self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            admitted = self.completed + self.active
+            return {
+                'backend': self.name,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'max_concurrency': self.max_concurrency,
+                'max_queue_depth': self.max_queue_depth,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_ms_avg': round(self.wait_seconds_total / admitted * 1000, 2) if admitted else 0.0,
+                'wait_ms_max': round(self.wait_seconds_max * 1000, 2)
+            }
+
+
+class AsyncBoundedWorkQueue(BoundedWorkQueue):
+    """BoundedWorkQueue for coroutines; waiting requests do not hold a thread."""
+
+    def __init__(self, name, max_concurrency=1, max_queue_depth=16, timeout=30.0):
+        super().__init__(name, max_concurrency, max_queue_depth, timeout)
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self):
+        """Wait for a slot; raise QueueFullError if the queue is full or the wait times out."""
+        self._enter_queue()
+        started = time.perf_counter()
+        acquired = False
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+            acquired = True
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while waiting
+            with self._lock:
+                self.waiting -= 1
+            raise
+        waited = time.perf_counter() - started
+        self._leave_queue(acquired, waited)
+        return waited
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of an async with block; yields the seconds spent waiting."""
+        waited = await self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()